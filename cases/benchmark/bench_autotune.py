@@ -0,0 +1,58 @@
+'''
+比较'auto'卷积的经验规则和自动调优(mytorch.autotune)选择的算法及其耗时(前向+反向)
+调优结果只保存在进程内，不写入缓存文件
+
+用法：
+    python cases/benchmark/bench_autotune.py [--number 3] [--batch-size 8]
+'''
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import mytorch.functions as F
+from mytorch import autotune
+from mytorch.tensor import Tensor
+
+# (名字, 输入通道, 输出通道, 卷积核, 输入大小, stride, padding)
+LAYERS = [
+    ('alexnet conv1', 3, 64, 11, 224, 4, 2),
+    ('alexnet conv3', 192, 384, 3, 13, 1, 1),
+    ('alexnet conv4', 384, 256, 3, 13, 1, 1),
+    ('fire4 expand3x3', 32, 128, 3, 27, 1, 1),
+    ('large 11x11', 32, 32, 11, 32, 1, 5),
+    ('large 7x7', 16, 32, 7, 56, 1, 3),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=8)
+    args = parser.parse_args()
+    autotune.set_cache_path(None)
+
+    print(f"{'layer':<16} {'heuristic':>9} {'(ms)':>8} {'autotune':>9} {'(ms)':>8} {'speedup':>8}")
+    for name, cin, cout, kernel, size, stride, padding in LAYERS:
+        x = Tensor(np.random.randn(args.batch_size, cin, size, size).astype(np.float32), requires_grad=True)
+        w = Tensor(np.random.randn(cout, cin, kernel, kernel).astype(np.float32), requires_grad=True)
+        row = []
+        for enabled in (False, True):
+            autotune.enable(enabled)
+            y = F.conv2d(x, w, stride=stride, padding=padding)
+            algorithm = y.creator.saved_tensors[4]
+
+            def step():
+                F.conv2d(x, w, stride=stride, padding=padding).sum().backward()
+
+            row.append((algorithm, min(timeit.repeat(step, number=args.number, repeat=3)) / args.number * 1e3))
+        (h, th), (a, ta) = row
+        print(f"{name:<16} {h:>9} {th:>8.2f} {a:>9} {ta:>8.2f} {th / ta:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+'''
+比较训练模式下BatchNorm2d的两种实现(前向+反向)：
+    ops: 用Tensor运算组合出的归一化，计算图中有十几个节点
+    fused: F.batch_norm2d，一个Function，反向传播使用闭式解
+层的配置来自MobileNetV1的BatchNorm
+
+用法：
+    python cases/benchmark/bench_batch_norm.py [--number 3] [--batch-size 8]
+'''
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import mytorch.functions as F
+from mytorch.tensor import Tensor
+
+# (名字, 通道数, 输入大小)
+LAYERS = [
+    ('bn 32@112', 32, 112),
+    ('bn 128@56', 128, 56),
+    ('bn 512@14', 512, 14),
+    ('bn 1024@7', 1024, 7),
+]
+
+
+def batch_norm_ops(x, weight, bias, eps=1e-5):
+    mean = x.mean(axis=(0, 2, 3), keepdims=True)
+    centered = x - mean
+    var = (centered * centered).mean(axis=(0, 2, 3), keepdims=True)
+    x_normalized = centered / (var + eps).sqrt()
+    return weight.reshape(1, -1, 1, 1) * x_normalized + bias.reshape(1, -1, 1, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'layer':<12} {'ops(ms)':>9} {'fused(ms)':>10} {'speedup':>8}")
+    for name, channels, size in LAYERS:
+        x = Tensor(np.random.randn(args.batch_size, channels, size, size).astype(np.float32), requires_grad=True)
+        weight = Tensor(np.ones(channels, dtype=np.float32), requires_grad=True)
+        bias = Tensor(np.zeros(channels, dtype=np.float32), requires_grad=True)
+        running_mean = Tensor(np.zeros(channels, dtype=np.float32))
+        running_var = Tensor(np.ones(channels, dtype=np.float32))
+
+        def ops():
+            batch_norm_ops(x, weight, bias).sum().backward()
+
+        def fused():
+            F.batch_norm2d(x, weight, bias, running_mean, running_var).sum().backward()
+
+        times = [min(timeit.repeat(fn, number=args.number, repeat=3)) / args.number * 1e3 for fn in (ops, fused)]
+        print(f"{name:<12} {times[0]:>9.2f} {times[1]:>10.2f} {times[0] / times[1]:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
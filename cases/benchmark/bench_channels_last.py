@@ -0,0 +1,63 @@
+'''
+比较同一个网络使用NCHW输入和channels last(按NHWC存储)输入时，一次训练迭代(前向+反向)的耗时
+网络由 3x3卷积-BatchNorm-ReLU-最大池化 的块和1x1卷积组成，channels last时所有层的输出都保持NHWC布局
+
+用法：
+    python cases/benchmark/bench_channels_last.py [--number 3] [--batch-size 32]
+'''
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import mytorch.functions as F
+import mytorch.module as nn
+from mytorch.tensor import Tensor
+
+# (名字, 输入通道, 输入大小, 每个块的输出通道)
+NETWORKS = [
+    ('cifar 32x32', 3, 32, (32, 64, 128)),
+    ('narrow 64x64', 16, 64, (16, 32, 64)),
+    ('wide 16x16', 64, 16, (128, 256)),
+]
+
+
+class Block(nn.Module):
+    def __init__(self, cin, cout):
+        super().__init__()
+        self.conv = nn.Conv2D(cin, cout, (3, 3), padding=1)
+        self.bn = nn.BatchNorm2d(cout)
+        self.pointwise = nn.Conv2D(cout, cout, (1, 1))
+        self.pool = nn.MaxPooling2D(2, 2, 2)
+
+    def forward(self, x):
+        x = F.relu(self.bn(self.conv(x)))
+        return self.pool(F.relu(self.pointwise(x)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=32)
+    args = parser.parse_args()
+
+    print(f"{'network':<14} {'NCHW(ms)':>9} {'NHWC(ms)':>9} {'speedup':>8}")
+    for name, cin, size, widths in NETWORKS:
+        model = nn.Sequential(*[Block(a, b) for a, b in zip((cin,) + widths, widths)])
+        x = Tensor(np.random.randn(args.batch_size, cin, size, size).astype(np.float32))
+        times = []
+        for convert in (lambda t: t, F.to_channels_last):
+            def step():
+                model.zero_grad(set_to_none=True)
+                model(convert(x)).sum().backward()
+
+            times.append(min(timeit.repeat(step, number=args.number, repeat=3)) / args.number * 1e3)
+        print(f"{name:<14} {times[0]:>9.2f} {times[1]:>9.2f} {times[0] / times[1]:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
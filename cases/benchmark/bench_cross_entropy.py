@@ -0,0 +1,48 @@
+'''
+比较交叉熵的两种实现(前向+反向)：
+    composite: nll_loss(log_softmax(x))，两个节点，反向传播时分配稠密的零矩阵再经过log_softmax的反向传播
+    fused: F.cross_entropy，一个节点，反向传播一次算出 softmax - onehot
+类别数从分类任务到语言模型的词表大小
+
+用法：
+    python cases/benchmark/bench_cross_entropy.py [--number 3] [--batch-size 256]
+'''
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import mytorch.functions as F
+from mytorch.tensor import Tensor
+
+CLASSES = [10, 1000, 10000, 50000]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=256)
+    args = parser.parse_args()
+
+    print(f"{'classes':>8} {'composite(ms)':>14} {'fused(ms)':>10} {'speedup':>8}")
+    for classes in CLASSES:
+        x = Tensor(np.random.randn(args.batch_size, classes).astype(np.float32), requires_grad=True)
+        t = Tensor(np.random.randint(0, classes, (args.batch_size,)))
+
+        def composite():
+            F.nll_loss(F.log_softmax(x), t).backward()
+
+        def fused():
+            F.cross_entropy(x, t).backward()
+
+        times = [min(timeit.repeat(fn, number=args.number, repeat=3)) / args.number * 1e3
+                 for fn in (composite, fused)]
+        print(f"{classes:>8} {times[0]:>14.2f} {times[1]:>10.2f} {times[0] / times[1]:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
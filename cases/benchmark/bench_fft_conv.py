@@ -0,0 +1,63 @@
+'''
+比较大卷积核使用gemm和分块FFT卷积的耗时和峰值内存(前向+反向)，以及'auto'的选择
+层的配置来自AlexNet的conv1(11x11, stride 4，FFT通过多相分解变成stride 1的卷积)，以及几个stride为1的大卷积核
+
+用法：
+    python cases/benchmark/bench_fft_conv.py [--number 3] [--batch-size 8]
+'''
+import argparse
+import os
+import sys
+import timeit
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import mytorch.functions as F
+from mytorch.tensor import Tensor
+
+# (名字, 输入通道, 输出通道, 输入大小, 卷积核, stride, padding)
+LAYERS = [
+    ('alexnet conv1', 3, 96, 227, 11, 4, 0),
+    ('7x7 64@56', 64, 64, 56, 7, 1, 3),
+    ('7x7 16->32@56', 16, 32, 56, 7, 1, 3),
+    ('11x11 32@28', 32, 32, 28, 11, 1, 5),
+    ('15x15 16@64', 16, 16, 64, 15, 1, 7),
+    ('7x7 256@14', 256, 256, 14, 7, 1, 3),
+]
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'layer':<15} {'gemm(ms)':>9} {'fft(ms)':>9} {'speedup':>8} {'gemm(MB)':>9} {'fft(MB)':>9} {'auto':>6}")
+    for name, cin, cout, size, k, stride, pad in LAYERS:
+        x = Tensor(np.random.randn(args.batch_size, cin, size, size).astype(np.float32), requires_grad=True)
+        w = Tensor(np.random.randn(cout, cin, k, k).astype(np.float32), requires_grad=True)
+        results = []
+        for algorithm in ('gemm', 'fft'):
+            def step():
+                F.conv2d(x, w, stride=stride, padding=pad, algorithm=algorithm).sum().backward()
+
+            t = min(timeit.repeat(step, number=args.number, repeat=3)) / args.number * 1e3
+            results.append((t, peak_memory(step)))
+        (t0, m0), (t1, m1) = results
+        auto = F.Conv2d(stride, pad)._select(w.shape)
+        print(f"{name:<15} {t0:>9.2f} {t1:>9.2f} {t0 / t1:>7.2f}x {m0:>9.1f} {m1:>9.1f} {auto:>6}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+'''
+比较MobileNetV1在评估模式下融合 Conv + BatchNorm + ReLU 前后的推理耗时，并检查两者的输出一致
+
+用法：
+    python cases/benchmark/bench_fuse.py [--number 3] [--batch-size 8] [--size 112] [--width 0.5]
+'''
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from mytorch.fuse import fuse_modules
+from mytorch.models.mobilenet import MobileNetV1
+from mytorch.tensor import Tensor, no_grad
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--size', type=int, default=112)
+    parser.add_argument('--width', type=float, default=0.5)
+    args = parser.parse_args()
+
+    model = MobileNetV1(num_classes=1000, width_multiplier=args.width).eval()
+    x = Tensor(np.random.randn(args.batch_size, 3, args.size, args.size).astype(np.float32))
+    fused = fuse_modules(model, example_inputs=x)
+
+    times = []
+    for m in (model, fused):
+        def forward():
+            with no_grad():
+                m(x)
+
+        times.append(min(timeit.repeat(forward, number=args.number, repeat=3)) / args.number * 1e3)
+    print(f"{'unfused(ms)':>12} {'fused(ms)':>10} {'speedup':>8}")
+    print(f"{times[0]:>12.2f} {times[1]:>10.2f} {times[0] / times[1]:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
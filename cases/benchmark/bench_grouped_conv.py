@@ -0,0 +1,77 @@
+'''
+比较分组卷积的两种实现(前向+反向)：
+    loop: 逐组切片，每组单独im2col和矩阵乘法
+    batched: F.conv2d，普通分组卷积的所有组在一次einsum中完成，depthwise卷积逐个卷积核位置做广播乘加
+层的配置来自MobileNetV1的depthwise卷积(groups等于通道数)，以及一个groups=4的普通分组卷积
+
+用法：
+    python cases/benchmark/bench_grouped_conv.py [--number 3] [--batch-size 8]
+'''
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import mytorch.functions as F
+from mytorch.conv import im2col, col2im
+from mytorch.tensor import Tensor
+
+# (名字, 通道数, 输入大小, stride, groups)
+LAYERS = [
+    ('dw 32@112', 32, 112, 1, 32),
+    ('dw 128@56', 128, 56, 1, 128),
+    ('dw 512@14', 512, 14, 1, 512),
+    ('dw 1024@7', 1024, 7, 1, 1024),
+    ('g4 256@14', 256, 14, 1, 4),
+]
+
+
+def conv_loop(x, w, stride, groups):
+    '''逐组计算前向和反向传播'''
+    N, C, H, W = x.shape
+    FN, FC, fh, fw = w.shape
+    fn = FN // groups
+    outs, gws, gxs = [], [], []
+    for g in range(groups):
+        x_g = x[:, g * FC:(g + 1) * FC]
+        w_g = w[g * fn:(g + 1) * fn].reshape(fn, -1)
+        col = im2col(x_g, fh, fw, stride, 1, np)
+        out = col @ w_g.T
+        dout = np.ones_like(out)
+        outs.append(out)
+        gws.append(dout.T @ col)
+        gxs.append(col2im(dout @ w_g, x_g.shape, fh, fw, stride, 1, np))
+    return np.concatenate(outs, axis=1), np.concatenate(gws), np.concatenate(gxs, axis=1)
+
+
+def conv_batched(x, w, stride, groups):
+    tx = Tensor(x, requires_grad=True)
+    tw = Tensor(w, requires_grad=True)
+    y = F.conv2d(tx, tw, stride=stride, padding=1, groups=groups)
+    y.backward(np.ones(y.shape, dtype=y.dtype))
+    return y, tw.grad, tx.grad
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'layer':<12} {'loop(ms)':>10} {'batched(ms)':>12} {'speedup':>8}")
+    for name, channels, size, stride, groups in LAYERS:
+        x = np.random.randn(args.batch_size, channels, size, size).astype(np.float32)
+        w = np.random.randn(channels, channels // groups, 3, 3).astype(np.float32)
+        times = []
+        for impl in (conv_loop, conv_batched):
+            t = timeit.repeat(lambda: impl(x, w, stride, groups), number=args.number, repeat=3)
+            times.append(min(t) / args.number * 1e3)
+        print(f"{name:<12} {times[0]:>10.2f} {times[1]:>12.2f} {times[0] / times[1]:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
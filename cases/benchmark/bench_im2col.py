@@ -0,0 +1,97 @@
+'''
+比较两种卷积实现的耗时和峰值内存(前向+反向)：
+    im2col: 先分配6维缓冲区逐个卷积核位置填充，再转置复制成列矩阵，和权重做矩阵乘法
+    strided: 输入的滑动窗口视图直接和权重做einsum(F.conv2d)
+层的配置来自AlexNet: conv1(11x11, stride 4)和conv3~conv5(3x3)
+
+用法：
+    python cases/benchmark/bench_im2col.py [--number 3] [--batch-size 8]
+'''
+import argparse
+import os
+import sys
+import timeit
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import mytorch.functions as F
+from mytorch.conv import col2im
+from mytorch.tensor import Tensor
+
+# (名字, 输入通道, 输出通道, 输入大小, 卷积核, stride, padding)
+LAYERS = [
+    ('conv1 11x11/4', 3, 96, 227, 11, 4, 0),
+    ('conv3 3x3', 256, 384, 13, 3, 1, 1),
+    ('conv4 3x3', 384, 384, 13, 3, 1, 1),
+    ('conv5 3x3', 384, 256, 13, 3, 1, 1),
+]
+
+
+def im2col_loop(x, fh, fw, stride, pad):
+    '''原来的im2col实现'''
+    N, C, H, W = x.shape
+    out_h = (H + 2 * pad - fh) // stride + 1
+    out_w = (W + 2 * pad - fw) // stride + 1
+    img = np.pad(x, [(0, 0), (0, 0), (pad, pad), (pad, pad)], mode='constant')
+    col = np.zeros((N, C, fh, fw, out_h, out_w), dtype=x.dtype)
+    for y in range(fh):
+        y_max = y + stride * out_h
+        for i in range(fw):
+            x_max = i + stride * out_w
+            col[:, :, y, i, :, :] = img[:, :, y:y_max:stride, i:x_max:stride]
+    return col.transpose(0, 4, 5, 1, 2, 3).reshape(N * out_h * out_w, -1)
+
+
+def conv_im2col(x, w, stride, pad):
+    N = x.shape[0]
+    FN, _, fh, fw = w.shape
+    col = im2col_loop(x, fh, fw, stride, pad)
+    out = col @ w.reshape(FN, -1).T
+    dout = np.ones_like(out)
+    gw = dout.T @ col
+    gx = col2im(dout @ w.reshape(FN, -1), x.shape, fh, fw, stride, pad, np)
+    return out.reshape(N, -1, FN), gw, gx
+
+
+def conv_strided(x, w, stride, pad):
+    tx = Tensor(x, requires_grad=True)
+    tw = Tensor(w, requires_grad=True)
+    y = F.conv2d(tx, tw, stride=stride, padding=pad)
+    y.backward(np.ones(y.shape, dtype=y.dtype))
+    return y, tw.grad, tx.grad
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'layer':<15} {'im2col(ms)':>11} {'strided(ms)':>12} {'speedup':>8} {'im2col(MB)':>11} {'strided(MB)':>12}")
+    for name, cin, cout, size, k, stride, pad in LAYERS:
+        x = np.random.randn(args.batch_size, cin, size, size).astype(np.float32)
+        w = np.random.randn(cout, cin, k, k).astype(np.float32)
+        results = []
+        for impl in (conv_im2col, conv_strided):
+            def step():
+                impl(x, w, stride, pad)
+
+            t = min(timeit.repeat(step, number=args.number, repeat=3)) / args.number * 1e3
+            results.append((t, peak_memory(step)))
+        (t0, m0), (t1, m1) = results
+        print(f"{name:<15} {t0:>11.2f} {t1:>12.2f} {t0 / t1:>7.2f}x {m0:>11.1f} {m1:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+'''
+卷积按batch分段并行(mytorch.set_num_threads)的线程扩展性，前向+反向，使用gemm算法
+层的配置来自LeNet和AlexNet，加速比相对于1个线程。安装threadpoolctl时，分段计算中BLAS只用一个线程
+
+用法：
+    python cases/benchmark/bench_intra_op_threads.py [--number 3] [--batch-size 16] [--threads 1,2,4]
+'''
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import mytorch
+import mytorch.functions as F
+from mytorch.tensor import Tensor
+
+# (名字, 输入通道, 输出通道, 卷积核, 输入大小, stride, padding)
+LAYERS = [
+    ('lenet conv1', 1, 6, 5, 28, 1, 2),
+    ('lenet conv2', 6, 16, 5, 14, 1, 0),
+    ('alexnet conv1', 3, 64, 11, 224, 4, 2),
+    ('alexnet conv2', 64, 192, 5, 27, 1, 2),
+    ('alexnet conv3', 192, 384, 3, 13, 1, 1),
+    ('alexnet conv5', 256, 256, 3, 13, 1, 1),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--threads', type=str, default='1,2,4')
+    args = parser.parse_args()
+    threads = [int(t) for t in args.threads.split(',')]
+
+    print(f"cpus: {os.cpu_count()}")
+    print(f"{'layer':<14}" + ''.join(f" {f'{t} thr(ms)':>11} {'speedup':>8}" for t in threads))
+    for name, cin, cout, kernel, size, stride, padding in LAYERS:
+        x = Tensor(np.random.randn(args.batch_size, cin, size, size).astype(np.float32), requires_grad=True)
+        w = Tensor(np.random.randn(cout, cin, kernel, kernel).astype(np.float32), requires_grad=True)
+
+        def step():
+            F.conv2d(x, w, stride=stride, padding=padding, algorithm='gemm').sum().backward()
+
+        row = f"{name:<14}"
+        base = None
+        for t in threads:
+            mytorch.set_num_threads(t)
+            ms = min(timeit.repeat(step, number=args.number, repeat=3)) / args.number * 1e3
+            base = base or ms
+            row += f" {ms:>11.2f} {base / ms:>7.2f}x"
+        print(row)
+    mytorch.set_num_threads(1)
+
+
+if __name__ == '__main__':
+    main()
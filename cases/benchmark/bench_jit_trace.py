@@ -0,0 +1,75 @@
+'''
+比较普通执行和jit.trace回放的单步耗时(前向+反向、推理)
+
+用法：
+    python cases/benchmark/bench_jit_trace.py [--number 200] [--batch-size 64]
+'''
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import mytorch.functions as F
+import mytorch.module as nn
+from mytorch import jit
+from mytorch.tensor import Tensor, no_grad
+
+
+class MLP(nn.Module):
+    '''小尺寸的全连接网络，Python分发开销占比较大'''
+
+    def __init__(self):
+        super(MLP, self).__init__()
+        self.bn = nn.BatchNorm2d(4)
+        self.fc1 = nn.Linear(4 * 7 * 7, 128)
+        self.fc2 = nn.Linear(128, 64)
+        self.fc3 = nn.Linear(64, 10)
+
+    def forward(self, x):
+        x = F.relu(self.bn(x))
+        x = x.view(x.shape[0], -1)
+        x = F.relu(self.fc1(x))
+        x = F.relu(self.fc2(x))
+        return F.log_softmax(self.fc3(x))
+
+
+def bench(stmt, number):
+    # 取多次重复中的最小值，减少噪声，单位为毫秒
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=64)
+    args = parser.parse_args()
+
+    x = Tensor(np.random.randn(args.batch_size, 4, 7, 7).astype(np.float32))
+    model = MLP()
+    traced = jit.trace(model, x)
+
+    def step(m):
+        def run():
+            m.zero_grad(set_to_none=True)
+            m(x).sum().backward()
+        return run
+
+    def infer(m):
+        def run():
+            with no_grad():
+                m(x)
+        return run
+
+    print(f"{'mode':>10} {'eager(ms)':>10} {'traced(ms)':>11} {'speedup':>8}")
+    for name, make in (('train', step), ('inference', infer)):
+        t_eager = bench(make(model), args.number)
+        t_traced = bench(make(traced), args.number)
+        print(f"{name:>10} {t_eager:>10.3f} {t_traced:>11.3f} {t_eager / t_traced:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+'''
+测量每个算子的分发开销：MyTorch算子调用耗时 - 对应的NumPy调用耗时
+
+用法：
+    python cases/benchmark/bench_op_overhead.py [--number 20000]
+'''
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import mytorch.functions as F
+from mytorch.tensor import Tensor, no_grad
+
+
+def bench(stmt, number):
+    # 取多次重复中的最小值，减少噪声，单位为微秒
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=20000)
+    args = parser.parse_args()
+
+    # Linear-784-10 在 MNIST 上的典型小张量形状
+    x = np.random.randn(64, 10).astype(np.float32)
+    y = np.random.randn(64, 10).astype(np.float32)
+    w = np.random.randn(10, 10).astype(np.float32)
+
+    tx = Tensor(x, requires_grad=True)
+    ty = Tensor(y, requires_grad=True)
+    tw = Tensor(w, requires_grad=True)
+
+    cases = [
+        ('add', lambda: tx + ty, lambda: np.add(x, y)),
+        ('mul', lambda: tx * ty, lambda: np.multiply(x, y)),
+        ('matmul', lambda: tx @ tw, lambda: x @ w),
+        ('relu', lambda: F.relu(tx), lambda: np.maximum(x, 0)),
+    ]
+
+    print(f"{'op':>8} {'numpy(us)':>10} {'grad(us)':>10} {'no_grad(us)':>12} {'overhead(us)':>13}")
+    for name, op, ref in cases:
+        t_ref = bench(ref, args.number)
+        t_grad = bench(op, args.number)
+        with no_grad():
+            t_no_grad = bench(op, args.number)
+        print(f"{name:>8} {t_ref:>10.2f} {t_grad:>10.2f} {t_no_grad:>12.2f} {t_grad - t_ref:>13.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+'''
+比较串行反向传播和线程池并行反向传播的耗时，网络是多个并行分支再拼接的结构(类似SqueezeNet的Fire模块)
+
+用法：
+    python cases/benchmark/bench_parallel_backward.py [--number 20] [--branches 4] [--width 1024]
+'''
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import mytorch.functions as F
+import mytorch.module as nn
+from mytorch.tensor import Tensor, parallel_backward
+
+
+class Branchy(nn.Module):
+    def __init__(self, branches, width):
+        super(Branchy, self).__init__()
+        self.squeeze = nn.Linear(width, width)
+        self.branches = nn.ModuleList([nn.Linear(width, width) for _ in range(branches)])
+
+    def forward(self, x):
+        x = F.relu(self.squeeze(x))
+        return F.cat([F.relu(branch(x)) for branch in self.branches], axis=1).sum()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=20)
+    parser.add_argument('--branches', type=int, default=4)
+    parser.add_argument('--width', type=int, default=1024)
+    parser.add_argument('--batch-size', type=int, default=256)
+    args = parser.parse_args()
+
+    model = Branchy(args.branches, args.width)
+    x = Tensor(np.random.randn(args.batch_size, args.width).astype(np.float32))
+
+    def step():
+        model.zero_grad(set_to_none=True)
+        model(x).backward()
+
+    print(f"{'workers':>8} {'step(ms)':>10} {'speedup':>8}")
+    base = None
+    for workers in (0, 2, 4, 8):
+        with parallel_backward(workers):
+            t = min(timeit.repeat(step, number=args.number, repeat=3)) / args.number * 1e3
+        base = base or t
+        print(f"{workers:>8} {t:>10.2f} {base / t:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
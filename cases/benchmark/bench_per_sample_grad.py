@@ -0,0 +1,59 @@
+'''
+比较逐样本梯度的两种计算方式：每个样本调用一次backward，和backward(per_sample=True)一次得到所有样本的梯度
+
+用法：
+    python cases/benchmark/bench_per_sample_grad.py [--number 5] [--batch-size 64]
+'''
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import mytorch.functions as F
+import mytorch.module as nn
+from mytorch.tensor import Tensor
+
+
+class MLP(nn.Module):
+    def __init__(self):
+        super(MLP, self).__init__()
+        self.fc1 = nn.Linear(784, 128)
+        self.fc2 = nn.Linear(128, 64)
+        self.fc3 = nn.Linear(64, 10)
+
+    def forward(self, x):
+        x = F.relu(self.fc1(x))
+        x = F.relu(self.fc2(x))
+        return F.log_softmax(self.fc3(x))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=64)
+    args = parser.parse_args()
+
+    model = MLP()
+    x = np.random.randn(args.batch_size, 784).astype(np.float32)
+    target = np.random.randint(0, 10, size=args.batch_size)
+
+    def loop():
+        for b in range(args.batch_size):
+            model.zero_grad(set_to_none=True)
+            F.nll_loss(model(Tensor(x[b:b + 1])), Tensor(target[b:b + 1]), reduction='sum').backward()
+
+    def vectorized():
+        model.zero_grad(set_to_none=True)
+        F.nll_loss(model(Tensor(x)), Tensor(target), reduction='sum').backward(per_sample=True)
+
+    t_loop = min(timeit.repeat(loop, number=args.number, repeat=3)) / args.number * 1e3
+    t_vec = min(timeit.repeat(vectorized, number=args.number, repeat=3)) / args.number * 1e3
+    print(f"batch {args.batch_size}: loop {t_loop:.2f} ms, per_sample {t_vec:.2f} ms, speedup {t_loop / t_vec:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
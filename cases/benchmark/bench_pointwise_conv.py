@@ -0,0 +1,79 @@
+'''
+比较SqueezeNet 1.1中1x1卷积的两种实现(前向+反向)：
+    im2col: 填充、6维缓冲区和转置得到列矩阵，再和权重做矩阵乘法
+    direct: F.conv2d，1x1、stride为1、不填充时直接在通道维度上做矩阵乘法
+层的配置来自SqueezeNet 1.1(输入224x224)各Fire模块的squeeze、expand1x1和最后的分类卷积
+
+用法：
+    python cases/benchmark/bench_pointwise_conv.py [--number 3] [--batch-size 8]
+'''
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import mytorch.functions as F
+from mytorch.conv import im2col, col2im
+from mytorch.tensor import Tensor
+
+# (名字, 输入通道, 输出通道, 输入大小)
+LAYERS = [
+    ('fire2 squeeze', 64, 16, 55),
+    ('fire2 expand1x1', 16, 64, 55),
+    ('fire3 squeeze', 128, 16, 55),
+    ('fire4 squeeze', 128, 32, 27),
+    ('fire4 expand1x1', 32, 128, 27),
+    ('fire5 squeeze', 256, 32, 27),
+    ('fire6 squeeze', 256, 48, 13),
+    ('fire6 expand1x1', 48, 192, 13),
+    ('fire7 squeeze', 384, 48, 13),
+    ('fire8 squeeze', 384, 64, 13),
+    ('fire8 expand1x1', 64, 256, 13),
+    ('fire9 squeeze', 512, 64, 13),
+    ('classifier', 512, 1000, 13),
+]
+
+
+def conv_im2col(x, w):
+    N, C, H, W = x.shape
+    FN = w.shape[0]
+    col = im2col(x, 1, 1, 1, 0, np)
+    out = (col @ w.reshape(FN, -1).T).reshape(N, H, W, FN).transpose(0, 3, 1, 2)
+    dout = np.ones_like(out).transpose(0, 2, 3, 1).reshape(-1, FN)
+    gw = dout.T @ col
+    gx = col2im(dout @ w.reshape(FN, -1), x.shape, 1, 1, 1, 0, np)
+    return out, gw, gx
+
+
+def conv_direct(x, w):
+    tx = Tensor(x, requires_grad=True)
+    tw = Tensor(w, requires_grad=True)
+    y = F.conv2d(tx, tw)
+    y.backward(np.ones(y.shape, dtype=y.dtype))
+    return y, tw.grad, tx.grad
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'layer':<16} {'im2col(ms)':>11} {'direct(ms)':>11} {'speedup':>8}")
+    total = np.zeros(2)
+    for name, cin, cout, size in LAYERS:
+        x = np.random.randn(args.batch_size, cin, size, size).astype(np.float32)
+        w = np.random.randn(cout, cin, 1, 1).astype(np.float32)
+        times = np.array([min(timeit.repeat(lambda: impl(x, w), number=args.number, repeat=3)) / args.number * 1e3
+                          for impl in (conv_im2col, conv_direct)])
+        total += times
+        print(f"{name:<16} {times[0]:>11.2f} {times[1]:>11.2f} {times[0] / times[1]:>7.2f}x")
+    print(f"{'total':<16} {total[0]:>11.2f} {total[1]:>11.2f} {total[0] / total[1]:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
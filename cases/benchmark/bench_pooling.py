@@ -0,0 +1,65 @@
+'''
+比较最大池化的两种实现的前向耗时，以及新实现的前向+反向耗时：
+    im2col: 原来的MaxPooling2D，展开成列矩阵后求最大值，没有反向传播
+    pool: F.max_pool2d，不重叠的窗口直接reshape，逐个窗口位置比较并记录argmax
+层的配置来自LeNet(2x2, stride 2)和AlexNet(3x3, stride 2)
+
+用法：
+    python cases/benchmark/bench_pooling.py [--number 10] [--batch-size 64]
+'''
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import mytorch.functions as F
+from mytorch.conv import im2col
+from mytorch.tensor import Tensor, no_grad
+
+# (名字, 通道数, 输入大小, 窗口, stride)
+LAYERS = [
+    ('lenet pool1', 6, 28, 2, 2),
+    ('lenet pool2', 16, 10, 2, 2),
+    ('alexnet pool1', 96, 55, 3, 2),
+    ('alexnet pool2', 256, 27, 3, 2),
+]
+
+
+def pool_im2col(x, k, stride):
+    '''原来的MaxPooling2D.forward'''
+    N, C, H, W = x.shape
+    out_h = (H - k) // stride + 1
+    out_w = (W - k) // stride + 1
+    col = im2col(x, k, k, stride, 0, np).reshape(-1, k * k)
+    return col.max(axis=1).reshape(N, out_h, out_w, C).transpose(0, 3, 1, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=64)
+    args = parser.parse_args()
+
+    print(f"{'layer':<14} {'im2col fwd':>11} {'pool fwd':>9} {'speedup':>8} {'pool f+b':>9}")
+    for name, channels, size, k, stride in LAYERS:
+        data = np.random.randn(args.batch_size, channels, size, size).astype(np.float32)
+        x = Tensor(data, requires_grad=True)
+
+        def forward():
+            with no_grad():
+                F.max_pool2d(x, k, stride)
+
+        def step():
+            F.max_pool2d(x, k, stride).sum().backward()
+
+        times = [min(timeit.repeat(fn, number=args.number, repeat=3)) / args.number * 1e3
+                 for fn in (lambda: pool_im2col(data, k, stride), forward, step)]
+        print(f"{name:<14} {times[0]:>11.2f} {times[1]:>9.2f} {times[0] / times[1]:>7.2f}x {times[2]:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
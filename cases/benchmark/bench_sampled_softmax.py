@@ -0,0 +1,64 @@
+'''
+输出层(Linear + 交叉熵)一次训练的前向+反向，词表从一万到十万：
+    full: F.cross_entropy(h @ W.T + b)，计算完整的 (batch_size, num_classes) logits和它的梯度
+    sampled: F.sampled_softmax_loss，只计算真实类别和num_sampled个采样类别的logits
+    negative: F.negative_sampling_loss
+每步清空梯度。权重的梯度只有采样到的行非零，时间包含分配它的时间
+
+用法：
+    python cases/benchmark/bench_sampled_softmax.py [--number 3] [--batch-size 256] [--dim 512] [--num-sampled 1024]
+'''
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import mytorch.functions as F
+from mytorch.tensor import Tensor
+
+CLASSES = [10000, 50000, 100000]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--dim', type=int, default=512)
+    parser.add_argument('--num-sampled', type=int, default=1024)
+    args = parser.parse_args()
+
+    print(f"{'classes':>8} {'full(ms)':>9} {'sampled(ms)':>12} {'speedup':>8} {'negative(ms)':>13} {'speedup':>8}")
+    for classes in CLASSES:
+        h = Tensor(np.random.randn(args.batch_size, args.dim).astype(np.float32), requires_grad=True)
+        w = Tensor((np.random.randn(classes, args.dim) * 0.01).astype(np.float32), requires_grad=True)
+        b = Tensor(np.zeros(classes, dtype=np.float32), requires_grad=True)
+        # 类别按log-uniform分布，像按词频排序的词表
+        t = Tensor(F.log_uniform_candidates(args.batch_size, classes))
+
+        def full():
+            F.cross_entropy(h @ w.T + b, t).backward()
+
+        def sampled():
+            F.sampled_softmax_loss(h, w, b, t, args.num_sampled).backward()
+
+        def negative():
+            F.negative_sampling_loss(h, w, b, t, args.num_sampled).backward()
+
+        def step(fn):
+            # 和训练时一样每步清空梯度，不计入梯度累加的时间
+            for x in (h, w, b):
+                x.zero_grad(set_to_none=True)
+            fn()
+
+        times = [min(timeit.repeat(lambda: step(fn), number=args.number, repeat=3)) / args.number * 1e3
+                 for fn in (full, sampled, negative)]
+        print(f"{classes:>8} {times[0]:>9.2f} {times[1]:>12.2f} {times[0] / times[1]:>7.2f}x "
+              f"{times[2]:>13.2f} {times[0] / times[2]:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+'''
+比较stride为1的3x3卷积使用gemm和Winograd F(2x2, 3x3)的耗时(前向、前向+反向)，以及'auto'的选择
+层的配置来自AlexNet的conv3~conv5和SqueezeNet Fire模块的expand3x3
+
+用法：
+    python cases/benchmark/bench_winograd.py [--number 3] [--batch-size 8]
+'''
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import mytorch.functions as F
+from mytorch.tensor import Tensor, no_grad
+
+# (名字, 输入通道, 输出通道, 输入大小)
+LAYERS = [
+    ('alexnet conv3', 256, 384, 13),
+    ('alexnet conv4', 384, 384, 13),
+    ('alexnet conv5', 384, 256, 13),
+    ('fire2 expand3x3', 16, 64, 55),
+    ('fire4 expand3x3', 32, 128, 27),
+    ('fire6 expand3x3', 48, 192, 13),
+    ('fire8 expand3x3', 64, 256, 13),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'layer':<16} {'gemm fwd':>9} {'wino fwd':>9} {'gemm f+b':>9} {'wino f+b':>9} {'speedup':>8} {'auto':>9}")
+    for name, cin, cout, size in LAYERS:
+        x = Tensor(np.random.randn(args.batch_size, cin, size, size).astype(np.float32), requires_grad=True)
+        w = Tensor(np.random.randn(cout, cin, 3, 3).astype(np.float32), requires_grad=True)
+        times = {}
+        for algorithm in ('gemm', 'winograd'):
+            def forward():
+                with no_grad():
+                    F.conv2d(x, w, padding=1, algorithm=algorithm)
+
+            def step():
+                F.conv2d(x, w, padding=1, algorithm=algorithm).sum().backward()
+
+            for kind, fn in (('fwd', forward), ('f+b', step)):
+                times[algorithm, kind] = min(timeit.repeat(fn, number=args.number, repeat=3)) / args.number * 1e3
+        auto = F.Conv2d(padding=1)._select(w.shape)
+        print(f"{name:<16} {times['gemm', 'fwd']:>9.2f} {times['winograd', 'fwd']:>9.2f} "
+              f"{times['gemm', 'f+b']:>9.2f} {times['winograd', 'f+b']:>9.2f} "
+              f"{times['gemm', 'f+b'] / times['winograd', 'f+b']:>7.2f}x {auto:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+'''
+比较卷积和池化的填充缓冲区使用Workspace复用和每次重新分配时，一次训练迭代(前向+反向)的耗时和缺页中断次数
+网络是三层带填充的3x3卷积和最大池化，输入是大batch的32x32图像
+
+用法：
+    python cases/benchmark/bench_workspace.py [--number 5] [--batch-size 256]
+'''
+import argparse
+import gc
+import os
+import resource
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import mytorch.functions as F
+import mytorch.module as nn
+from mytorch.tensor import Tensor
+from mytorch.workspace import DEFAULT_MAX_BYTES, get_workspace, set_workspace_limit
+
+
+class Net(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.conv1 = nn.Conv2D(3, 32, (3, 3), padding=1)
+        self.conv2 = nn.Conv2D(32, 32, (3, 3), padding=1)
+        self.conv3 = nn.Conv2D(32, 64, (3, 3), padding=1)
+        self.pool = nn.MaxPooling2D(3, 3, 2, padding=1)
+
+    def forward(self, x):
+        x = self.pool(F.relu(self.conv1(x)))
+        x = self.pool(F.relu(self.conv2(x)))
+        return self.pool(F.relu(self.conv3(x))).sum()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=256)
+    args = parser.parse_args()
+
+    model = Net()
+    x = Tensor(np.random.randn(args.batch_size, 3, 32, 32).astype(np.float32))
+    ws = get_workspace()
+
+    def step():
+        model.zero_grad(set_to_none=True)
+        model(x).backward()
+
+    print(f"{'workspace':<10} {'ms/iter':>9} {'page faults/iter':>17} {'hits':>6} {'misses':>7}")
+    for name, limit in (('off', 0), ('on', DEFAULT_MAX_BYTES)):
+        set_workspace_limit(limit)
+        step()
+        gc.collect()
+        ws.reset_stats()
+        faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+        t = min(timeit.repeat(step, number=args.number, repeat=3)) / args.number * 1e3
+        faults = (resource.getrusage(resource.RUSAGE_SELF).ru_minflt - faults) / (3 * args.number)
+        print(f"{name:<10} {t:>9.2f} {faults:>17.0f} {ws.hits:>6} {ws.misses:>7}")
+
+
+if __name__ == '__main__':
+    main()
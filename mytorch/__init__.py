@@ -11,6 +11,11 @@ from mytorch.tensor import ensure_tensor
 from mytorch.tensor import ensure_array
 from mytorch.tensor import float_type
 from mytorch.tensor import debug_mode
+from mytorch.tensor import parallel_backward
+from mytorch.tensor import BackwardStats
+
+from mytorch.parallel import set_num_threads
+from mytorch.parallel import get_num_threads
 
 from mytorch import module as nn
 from mytorch import optim
\ No newline at end of file
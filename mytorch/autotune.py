@@ -0,0 +1,164 @@
+import json
+import os
+import platform
+import threading
+import time
+from typing import Callable, Dict, Optional, Sequence
+
+'''
+卷积算法的自动调优。algorithm为'auto'的卷积默认按形状的经验规则选择算法(见functions.Conv2d._select)，
+但最快的算法还取决于CPU、BLAS和线程数。开启调优后，第一次遇到某个配置(输入形状、卷积核形状、stride、padding、
+groups、dtype、内存布局、线程数、是否需要反向传播)时依次测量每个可用算法的耗时，选出最快的记在进程内的表中，
+同时写入磁盘上的JSON缓存，缓存按CPU区分，换一台机器会重新测量。
+
+环境变量:
+    MYTORCH_CONV_AUTOTUNE: 为1时开启调优，也可以调用enable()
+    MYTORCH_CONV_ALGORITHM: 固定使用的算法，优先于调优和缓存，用于复现结果，也可以调用set_override()。
+        为'auto'时只使用经验规则；指定的算法不支持当前形状时也使用经验规则
+    MYTORCH_CONV_CACHE: 缓存文件的路径，默认为 ~/.cache/mytorch/conv_autotune.json
+'''
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'mytorch', 'conv_autotune.json')
+# 每个算法测量的次数，取最小值
+REPEAT = 3
+
+
+def cpu_key() -> str:
+    '''缓存中区分机器的键：CPU型号、架构和核数'''
+    model = platform.processor()
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    model = line.split(':', 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    return f"{model}|{platform.machine()}|{os.cpu_count()}"
+
+
+class Autotuner:
+    def __init__(self, path: Optional[str] = None, enabled: bool = False, override: Optional[str] = None) -> None:
+        '''
+        Args:
+            path: JSON缓存文件的路径，为None时只保存在进程内
+            enabled: 是否测量没有见过的配置
+            override: 固定使用的算法
+        '''
+        self.path = path
+        self.enabled = enabled
+        self.override = override
+        # 配置 => 算法，第一次使用时从缓存文件中读取当前CPU的部分
+        self._table = None
+        self._cpu = cpu_key()
+        self._lock = threading.Lock()
+        self.measured = 0
+
+    def _load(self) -> Dict[str, str]:
+        if self._table is None:
+            self._table = dict(self._read_cache().get(self._cpu, {}))
+        return self._table
+
+    def _read_cache(self) -> dict:
+        if self.path is None:
+            return {}
+        try:
+            with open(self.path) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            # 文件不存在或已经损坏，重新测量
+            return {}
+        return cache if isinstance(cache, dict) else {}
+
+    def _write_cache(self) -> None:
+        '''和文件中其他CPU的条目合并后整体替换，其他进程不会读到写了一半的文件'''
+        if self.path is None:
+            return
+        cache = self._read_cache()
+        cache[self._cpu] = dict(self._table)
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump(cache, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+        except OSError:
+            # 缓存目录不可写时只保留进程内的表
+            pass
+
+    def lookup(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._load().get(key)
+
+    def choose(self, key: str, candidates: Sequence[str], default: str, measure: Callable[[str], None]) -> str:
+        '''
+        Args:
+            key: 配置的字符串表示
+            candidates: 支持这个配置的算法
+            default: 经验规则选择的算法，override为'auto'或不支持这个配置时、以及没有开启调优时使用
+            measure: measure(algorithm)用这个算法执行一次卷积
+        Returns:
+            使用的算法
+        '''
+        if self.override is not None:
+            return self.override if self.override in candidates else default
+        if not self.enabled or len(candidates) == 1:
+            return default
+        best = self.lookup(key)
+        if best in candidates:
+            return best
+
+        times = {}
+        for algorithm in candidates:
+            measure(algorithm)  # 预热，比如Winograd卷积核变换的缓存和Workspace的缓冲区
+            elapsed = []
+            for _ in range(REPEAT):
+                start = time.perf_counter()
+                measure(algorithm)
+                elapsed.append(time.perf_counter() - start)
+            times[algorithm] = min(elapsed)
+        best = min(candidates, key=times.get)
+        with self._lock:
+            self._load()[key] = best
+            self.measured += 1
+            self._write_cache()
+        return best
+
+    def table(self) -> Dict[str, str]:
+        '''当前CPU的 配置 => 算法'''
+        with self._lock:
+            return dict(self._load())
+
+    def clear(self) -> None:
+        '''清空进程内的表，不修改缓存文件'''
+        with self._lock:
+            self._table = {}
+
+
+_autotuner = Autotuner(os.environ.get('MYTORCH_CONV_CACHE', DEFAULT_CACHE_PATH),
+                       enabled=os.environ.get('MYTORCH_CONV_AUTOTUNE') == '1',
+                       override=os.environ.get('MYTORCH_CONV_ALGORITHM') or None)
+
+
+def get_autotuner() -> Autotuner:
+    '''algorithm为'auto'的卷积使用的全局Autotuner'''
+    return _autotuner
+
+
+def enable(enabled: bool = True) -> None:
+    '''开启或关闭卷积算法的调优'''
+    _autotuner.enabled = enabled
+
+
+def set_override(algorithm: Optional[str]) -> None:
+    '''固定algorithm为'auto'的卷积使用的算法，'auto'表示只使用经验规则，None表示取消'''
+    from mytorch.functions import CONV_ALGORITHMS
+    if algorithm is not None and algorithm not in CONV_ALGORITHMS:
+        raise ValueError(f"unknown convolution algorithm '{algorithm}', expected one of {CONV_ALGORITHMS}")
+    _autotuner.override = algorithm
+
+
+def set_cache_path(path: Optional[str]) -> None:
+    '''设置缓存文件的路径，None表示不使用缓存文件。进程内的表会重新从新的文件读取'''
+    _autotuner.path = path
+    _autotuner._table = None
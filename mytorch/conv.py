@@ -0,0 +1,691 @@
+import weakref
+from typing import Tuple
+
+import numpy as np
+
+from mytorch.tensor import NdArray
+from mytorch.workspace import get_workspace
+
+'''
+conv.py保存卷积和池化使用的数组级别的计算，输入输出都是NumPy(CuPy)数组，
+对应的Function在functions.py中
+
+(N, C, H, W)形状的数组可以按 (N, H, W, C) 存储(channels last)，形状不变，只是步长不同，
+卷积和池化对这样的输入按 (N, H, W, C) 分配输出和中间缓冲区，相邻的层之间不需要转换布局
+'''
+
+
+def is_channels_last(a: NdArray) -> bool:
+    '''
+    4维数组是否按 (N, H, W, C) 的顺序存储，即通道维度的步长比高和宽都小(裁剪得到的视图也算)。
+    C或H * W为1时两种布局相同，视为NCHW
+    '''
+    if a.ndim != 4 or a.shape[1] == 1:
+        return False
+    spatial = [abs(a.strides[i]) for i in (2, 3) if a.shape[i] > 1]
+    return bool(spatial) and abs(a.strides[1]) < min(spatial)
+
+
+def as_channels_last(a: NdArray, xp) -> NdArray:
+    '''按 (N, H, W, C) 复制一份数组，形状仍然是 (N, C, H, W)'''
+    return xp.ascontiguousarray(a.transpose(0, 2, 3, 1)).transpose(0, 3, 1, 2)
+
+
+def _zeros(shape: Tuple[int, int, int, int], dtype, xp, channels_last: bool = False) -> NdArray:
+    '''(N, C, H, W)形状的全0数组，channels_last为True时按 (N, H, W, C) 存储'''
+    if not channels_last:
+        return xp.zeros(shape, dtype=dtype)
+    N, C, H, W = shape
+    return xp.zeros((N, H, W, C), dtype=dtype).transpose(0, 3, 1, 2)
+
+
+def _padded(x: NdArray, pad: int, tag: str, xp, fill=0) -> Tuple[NdArray, NdArray]:
+    """
+    在Workspace借出的缓冲区中填充输入，代替每次都分配新数组的xp.pad，填充后的布局和输入相同。
+    返回填充后的输入和借出的缓冲区，缓冲区需要由调用者归还(通常是release_after输入的视图)
+    """
+    N, C, H, W = x.shape
+    if is_channels_last(x):
+        buffer = get_workspace().acquire(tag, (N, H + 2 * pad, W + 2 * pad, C), x.dtype, xp)
+        out = buffer.transpose(0, 3, 1, 2)
+    else:
+        buffer = out = get_workspace().acquire(tag, (N, C, H + 2 * pad, W + 2 * pad), x.dtype, xp)
+    out[:, :, :pad] = fill
+    out[:, :, H + pad:] = fill
+    out[:, :, pad:H + pad, :pad] = fill
+    out[:, :, pad:H + pad, W + pad:] = fill
+    out[:, :, pad:H + pad, pad:W + pad] = x
+    return out, buffer
+
+
+def sliding_window(input_data: NdArray, filter_h: int, filter_w: int, stride: int, pad: int, xp) -> NdArray:
+    """
+    返回形状为 (N, C, out_h, out_w, filter_h, filter_w) 的滑动窗口视图，[n, c, i, j]是输出(i, j)位置对应的输入窗口。
+    只在pad > 0时复制一次输入，窗口本身不占用额外内存，是只读的。
+    填充后的输入来自Workspace，窗口视图被回收(例如保存它的Function被释放)后才会被复用
+    """
+    buffer = None
+    if pad > 0:
+        input_data, buffer = _padded(input_data, pad, 'conv.pad', xp)
+    N, C, H, W = input_data.shape
+    out_h = (H - filter_h) // stride + 1
+    out_w = (W - filter_w) // stride + 1
+
+    sn, sc, sh, sw = input_data.strides
+    windows = xp.lib.stride_tricks.as_strided(input_data, (N, C, out_h, out_w, filter_h, filter_w),
+                                              (sn, sc, sh * stride, sw * stride, sh, sw), writeable=False)
+    if buffer is not None:
+        get_workspace().release_after(windows, buffer)
+    return windows
+
+
+def im2col(input_data: NdArray, filter_h: int, filter_w: int, stride: int, pad: int, xp) -> NdArray:
+    """
+    将输入数据展开为二维矩阵，支持 numpy 和 cupy。
+    每一行对应一个输出位置，按 (C, filter_h, filter_w) 排列
+    """
+    windows = sliding_window(input_data, filter_h, filter_w, stride, pad, xp)
+    N, C, out_h, out_w = windows.shape[:4]
+    # 从窗口视图只复制一次，不需要先填充再转置的中间缓冲区
+    return windows.transpose(0, 2, 3, 1, 4, 5).reshape(N * out_h * out_w, -1)
+
+
+def col2im(col: NdArray, input_shape: Tuple[int, int, int, int], filter_h: int, filter_w: int,
+           stride: int, pad: int, xp, channels_last: bool = False) -> NdArray:
+    """
+    将二维矩阵还原为原始输入形状，支持 numpy 和 cupy。
+    channels_last为True时返回按 (N, H, W, C) 存储的数组
+    """
+    N, C, H, W = input_shape
+    out_h = (H + 2 * pad - filter_h) // stride + 1
+    out_w = (W + 2 * pad - filter_w) // stride + 1
+
+    col = col.reshape(N, out_h, out_w, C, filter_h, filter_w).transpose(0, 3, 4, 5, 1, 2)
+    img = _zeros((N, C, H + 2 * pad + stride - 1, W + 2 * pad + stride - 1), col.dtype, xp, channels_last)
+
+    for y in range(filter_h):
+        y_max = y + stride * out_h
+        for x in range(filter_w):
+            x_max = x + stride * out_w
+            img[:, :, y:y_max:stride, x:x_max:stride] += col[:, :, y, x, :, :]
+
+    return img[:, :, pad:H + pad, pad:W + pad]
+
+
+def depthwise_conv(windows: NdArray, weight: NdArray, xp, channels_last: bool = False) -> NdArray:
+    """
+    depthwise卷积(每组只有一个输入通道)，逐个卷积核位置做广播乘加，避免einsum在组维度上的批量小矩阵乘法。
+    windows: sliding_window得到的 (N, C, out_h, out_w, filter_h, filter_w)
+    weight: (C, M, filter_h, filter_w)，M是每个输入通道对应的输出通道数
+    返回 (N, C * M, out_h, out_w)，channels_last为True时按 (N, out_h, out_w, C * M) 存储
+    """
+    N, C, out_h, out_w, filter_h, filter_w = windows.shape
+    M = weight.shape[1]
+    dtype = xp.result_type(windows, weight)
+    if channels_last:
+        # C和M在内存中相邻，最后合并成C * M时仍然是视图
+        out = xp.zeros((N, out_h, out_w, C, M), dtype=dtype).transpose(0, 3, 4, 1, 2)
+    else:
+        out = xp.zeros((N, C, M, out_h, out_w), dtype=dtype)
+    for y in range(filter_h):
+        for x in range(filter_w):
+            out += windows[:, :, None, :, :, y, x] * weight[:, :, y, x, None, None]
+    return out.reshape(N, C * M, out_h, out_w)
+
+
+def depthwise_grad_weight(dout: NdArray, windows: NdArray, xp, per_sample: bool = False) -> NdArray:
+    """
+    depthwise卷积的权重梯度，dout: (N, C, M, out_h, out_w)，返回 (C, M, filter_h, filter_w)，
+    per_sample为True时返回每个样本的梯度 (N, C, M, filter_h, filter_w)
+    """
+    filter_h, filter_w = windows.shape[4:]
+    subscripts = 'ncmhw,nchw->ncm' if per_sample else 'ncmhw,nchw->cm'
+    return xp.stack([xp.stack([xp.einsum(subscripts, dout, windows[..., y, x]) for x in range(filter_w)], axis=-1)
+                     for y in range(filter_h)], axis=-2)
+
+
+def depthwise_grad_input(dout: NdArray, weight: NdArray, input_shape: Tuple[int, int, int, int],
+                         stride: int, pad: int, xp, channels_last: bool = False) -> NdArray:
+    """
+    depthwise卷积的输入梯度，dout: (N, C, M, out_h, out_w)，weight: (C, M, filter_h, filter_w)，
+    直接把每个卷积核位置的梯度累加到输入上，不需要col2im
+    """
+    N, C, H, W = input_shape
+    out_h, out_w = dout.shape[3:]
+    filter_h, filter_w = weight.shape[2:]
+    img = _zeros((N, C, H + 2 * pad + stride - 1, W + 2 * pad + stride - 1), dout.dtype, xp, channels_last)
+    for y in range(filter_h):
+        y_max = y + stride * out_h
+        for x in range(filter_w):
+            x_max = x + stride * out_w
+            img[:, :, y:y_max:stride, x:x_max:stride] += xp.einsum('ncmhw,cm->nchw', dout, weight[:, :, y, x])
+    return img[:, :, pad:H + pad, pad:W + pad]
+
+
+def pointwise_conv(x: NdArray, weight: NdArray, groups: int, xp) -> NdArray:
+    """
+    1x1、stride为1、不填充的卷积只是通道维度上的矩阵乘法，不需要滑动窗口、填充和转置。
+    x: (N, C, H, W)，weight: (FN, C // groups, 1, 1)，返回 (N, FN, H, W)
+    每个样本(每组)是一次 (FN, C) @ (C, H * W)，结果直接是NCHW布局；
+    x按 (N, H, W, C) 存储时是一次 (N * H * W, C) @ (C, FN)，结果也按 (N, H, W, FN) 存储
+    """
+    N, C, H, W = x.shape
+    FN, FC = weight.shape[:2]
+    if is_channels_last(x):
+        rows = x.transpose(0, 2, 3, 1).reshape(N * H * W, groups, FC).transpose(1, 0, 2)
+        out = xp.matmul(rows, weight.reshape(groups, FN // groups, FC).transpose(0, 2, 1))
+        return out.transpose(1, 0, 2).reshape(N, H, W, FN).transpose(0, 3, 1, 2)
+    if groups == 1:
+        out = xp.matmul(weight.reshape(FN, FC), x.reshape(N, C, H * W))
+    else:
+        out = xp.matmul(weight.reshape(groups, FN // groups, FC), x.reshape(N, groups, FC, H * W))
+    return out.reshape(N, FN, H, W)
+
+
+def pointwise_grad(dout: NdArray, x: NdArray, weight: NdArray, groups: int, xp, needs_x: bool = True,
+                   needs_w: bool = True, per_sample: bool = False) -> Tuple[NdArray, NdArray]:
+    """
+    pointwise_conv的输入和权重的梯度，dout: (N, FN, H, W)，
+    per_sample为True时权重的梯度是每个样本的 (N, FN, C // groups, 1, 1)
+    """
+    if is_channels_last(x):
+        return _pointwise_grad_channels_last(dout, x, weight, groups, xp, needs_x, needs_w, per_sample)
+    N, C, H, W = x.shape
+    FN, FC = weight.shape[:2]
+    dout = dout.reshape(N, groups, FN // groups, H * W)
+    gx = gw = None
+    if needs_x:
+        w = weight.reshape(groups, FN // groups, FC)
+        gx = xp.matmul(w.transpose(0, 2, 1), dout).reshape(x.shape)
+    if needs_w:
+        # (N, groups, FN // groups, FC)，再对样本求和
+        gw = xp.matmul(dout, x.reshape(N, groups, FC, H * W).transpose(0, 1, 3, 2))
+        gw = gw.reshape((N,) + weight.shape) if per_sample else gw.sum(axis=0).reshape(weight.shape)
+    return gx, gw
+
+
+def _pointwise_grad_channels_last(dout: NdArray, x: NdArray, weight: NdArray, groups: int, xp, needs_x: bool,
+                                  needs_w: bool, per_sample: bool) -> Tuple[NdArray, NdArray]:
+    '''x按 (N, H, W, C) 存储时的pointwise_grad，输入的梯度也按 (N, H, W, C) 存储'''
+    N, C, H, W = x.shape
+    FN, FC = weight.shape[:2]
+    # (N, H * W, groups, FN // groups)，dout是其他布局时在这里复制一次
+    dout = dout.transpose(0, 2, 3, 1).reshape(N, H * W, groups, FN // groups)
+    gx = gw = None
+    if needs_x:
+        w = weight.reshape(groups, FN // groups, FC)
+        gx = xp.matmul(dout.reshape(N * H * W, groups, -1).transpose(1, 0, 2), w)
+        gx = gx.transpose(1, 0, 2).reshape(N, H, W, C).transpose(0, 3, 1, 2)
+    if needs_w:
+        rows = x.transpose(0, 2, 3, 1).reshape(N, H * W, groups, FC)
+        if per_sample:
+            gw = xp.matmul(dout.transpose(0, 2, 3, 1), rows.transpose(0, 2, 1, 3))
+            gw = gw.reshape((N,) + weight.shape)
+        else:
+            dout = dout.reshape(N * H * W, groups, -1)
+            gw = xp.matmul(dout.transpose(1, 2, 0), rows.reshape(N * H * W, groups, FC).transpose(1, 0, 2))
+            gw = gw.reshape(weight.shape)
+    return gx, gw
+
+
+# region Winograd F(2x2, 3x3)
+# 输出的每个2x2块由对应的4x4输入块计算: Y = A^T [(G g G^T) * (B^T d B)] A，
+# 变换矩阵中大部分元素是0和±1，乘法次数从36次降到16次
+_WINOGRAD_BT = ((1, 0, -1, 0), (0, 1, 1, 0), (0, -1, 1, 0), (0, 1, 0, -1))
+_WINOGRAD_G = ((1, 0, 0), (0.5, 0.5, 0.5), (0.5, -0.5, 0.5), (0, 0, 1))
+_WINOGRAD_AT = ((1, 1, 1, 0), (0, 1, -1, -1))
+
+
+def _transpose(mat: Tuple) -> Tuple:
+    return tuple(zip(*mat))
+
+
+def _combine(row: Tuple, a: NdArray, xp, out: NdArray = None) -> NdArray:
+    '''sum(row[j] * a[j])，跳过0系数，±1直接加减，给出out时结果直接写入out，不产生临时数组'''
+    # 系数为1的项放在最前面，这样第一次运算就可以是加减法
+    terms = sorted(((coef, aj) for coef, aj in zip(row, a) if coef != 0), key=lambda term: term[0] != 1)
+    coef, first = terms[0]
+    rest = terms[1:]
+    if coef == 1 and rest and rest[0][0] in (1, -1):
+        out = (xp.add if rest[0][0] == 1 else xp.subtract)(first, rest[0][1], out=out)
+        rest = rest[1:]
+    else:
+        out = xp.multiply(first, coef, out=out)
+    for coef, aj in rest:
+        if coef == 1:
+            xp.add(out, aj, out=out)
+        elif coef == -1:
+            xp.subtract(out, aj, out=out)
+        else:
+            out += coef * aj
+    return out
+
+
+def _sandwich(mat: Tuple, a: NdArray, xp) -> NdArray:
+    '''mat @ a @ mat^T，作用在a的第0维和第1维上，用于卷积核这样的小数组'''
+    a = xp.stack([_combine(row, a, xp) for row in mat])
+    return xp.stack([_combine(row, a.swapaxes(0, 1), xp) for row in mat], axis=1)
+
+
+def _interleaved(a: NdArray, size: int, count: int, axis: int) -> list:
+    '''沿axis取 a[k::2] 的前count个(k < size)，即所有块中第k行(列)组成的视图'''
+    index = [slice(None)] * a.ndim
+    views = []
+    for k in range(size):
+        index[axis] = slice(k, k + 2 * count, 2)
+        views.append(a[tuple(index)])
+    return views
+
+
+# weight数组的id => (weight的弱引用, 变换后的卷积核)
+_winograd_filters = {}
+
+
+def winograd_filter(weight: NdArray, xp) -> NdArray:
+    """
+    卷积核的变换 G g G^T，(FN, C, 3, 3) => (16, FN, C)。
+    结果按weight数组缓存，参数更新(optimizer.step、load_state_dict)会替换Tensor的数组，缓存自动失效；
+    直接原地修改数组的内容不会使缓存失效
+    """
+    key = id(weight)
+    entry = _winograd_filters.get(key)
+    if entry is not None and entry[0]() is weight:
+        return entry[1]
+
+    u = _sandwich(_WINOGRAD_G, weight.transpose(2, 3, 0, 1), xp).astype(weight.dtype, copy=False)
+    u = u.reshape(16, *weight.shape[:2])
+    # 数组被回收时删除缓存，不会让旧的参数一直占用内存
+    _winograd_filters[key] = (weakref.ref(weight, lambda _, key=key: _winograd_filters.pop(key, None)), u)
+    return u
+
+
+def _winograd_tiles(shape: Tuple[int, int, int, int], pad: int) -> Tuple[int, int, int, int]:
+    '''输出的大小和2x2块的个数'''
+    N, C, H, W = shape
+    out_h, out_w = H + 2 * pad - 2, W + 2 * pad - 2
+    return out_h, out_w, (out_h + 1) // 2, (out_w + 1) // 2
+
+
+def winograd_conv(x: NdArray, weight: NdArray, pad: int, xp) -> Tuple[NdArray, NdArray]:
+    """
+    stride为1的3x3卷积
+    Args:
+        x: (N, C, H, W)
+        weight: (FN, C, 3, 3)
+
+    Returns:
+        输出 (N, FN, out_h, out_w) 和变换后的输入块 (16, C, N * tiles)，后者在反向传播中使用
+    """
+    N, C, H, W = x.shape
+    FN = weight.shape[0]
+    out_h, out_w, th, tw = _winograd_tiles(x.shape, pad)
+    # 换成 (C, N, H, W) 再补齐到整数个块，多出的一行(列)输出最后会被裁掉。相邻的4x4块重叠2行(列)
+    x = xp.pad(x.transpose(1, 0, 2, 3), [(0, 0), (0, 0), (pad, 2 * th + 2 - H - pad), (pad, 2 * tw + 2 - W - pad)],
+               mode='constant')
+
+    # B^T d B: 先在整个输入上变换行，再变换列，不需要取出重叠的块
+    v = xp.empty((4, 4, C, N, th, tw), dtype=x.dtype)
+    for i, row in enumerate(_WINOGRAD_BT):
+        r = _combine(row, _interleaved(x, 4, th, axis=2), xp)
+        for j, col in enumerate(_WINOGRAD_BT):
+            _combine(col, _interleaved(r, 4, tw, axis=3), xp, out=v[i, j])
+    v = v.reshape(16, C, N * th * tw)
+
+    # 16个位置各是一次 (FN, C) @ (C, N * tiles) 的矩阵乘法
+    m = xp.matmul(winograd_filter(weight, xp), v).reshape(4, 4, FN, N, th, tw)
+
+    # A^T m A: 每个块得到2x2的输出，直接写到交错的位置上
+    y = xp.empty((FN, N, 2 * th, 2 * tw), dtype=m.dtype)
+    for a, row in enumerate(_WINOGRAD_AT):
+        r = _combine(row, m, xp)
+        for b, col in enumerate(_WINOGRAD_AT):
+            _combine(col, r, xp, out=y[:, :, a::2, b::2])
+    return y.transpose(1, 0, 2, 3)[:, :, :out_h, :out_w], v
+
+
+def winograd_grad(dout: NdArray, v: NdArray, weight: NdArray, x_shape: Tuple[int, int, int, int], pad: int, xp,
+                  needs_x: bool = True, needs_w: bool = True, per_sample: bool = False) -> Tuple[NdArray, NdArray]:
+    """
+    winograd_conv的反向传播，每一步都是前向传播中对应线性变换的转置，得到的是这种计算方式的精确梯度
+    Args:
+        dout: (N, FN, out_h, out_w)
+        v: winograd_conv返回的变换后的输入块
+        per_sample: 为True时返回每个样本的权重梯度 (N, FN, C, 3, 3)
+
+    Returns:
+        输入和权重的梯度
+    """
+    N, C, H, W = x_shape
+    FN = weight.shape[0]
+    out_h, out_w, th, tw = _winograd_tiles(x_shape, pad)
+    dout = xp.pad(dout.transpose(1, 0, 2, 3), [(0, 0), (0, 0), (0, 2 * th - out_h), (0, 2 * tw - out_w)],
+                  mode='constant')
+
+    # A dY A^T
+    dm = xp.empty((4, 4, FN, N, th, tw), dtype=dout.dtype)
+    a = _transpose(_WINOGRAD_AT)
+    rows = [_interleaved(r, 2, tw, axis=3) for r in _interleaved(dout, 2, th, axis=2)]
+    for i in range(4):
+        r = [_combine(a[i], [rows[0][b], rows[1][b]], xp) for b in range(2)]
+        for j in range(4):
+            _combine(a[j], r, xp, out=dm[i, j])
+    dm = dm.reshape(16, FN, N * th * tw)
+
+    gw = None
+    if needs_w and per_sample:
+        du = xp.einsum('kfnp,kcnp->knfc', dm.reshape(16, FN, N, -1), v.reshape(16, C, N, -1), optimize=True)
+        gw = _sandwich(_transpose(_WINOGRAD_G), du.reshape(4, 4, N, FN, C), xp).transpose(2, 3, 4, 0, 1)
+    elif needs_w:
+        du = xp.matmul(dm, v.swapaxes(1, 2)).reshape(4, 4, FN, C)
+        gw = _sandwich(_transpose(_WINOGRAD_G), du, xp).transpose(2, 3, 0, 1)
+
+    gx = None
+    if needs_x:
+        dv = xp.matmul(winograd_filter(weight, xp).swapaxes(1, 2), dm).reshape(4, 4, C, N, th, tw)
+        # B dV B^T，重叠的块把梯度累加回输入: 先累加列，再累加行
+        b = _transpose(_WINOGRAD_BT)
+        img = xp.zeros((C, N, 2 * th + 2, 2 * tw + 2), dtype=dv.dtype)
+        img_rows = _interleaved(img, 4, th, axis=2)
+        for i in range(4):
+            r = xp.zeros((C, N, th, 2 * tw + 2), dtype=dv.dtype)
+            for j, view in enumerate(_interleaved(r, 4, tw, axis=3)):
+                view += _combine(b[j], dv[i], xp)
+            for k, view in enumerate(img_rows):
+                if b[k][i] == 1:
+                    view += r
+                elif b[k][i] == -1:
+                    view -= r
+        gx = img[:, :, pad:H + pad, pad:W + pad].transpose(1, 0, 2, 3)
+    return gx, gw
+
+# endregion Winograd
+
+
+# region FFT
+def _batched_matmul(a: NdArray, b: NdArray, xp) -> NdArray:
+    '''批量矩阵乘法，转置得到的不连续数组先复制成连续的，否则NumPy不会调用BLAS'''
+    return xp.matmul(xp.ascontiguousarray(a), xp.ascontiguousarray(b))
+
+
+def _fast_length(n: int) -> int:
+    '''不小于n的 2^a * 3^b * 5^c，这些长度的FFT最快'''
+    best = 2 ** (n - 1).bit_length()
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            # p35乘上2的幂，直到不小于n
+            m = p35
+            while m < n:
+                m *= 2
+            best = min(best, m)
+            p35 *= 3
+        p5 *= 5
+    return best
+
+
+def _fft_plan(x_shape: Tuple[int, int, int, int], w_shape: Tuple[int, int, int, int], tile: int = None) -> Tuple:
+    """
+    stride为1、没有padding的卷积，把输出分成 tile x tile 的块(overlap-save)，每块只需要 (tile + filter - 1) 大小的输入
+    Returns:
+        块的大小 (th, tw)，FFT的长度 (lh, lw)，每个块左上角的位置
+    """
+    N, C, H, W = x_shape
+    filter_h, filter_w = w_shape[2:]
+    out_h, out_w = H - filter_h + 1, W - filter_w + 1
+
+    sizes = []
+    for out, k in ((out_h, filter_h), (out_w, filter_w)):
+        # 默认FFT的长度取卷积核的4倍左右，每块的计算量和内存都不大
+        t = tile or _fast_length(max(4 * k, 32)) - k + 1
+        t = min(t, out)
+        sizes.append((t, _fast_length(t + k - 1)))
+    (th, lh), (tw, lw) = sizes
+    starts = [(r, c) for r in range(0, out_h, th) for c in range(0, out_w, tw)]
+    return (th, tw), (lh, lw), starts
+
+
+def _polyphase(x: NdArray, weight: NdArray, stride: int, pad: int, xp) -> Tuple[NdArray, NdArray]:
+    """
+    把stride为s的卷积转换成stride为1的卷积: 输入和卷积核的行、列都按除以s的余数拆成s * s个相位，
+    相位合并到通道中，y[i] = sum x[s * i + a + s * p] w[a + s * p]，a是相位，p是相位内的位置。
+    FFT只需要计算真正的输出，不用先算stride为1的全部输出再抽取
+    Returns:
+        (N, C * s * s, out_h + kp - 1, out_w + kq - 1) 的输入和 (FN, C * s * s, kp, kq) 的卷积核
+    """
+    N, C, H, W = x.shape
+    FN, _, filter_h, filter_w = weight.shape
+    out_h = (H + 2 * pad - filter_h) // stride + 1
+    out_w = (W + 2 * pad - filter_w) // stride + 1
+    kp, kq = -(-filter_h // stride), -(-filter_w // stride)
+    # 输入补齐(或截断)到正好 stride * (out + kp - 1)，卷积核补齐到 stride * kp
+    hq, wq = stride * (out_h + kp - 1), stride * (out_w + kq - 1)
+    x = xp.pad(x, [(0, 0), (0, 0), (pad, max(hq - H - pad, 0)), (pad, max(wq - W - pad, 0))], mode='constant')
+    x = x[:, :, :hq, :wq]
+    weight = xp.pad(weight, [(0, 0), (0, 0), (0, stride * kp - filter_h), (0, stride * kq - filter_w)], mode='constant')
+    if stride == 1:
+        return x, weight
+
+    x = x.reshape(N, C, hq // stride, stride, wq // stride, stride).transpose(0, 1, 3, 5, 2, 4)
+    weight = weight.reshape(FN, C, kp, stride, kq, stride).transpose(0, 1, 3, 5, 2, 4)
+    return (x.reshape(N, C * stride * stride, hq // stride, wq // stride),
+            weight.reshape(FN, C * stride * stride, kp, kq))
+
+
+def _polyphase_grad(gx: NdArray, gw: NdArray, x_shape: Tuple, w_shape: Tuple, stride: int, pad: int,
+                    xp) -> Tuple[NdArray, NdArray]:
+    '''_polyphase的逆变换，把相位上的梯度放回原来的位置，per-sample的权重梯度多一个batch维度'''
+    N, C, H, W = x_shape
+    filter_h, filter_w = w_shape[2:]
+    if gx is not None:
+        if stride > 1:
+            hp, wp = gx.shape[2:]
+            gx = gx.reshape(N, C, stride, stride, hp, wp).transpose(0, 1, 4, 2, 5, 3)
+            gx = gx.reshape(N, C, hp * stride, wp * stride)
+        # 被截断的部分梯度为0
+        gx = xp.pad(gx, [(0, 0), (0, 0), (0, max(H + pad - gx.shape[2], 0)), (0, max(W + pad - gx.shape[3], 0))],
+                    mode='constant')
+        gx = gx[:, :, pad:H + pad, pad:W + pad]
+    if gw is not None:
+        if stride > 1:
+            kp, kq = gw.shape[-2:]
+            batch = gw.shape[:-3]
+            gw = gw.reshape(batch + (C, stride, stride, kp, kq))
+            # (..., C, a, b, p, q) => (..., C, p, a, q, b)
+            n = len(batch)
+            gw = gw.transpose(*range(n), n, n + 3, n + 1, n + 4, n + 2).reshape(batch + (C, kp * stride, kq * stride))
+        gw = gw[..., :filter_h, :filter_w]
+    return gx, gw
+
+
+def fft_conv(x: NdArray, weight: NdArray, stride: int, pad: int, xp, tile: int = None) -> NdArray:
+    """
+    用FFT计算卷积(互相关)，适合大卷积核。stride大于1时先转换成相位合并到通道中的stride为1的卷积，
+    输出按块计算，每块在频域中做通道的矩阵乘法，内存只和块的大小有关，不需要im2col的列矩阵
+    Args:
+        x: (N, C, H, W)
+        weight: (FN, C, filter_h, filter_w)
+        tile: 每块输出的大小，默认根据卷积核大小选择
+
+    Returns:
+        (N, FN, out_h, out_w)
+    """
+    x, weight = _polyphase(x, weight, stride, pad, xp)
+    N = x.shape[0]
+    FN, _, filter_h, filter_w = weight.shape
+    out_h, out_w = x.shape[2] - filter_h + 1, x.shape[3] - filter_w + 1
+    (th, tw), (lh, lw), starts = _fft_plan(x.shape, weight.shape, tile)
+
+    # 互相关: 输入的频谱乘卷积核频谱的共轭，(lh, lw // 2 + 1, C, FN)
+    wf = xp.ascontiguousarray(xp.conj(xp.fft.rfft2(weight, s=(lh, lw))).transpose(2, 3, 1, 0))
+    out = xp.empty((N, FN, out_h, out_w), dtype=x.dtype)
+    for r, c in starts:
+        xf = xp.fft.rfft2(x[:, :, r:r + th + filter_h - 1, c:c + tw + filter_w - 1], s=(lh, lw))
+        yf = _batched_matmul(xf.transpose(2, 3, 0, 1), wf, xp).transpose(2, 3, 0, 1)
+        # 循环互相关的前 (lh - filter_h + 1) 个结果没有回绕，块内的输出都在这个范围内
+        y = xp.fft.irfft2(yf, s=(lh, lw))
+        rows, cols = min(th, out_h - r), min(tw, out_w - c)
+        out[:, :, r:r + rows, c:c + cols] = y[:, :, :rows, :cols]
+    return out
+
+
+def fft_conv_grad(dout: NdArray, x: NdArray, weight: NdArray, stride: int, pad: int, xp, needs_x: bool = True,
+                  needs_w: bool = True, per_sample: bool = False, tile: int = None) -> Tuple[NdArray, NdArray]:
+    """
+    fft_conv的反向传播，和前向传播使用相同的分块:
+    权重的梯度是输入和dout的互相关，在频域中对所有块累加后只做一次逆变换；
+    输入的梯度是dout和卷积核的卷积，每块的结果比块大 filter - 1，重叠部分相加(overlap-add)
+    Args:
+        dout: (N, FN, out_h, out_w)
+        per_sample: 为True时返回每个样本的权重梯度 (N, FN, C, filter_h, filter_w)
+
+    Returns:
+        输入和权重的梯度
+    """
+    x_shape, w_shape = x.shape, weight.shape
+    x, weight = _polyphase(x, weight, stride, pad, xp)
+    N, C = x.shape[:2]
+    FN, _, filter_h, filter_w = weight.shape
+    (th, tw), (lh, lw), starts = _fft_plan(x.shape, weight.shape, tile)
+    dtype = xp.result_type(dout, weight)
+
+    wf = xp.ascontiguousarray(xp.fft.rfft2(weight, s=(lh, lw)).transpose(2, 3, 0, 1)) if needs_x else None
+    gx = xp.zeros((N, C, x.shape[2] + th, x.shape[3] + tw), dtype=dtype) if needs_x else None
+    gwf = None
+    for r, c in starts:
+        dyf = xp.fft.rfft2(dout[:, :, r:r + th, c:c + tw], s=(lh, lw))
+        if needs_w:
+            xf = xp.fft.rfft2(x[:, :, r:r + th + filter_h - 1, c:c + tw + filter_w - 1], s=(lh, lw))
+            if per_sample:
+                g = xp.einsum('nfuv,ncuv->nfcuv', xp.conj(dyf), xf)
+            else:
+                g = _batched_matmul(xp.conj(dyf).transpose(2, 3, 1, 0), xf.transpose(2, 3, 0, 1), xp)
+                g = g.transpose(2, 3, 0, 1)
+            gwf = g if gwf is None else gwf + g
+
+        if needs_x:
+            dxf = _batched_matmul(dyf.transpose(2, 3, 0, 1), wf, xp).transpose(2, 3, 0, 1)
+            # 线性卷积的长度 th + filter_h - 1 不超过FFT的长度，没有回绕
+            dx = xp.fft.irfft2(dxf, s=(lh, lw))[:, :, :th + filter_h - 1, :tw + filter_w - 1]
+            gx[:, :, r:r + th + filter_h - 1, c:c + tw + filter_w - 1] += dx
+
+    gw = None
+    if needs_w:
+        gw = xp.fft.irfft2(gwf, s=(lh, lw))[..., :filter_h, :filter_w].astype(dtype, copy=False)
+    if needs_x:
+        gx = gx[:, :, :x.shape[2], :x.shape[3]]
+    return _polyphase_grad(gx, gw, x_shape, w_shape, stride, pad, xp)
+
+# endregion FFT
+
+
+# region 池化
+def pool_windows(x: NdArray, kernel: Tuple[int, int], stride: Tuple[int, int], pad: int, xp,
+                 fill=0) -> NdArray:
+    """
+    池化窗口的视图 (N, C, out_h, out_w, kernel_h, kernel_w)，和sliding_window一样，只在pad > 0时复制一次输入。
+    高和宽可以使用不同的步长，填充的值是fill
+    """
+    buffer = None
+    if pad > 0:
+        x, buffer = _padded(x, pad, 'pool.pad', xp, fill)
+    N, C, H, W = x.shape
+    (kh, kw), (sh, sw) = kernel, stride
+    out_h = (H - kh) // sh + 1
+    out_w = (W - kw) // sw + 1
+    if (sh, sw) == (kh, kw):
+        # 窗口不重叠时把高和宽各拆成两个维度就是窗口，裁掉放不下一个窗口的边缘仍然是视图
+        windows = x[:, :, :out_h * kh, :out_w * kw].reshape(N, C, out_h, kh, out_w, kw).transpose(0, 1, 2, 4, 3, 5)
+    else:
+        s_n, s_c, s_h, s_w = x.strides
+        windows = xp.lib.stride_tricks.as_strided(x, (N, C, out_h, out_w, kh, kw),
+                                                  (s_n, s_c, s_h * sh, s_w * sw, s_h, s_w), writeable=False)
+    if buffer is not None:
+        get_workspace().release_after(windows, buffer)
+    return windows
+
+
+def max_pool(windows: NdArray, xp) -> Tuple[NdArray, NdArray]:
+    """
+    最大池化，逐个窗口位置比较，不需要把窗口复制成im2col的列矩阵。
+    返回输出 (N, C, out_h, out_w) 和最大值在窗口中的位置(相同形状，按行展开，相等时取第一个)，
+    输出的布局和输入相同
+    """
+    kh, kw = windows.shape[4:]
+    out = windows[..., 0, 0].copy(order='K')
+    for p in range(1, kh * kw):
+        xp.maximum(out, windows[..., p // kw, p % kw], out=out)
+
+    # 先求最大值再倒序比较，最后写入的是第一个等于最大值的位置，比一边求最大值一边记录位置快
+    pos = xp.full_like(out, kh * kw - 1, dtype=xp.uint8 if kh * kw <= 256 else xp.intp)
+    mask = xp.empty_like(out, dtype=bool)
+    for p in range(kh * kw - 2, -1, -1):
+        xp.equal(windows[..., p // kw, p % kw], out, out=mask)
+        xp.copyto(pos, p, where=mask)
+    return out, pos
+
+
+def max_pool_grad(grad: NdArray, pos: NdArray, x_shape: Tuple[int, int, int, int], kernel: Tuple[int, int],
+                  stride: Tuple[int, int], pad: int, xp, channels_last: bool = False) -> NdArray:
+    """
+    最大池化的输入梯度，每个输出的梯度只写到最大值所在的一个输入位置，计算量和输出大小成正比。
+    窗口不重叠时各输出的位置互不相同，直接赋值；重叠时同一个输入可能是多个窗口的最大值，需要累加。
+    channels_last为True时返回按 (N, H, W, C) 存储的梯度
+    """
+    N, C, H, W = x_shape
+    out_h, out_w = grad.shape[2:]
+    (kh, kw), (sh, sw) = kernel, stride
+    pos = pos.astype(xp.intp)
+    rows = xp.arange(out_h)[:, None] * sh + pos // kw - pad
+    cols = xp.arange(out_w) * sw + pos % kw - pad
+
+    samples = xp.arange(N)[:, None, None, None]
+    channels = xp.arange(C)[:, None, None]
+    if channels_last:
+        gx = xp.zeros((N, H * W, C), dtype=grad.dtype)
+        index = (samples, rows * W + cols, channels)
+    else:
+        gx = xp.zeros((N, C, H * W), dtype=grad.dtype)
+        index = (samples, channels, rows * W + cols)
+    if sh >= kh and sw >= kw:
+        gx[index] = grad
+    elif xp is np:
+        np.add.at(gx, index, grad)
+    else:
+        gx.scatter_add(index, grad)
+    if channels_last:
+        return gx.reshape(N, H, W, C).transpose(0, 3, 1, 2)
+    return gx.reshape(x_shape)
+
+
+def avg_pool_grad(grad: NdArray, x_shape: Tuple[int, int, int, int], kernel: Tuple[int, int],
+                  stride: Tuple[int, int], pad: int, xp, channels_last: bool = False) -> NdArray:
+    """
+    平均池化的输入梯度，填充的位置计入窗口大小。
+    窗口不重叠且不填充时，每个输出的梯度广播到自己的窗口，reshape回输入的形状即可。
+    channels_last为True时返回按 (N, H, W, C) 存储的梯度
+    """
+    N, C, H, W = x_shape
+    out_h, out_w = grad.shape[2:]
+    (kh, kw), (sh, sw) = kernel, stride
+    grad = grad / (kh * kw)
+    if (sh, sw) == (kh, kw) and pad == 0:
+        if channels_last:
+            gx = xp.broadcast_to(grad.transpose(0, 2, 3, 1)[:, :, None, :, None], (N, out_h, kh, out_w, kw, C))
+            gx = gx.reshape(N, out_h * kh, out_w * kw, C).transpose(0, 3, 1, 2)
+        else:
+            gx = xp.broadcast_to(grad[:, :, :, None, :, None], (N, C, out_h, kh, out_w, kw))
+            gx = gx.reshape(N, C, out_h * kh, out_w * kw)
+        if gx.shape[2:] == (H, W):
+            return gx
+        img = _zeros(x_shape, grad.dtype, xp, channels_last)
+        img[:, :, :out_h * kh, :out_w * kw] = gx
+        return img
+
+    img = _zeros((N, C, H + 2 * pad + sh - 1, W + 2 * pad + sw - 1), grad.dtype, xp, channels_last)
+    for y in range(kh):
+        for x in range(kw):
+            img[:, :, y:y + sh * out_h:sh, x:x + sw * out_w:sw] += grad
+    return img[:, :, pad:H + pad, pad:W + pad]
+
+# endregion 池化
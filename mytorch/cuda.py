@@ -168,7 +168,11 @@ class GpuDevice(Device):
     @staticmethod
     def from_array(array: ndarray):
         if isinstance(array, ndarray) and array.device is not None:
-            return GpuDevice(array.device)
+            # 每个显卡只创建一个GpuDevice
+            device = _gpu_devices.get(array.device.id)
+            if device is None:
+                device = _gpu_devices[array.device.id] = GpuDevice(array.device)
+            return device
         return None
 
     def create_context(self):
@@ -203,6 +207,10 @@ class GpuDevice(Device):
     def __repr__(self):
         return f"device(type='cuda', index={self.device.id})"
 
+# CpuDevice没有状态，所有CPU上的Tensor共享同一个对象，避免每次创建Tensor都实例化设备
+_cpu_device = CpuDevice()
+_gpu_devices = {}
+
 # region 设备检查
     # is_available()：检查 GPU（cupy）是否可用。
     # check_cuda_available()：如果 cupy 不可用，抛出错误提示。
@@ -236,7 +244,7 @@ def get_device(device_desc) -> Device:
 
     '''
     if device_desc is None:
-        return CpuDevice()
+        return _cpu_device
 
     if isinstance(device_desc, Device):
         return device_desc
@@ -245,7 +253,7 @@ def get_device(device_desc) -> Device:
         return GpuDevice(device_desc)
 
     if device_desc == 'cpu':
-        return CpuDevice()
+        return _cpu_device
 
     if device_desc.startswith('cuda'):
         name, colon, device_id = device_desc.partition(':')
@@ -256,11 +264,14 @@ def get_device(device_desc) -> Device:
     raise ValueError('Invalid argument.')
 
 def get_device_from_array(array) -> Device:
+    if type(array) is numpy.ndarray:
+        return _cpu_device
+
     device = GpuDevice.from_array(array)
     if device is not None:
         return device
 
-    return CpuDevice()
+    return _cpu_device
 
 def get_gpu_device_or_current(device):  # -> Any | CudaDevice:
     check_cuda_available()
@@ -4,13 +4,20 @@ from typing import Tuple, Union, List
 import numpy as np
 
 from mytorch import cuda
+from mytorch.autotune import get_autotuner
+from mytorch.conv import (sliding_window, col2im, depthwise_conv, depthwise_grad_weight, depthwise_grad_input,
+                          pointwise_conv, pointwise_grad, winograd_conv, winograd_grad, fft_conv, fft_conv_grad,
+                          pool_windows, max_pool, max_pool_grad, avg_pool_grad, is_channels_last, as_channels_last)
 from mytorch.cuda import get_array_module
 from mytorch.ops import Function
+from mytorch.parallel import map_batches, join_batches, get_num_threads
 from mytorch.tensor import Tensor, NdArray
 
 
 # ----激活函数----
 class ReLU(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray) -> NdArray:
         xp = get_array_module(x)
         # y = xp.maximum(x, 0, dtype=x.dtype)
@@ -36,6 +43,8 @@ def relu(x: Tensor) -> Tensor:
 
 
 class LeakyRelu(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray, slope: float = 0.01) -> NdArray:
         self.save_for_backward(x, slope)
         xp = get_array_module(x)
@@ -49,6 +58,8 @@ class LeakyRelu(Function):
 
 
 class ELU(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray, alpha: float = 1) -> NdArray:
         xp = get_array_module(x)
         self.save_for_backward(x, alpha, xp)
@@ -63,6 +74,8 @@ class ELU(Function):
 
 
 class Sigmoid(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray) -> NdArray:
         xp = get_array_module(x)
 
@@ -130,6 +143,8 @@ def softplus(x: Tensor, beta: float = 1) -> Tensor:
 
 
 class Tanh(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray) -> NdArray:
         xp = get_array_module(x)
         if xp is np:
@@ -160,6 +175,8 @@ def tanh(x: Tensor) -> Tensor:
 
 
 class Softmax(Function):
+    __slots__ = ('axis',)
+
     def __init__(self, axis=1):
         super().__init__()
         self.axis = axis
@@ -205,6 +222,7 @@ def _logsumexp(x: NdArray, axis=-1):
 
 
 class LogSoftmax(Function):
+    __slots__ = ('axis',)
 
     def __init__(self, axis=-1):
         super().__init__()
@@ -250,6 +268,8 @@ def _softmax(x, axis=1):
 
 
 class NLLLoss(Function):
+    __slots__ = ('ignore_index', 'reduction')
+
     def __init__(self, ignore_index=-100, reduction: str = "mean"):
         """
 
@@ -318,6 +338,65 @@ def binary_cross_entropy(input: Tensor, target: Tensor, reduction: str = "mean")
     return _reduction(errors, reduction)
 
 
+class CrossEntropy(Function):
+    '''
+    融合的交叉熵，等价于 nll_loss(log_softmax(input), target)，但只有一个节点：
+    前向传播只计算一次每行的logsumexp，不生成完整的log_softmax；只保存logits的引用和每行的logsumexp，
+    反向传播在一次遍历中重新计算softmax，减去one-hot，再乘以 grad * mask / 有效样本数，
+    不需要 (batch_size, num_classes) 的零矩阵和log_softmax的第二次反向传播。类别数很大时(如语言模型的词表)更省内存
+    '''
+    __slots__ = ('ignore_index', 'reduction')
+
+    def __init__(self, ignore_index=-100, reduction: str = "mean"):
+        super().__init__()
+        self.ignore_index = ignore_index
+        self.reduction = reduction
+
+    def forward(self, input: NdArray, target: NdArray) -> NdArray:
+        """
+        Args:
+            input: logits，形状 (batch_size, num_classes)
+            target: 类别索引 或 one-hot向量，形状为 (batch_size,) 或 (batch_size, num_classes)
+
+        Returns:
+            reduction为'mean'或'sum'时是标量，为'none'时是每个样本的损失，忽略的样本为0
+        """
+        xp = get_array_module(input)
+        if target.ndim > 1:
+            target = xp.argmax(target, axis=1)
+        target = target.astype(xp.intp, copy=False)
+
+        rows = xp.arange(input.shape[0])
+        mask = target != self.ignore_index
+        # 忽略的样本随便取一个类别，损失和梯度都会被mask清零
+        target = xp.where(mask, target, 0)
+        lse = _logsumexp(input, axis=1)
+        errors = xp.where(mask, lse[:, 0] - input[rows, target], 0).astype(input.dtype, copy=False)
+
+        count = mask.sum()
+        self.save_for_backward(input, lse, rows, target, mask, count)
+        if self.reduction == 'mean':
+            return xp.divide(errors.sum(), count, dtype=input.dtype)
+        if self.reduction == 'sum':
+            return errors.sum()
+        return errors
+
+    def backward(self, grad: NdArray) -> NdArray:
+        input, lse, rows, target, mask, count = self.saved_tensors
+        xp = get_array_module(input)
+
+        # softmax - onehot
+        gx = input - lse
+        xp.exp(gx, out=gx)
+        gx[rows, target] -= 1
+
+        scale = xp.where(mask, grad, 0).astype(gx.dtype, copy=False)
+        if self.reduction == 'mean':
+            scale /= count
+        gx *= scale[:, None]
+        return gx
+
+
 def cross_entropy(input: Tensor, target: Tensor, reduction: str = "mean", ignore_index=-100) -> Tensor:
     '''
 
@@ -326,13 +405,192 @@ def cross_entropy(input: Tensor, target: Tensor, reduction: str = "mean", ignore
     :param reduction:
     :return:
     '''
-    # 先计算logsoftmax
-    log_y = log_softmax(input)
-    # 基于nll实现交叉熵损失
-    return nll_loss(log_y, target, reduction, ignore_index)
+    return CrossEntropy(ignore_index, reduction)(input, target)
+
+
+def log_uniform_candidates(num_sampled: int, num_classes: int, xp=np) -> NdArray:
+    '''
+    按log-uniform(Zipf)分布有放回地采样类别，P(k) = log((k + 2) / (k + 1)) / log(num_classes + 1)，
+    要求类别按频率从高到低编号(如按词频排序的词表)。用逆变换一次采样所有类别，不需要构造概率表
+
+    Args:
+        num_sampled: 采样的个数
+        num_classes: 类别数
+        xp: numpy或cupy
+
+    Returns:
+        形状为 (num_sampled,) 的类别索引
+    '''
+    u = xp.random.random_sample(num_sampled)
+    classes = xp.exp(u * np.log(num_classes + 1)).astype(xp.intp) - 1
+    return xp.minimum(classes, num_classes - 1)
+
+
+def _log_uniform_log_q(classes: NdArray, num_classes: int, num_sampled: int) -> NdArray:
+    '''有放回地采样num_sampled次时，每个类别期望被采到次数的对数 log(num_sampled * P(k))'''
+    xp = get_array_module(classes)
+    classes = classes.astype(np.float64)
+    return xp.log(num_sampled * xp.log1p(1 / (classes + 1)) / np.log(num_classes + 1))
+
+
+class SampledLogits(Function):
+    '''
+    只计算部分类别的输出层 input @ weight.T + bias：每个样本的真实类别和所有样本共享的num_sampled个采样类别，
+    输出形状为 (batch_size, 1 + num_sampled)，第0列是真实类别。类别数很大时(如语言模型的词表)不需要计算完整的
+    (batch_size, num_classes) 的logits。权重和偏置的梯度只有真实类别和采样类别对应的行非零，
+    反向传播只计算这些行，再像Embedding一样累加到权重形状的梯度上。
+    采样在forward中完成，所以不是deterministic的，jit回放时会重新采样
+
+    Args:
+        num_sampled: 采样的类别数
+        subtract_log_q: 是否减去每个类别期望被采到次数的对数(sampled softmax的修正)，负采样不需要
+        remove_accidental_hits: 采样类别恰好是某个样本的真实类别时，把这个样本的这个logit设为很小的值
+    '''
+    __slots__ = ('num_sampled', 'subtract_log_q', 'remove_accidental_hits')
+    deterministic = False
+
+    def __init__(self, num_sampled: int, subtract_log_q: bool = True, remove_accidental_hits: bool = True):
+        super().__init__()
+        self.num_sampled = num_sampled
+        self.subtract_log_q = subtract_log_q
+        self.remove_accidental_hits = remove_accidental_hits
+
+    def forward(self, input: NdArray, weight: NdArray, bias: NdArray, target: NdArray,
+                sampled: NdArray = None) -> NdArray:
+        """
+        Args:
+            input: 输出层的输入，形状 (batch_size, in_features)
+            weight: 输出层的权重，形状 (num_classes, in_features)
+            bias: 输出层的偏置，形状 (num_classes,)，可以为None
+            target: 类别索引，形状 (batch_size,)
+            sampled: 指定的采样类别，为None时按log-uniform分布采样
+
+        Returns:
+            形状为 (batch_size, 1 + num_sampled) 的logits
+        """
+        xp = get_array_module(input)
+        num_classes = weight.shape[0]
+        target = target.astype(xp.intp, copy=False)
+        if sampled is None:
+            sampled = log_uniform_candidates(self.num_sampled, num_classes, xp)
+        sampled = sampled.astype(xp.intp, copy=False)
+
+        w_true = weight[target]
+        w_sampled = weight[sampled]
+        logits = xp.empty((input.shape[0], 1 + len(sampled)), dtype=input.dtype)
+        xp.einsum('nd,nd->n', input, w_true, out=logits[:, 0])
+        xp.matmul(input, w_sampled.T, out=logits[:, 1:])
+        if bias is not None:
+            logits[:, 0] += bias[target]
+            logits[:, 1:] += bias[sampled]
+
+        if self.subtract_log_q:
+            logits[:, 0] -= _log_uniform_log_q(target, num_classes, len(sampled))
+            logits[:, 1:] -= _log_uniform_log_q(sampled, num_classes, len(sampled))
+        if self.remove_accidental_hits:
+            hits = sampled == target[:, None]
+            logits[:, 1:][hits] = xp.finfo(logits.dtype).min / 2
+
+        self.save_for_backward(input, weight.shape, w_true, w_sampled, target, sampled, bias is not None)
+        return logits
+
+    def backward(self, grad: NdArray) -> Tuple[NdArray, NdArray, NdArray, None, None]:
+        input, w_shape, w_true, w_sampled, target, sampled, has_bias = self.saved_tensors
+        xp = get_array_module(grad)
+        g_true, g_sampled = grad[:, 0], grad[:, 1:]
+
+        gx = None
+        if self.needs_input_grad[0]:
+            gx = g_true[:, None] * w_true
+            gx += g_sampled @ w_sampled
+
+        # 真实类别和采样类别的行一起累加，重复的类别(多个样本的真实类别相同或重复采样)会被加在一起
+        classes = xp.concatenate([target, sampled])
+        gw = None
+        if self.needs_input_grad[1]:
+            rows = xp.concatenate([g_true[:, None] * input, g_sampled.T @ input])
+            gw = xp.zeros(w_shape, dtype=rows.dtype)
+            if xp is np:
+                np.add.at(gw, classes, rows)
+            else:
+                gw.scatter_add(classes, rows)
+
+        gb = None
+        if has_bias and self.needs_input_grad[2]:
+            gb = xp.zeros(w_shape[0], dtype=grad.dtype)
+            rows = xp.concatenate([g_true, g_sampled.sum(axis=0)])
+            if xp is np:
+                np.add.at(gb, classes, rows)
+            else:
+                gb.scatter_add(classes, rows)
+
+        return gx, gw, gb, None, None
+
+
+def _sampled_target(target: Tensor, ignore_index: int):
+    '''返回类别索引和有效样本的掩码，忽略的样本取类别0，它们的损失和梯度由调用者清零'''
+    xp = get_array_module(target.data)
+    target = target.data
+    if target.ndim > 1:
+        target = xp.argmax(target, axis=1)
+    mask = target != ignore_index
+    return xp.where(mask, target, 0), mask
+
+
+def sampled_softmax_loss(input: Tensor, weight: Tensor, bias: Tensor, target: Tensor, num_sampled: int,
+                         reduction: str = "mean", ignore_index=-100, remove_accidental_hits: bool = True,
+                         sampled: NdArray = None) -> Tensor:
+    '''
+    sampled softmax: 只在真实类别和num_sampled个log-uniform采样的类别上做softmax交叉熵，
+    logits减去每个类别期望被采到次数的对数，是完整softmax交叉熵梯度的近似，训练时代替
+    cross_entropy(linear(input), target)，评估时仍应使用完整的softmax
+
+    :param input: 输出层的输入 (batch_size, in_features)
+    :param weight: 输出层的权重 (num_classes, in_features)，如Linear.weight
+    :param bias: 输出层的偏置 (num_classes,)，可以为None
+    :param target: 类别索引 或 one-hot向量
+    :param num_sampled: 采样的类别数
+    :param reduction:
+    :param ignore_index: 忽略的标签
+    :param remove_accidental_hits: 是否去掉恰好等于真实类别的采样类别
+    :param sampled: 指定的采样类别，为None时随机采样
+    :return:
+    '''
+    target, mask = _sampled_target(target, ignore_index)
+    logits = SampledLogits(num_sampled, True, remove_accidental_hits)(input, weight, bias, target, sampled)
+    # 真实类别总在第0列
+    labels = get_array_module(mask).where(mask, 0, ignore_index)
+    return cross_entropy(logits, Tensor(labels, device=input.device), reduction, ignore_index)
+
+
+def negative_sampling_loss(input: Tensor, weight: Tensor, bias: Tensor, target: Tensor, num_sampled: int,
+                           reduction: str = "mean", ignore_index=-100, remove_accidental_hits: bool = True,
+                           sampled: NdArray = None) -> Tensor:
+    '''
+    负采样(word2vec): 每个样本的损失为 -log(sigmoid(真实类别的logit)) - sum(log(sigmoid(-采样类别的logit)))，
+    采样类别作为负样本，不做log q修正，参数和sampled_softmax_loss相同
+
+    :return: reduction为'mean'时是有效样本损失的平均值，为'none'时是每个样本的损失，忽略的样本为0
+    '''
+    target, mask = _sampled_target(target, ignore_index)
+    logits = SampledLogits(num_sampled, False, remove_accidental_hits)(input, weight, bias, target, sampled)
+    xp = get_array_module(mask)
+    labels = xp.zeros(logits.shape, dtype=logits.dtype)
+    labels[:, 0] = 1
+    errors = binary_cross_entropy(logits, Tensor(labels, device=input.device), "none").sum(axis=1)
+    if not mask.all():
+        errors = errors * Tensor(mask.astype(errors.dtype), device=input.device)
+
+    if reduction == "mean":
+        return errors.sum() / max(int(mask.sum()), 1)
+    if reduction == "sum":
+        return errors.sum()
+    return errors
 
 
 class Dropout(Function):
+    __slots__ = ('p',)
+    deterministic = False
 
     def __init__(self, p: float = 0.5):
         '''
@@ -387,6 +645,8 @@ def dropout(x: Tensor, p: float = 0.5, training: bool = True) -> Tensor:
 
 
 class Embedding(Function):
+    __slots__ = ()
+
     def forward(self, weight: NdArray, indices: NdArray) -> NdArray:
         self.save_for_backward(weight.shape, indices)
         return weight[indices]
@@ -407,12 +667,524 @@ class Embedding(Function):
         # indices 不需要梯度
         return bigger_grad, None
 
+    def backward_per_sample(self, batched: Tuple, grad: NdArray) -> Tuple[NdArray, None]:
+        if batched[0] or not batched[1]:
+            return super().backward_per_sample(batched, grad)
+
+        # 每个样本单独累加到自己的一份权重梯度上
+        w_shape, indices = self.saved_tensors
+        xp = get_array_module(grad)
+        batch_size = grad.shape[0]
+        rows = indices.reshape(batch_size, -1)
+        samples = xp.arange(batch_size)[:, None]
+        grad = grad.reshape(batch_size, rows.shape[1], *w_shape[1:])
+
+        bigger_grad = xp.zeros((batch_size,) + tuple(w_shape), dtype=grad.dtype)
+        if xp is np:
+            np.add.at(bigger_grad, (samples, rows), grad)
+        else:
+            bigger_grad.scatter_add((samples, rows), grad)
+        return bigger_grad, None
+
 
 def embedding(weight: Tensor, indices: Tensor) -> Tensor:
     return Embedding()(weight, indices)
 
 
+# ----卷积----
+CONV_ALGORITHMS = ('auto', 'gemm', 'winograd', 'fft')
+# 'auto'在卷积核面积不小于这个值时考虑FFT
+FFT_MIN_KERNEL_AREA = 81
+
+
+class Conv2d(Function):
+    '''
+    二维卷积，x: (N, C, H, W)，weight: (FN, C // groups, FH, FW)，bias: (FN,)
+    前向传播在输入的滑动窗口视图上直接和卷积核做einsum，不需要先展开成im2col的列矩阵；
+    反向传播复用保存的窗口视图：权重的梯度是 dout 和窗口的缩并，输入的梯度是 dout 和卷积核的缩并再经过col2im还原。
+    分组卷积把通道拆成 (groups, C // groups)，所有组在同一次缩并中完成，不需要逐组循环；
+    depthwise卷积(每组一个输入通道)使用conv.py中逐个卷积核位置广播乘加的实现；
+    1x1、stride为1、不填充的卷积直接在通道维度上做矩阵乘法，前向和反向都不经过滑动窗口和col2im。
+    stride为1的3x3卷积还可以使用Winograd F(2x2, 3x3)算法，大卷积核可以使用FFT，由algorithm选择:
+        'gemm': 上面的实现
+        'winograd': Winograd算法，只支持stride为1、groups为1的3x3卷积
+        'fft': 分块的FFT卷积，只支持groups为1
+        'auto': 根据形状自动选择，开启mytorch.autotune后测量各个算法的耗时选择最快的
+    relu为True时在同一个Function中对输出做ReLU(用于推理时融合Conv + BatchNorm + ReLU)，
+    直接在卷积的输出上原地截断，反向传播用保存的输出是否大于0作为掩码
+    '''
+    __slots__ = ('stride', 'padding', 'groups', 'algorithm', 'relu')
+
+    def __init__(self, stride: int = 1, padding: int = 0, groups: int = 1, algorithm: str = 'auto',
+                 relu: bool = False) -> None:
+        super().__init__()
+        if algorithm not in CONV_ALGORITHMS:
+            raise ValueError(f"unknown convolution algorithm '{algorithm}', expected one of {CONV_ALGORITHMS}")
+        self.stride = stride
+        self.padding = padding
+        self.groups = groups
+        self.algorithm = algorithm
+        self.relu = relu
+
+    def forward(self, x: NdArray, weight: NdArray, bias: NdArray = None) -> NdArray:
+        out = self._conv(x, weight, bias)
+        if self.relu:
+            # 每个分支的输出都是新分配的数组，可以原地修改
+            get_array_module(out).maximum(out, 0, out=out)
+            self.save_for_backward(out)
+        return out
+
+    def _conv(self, x: NdArray, weight: NdArray, bias: NdArray = None) -> NdArray:
+        xp = get_array_module(x)
+        N, C, H, W = x.shape
+        FN, FC, FH, FW = weight.shape
+        G = self.groups
+        assert C == FC * G, f"expected {FC * G} input channels, got {C}"
+
+        algorithm = self._select(weight.shape)
+        if self.algorithm == 'auto':
+            algorithm = self._autotune(x, weight, bias, algorithm)
+        # 按 (N, H, W, C) 存储的输入，输出和输入的梯度也按这个布局存储
+        channels_last = is_channels_last(x)
+        if algorithm == 'fft':
+            out = fft_conv(x, weight, self.stride, self.padding, xp)
+            # 反向传播重新计算输入的频谱，只保存输入本身
+            self.save_for_backward(x.shape, x, weight, bias is not None, algorithm, channels_last)
+            if bias is not None:
+                out += bias[:, None, None]
+            return out
+        if algorithm == 'winograd':
+            out, v = winograd_conv(x, weight, self.padding, xp)
+            self.save_for_backward(x.shape, v, weight, bias is not None, algorithm, channels_last)
+            if bias is not None:
+                out += bias[:, None, None]
+            return out
+
+        if self._pointwise(weight):
+            self.save_for_backward(x.shape, x, weight, bias is not None, algorithm, channels_last)
+            return join_batches(map_batches(lambda x_: self._add_bias(pointwise_conv(x_, weight, G, xp), bias), x))
+
+        # (N, C, out_h, out_w, FH, FW)，只是输入的视图
+        windows = sliding_window(x, FH, FW, self.stride, self.padding, xp)
+        self.save_for_backward(x.shape, windows, weight, bias is not None, algorithm, channels_last)
+        # set_num_threads大于1时按batch分段，在线程池中同时计算
+        return join_batches(map_batches(lambda w: self._window_conv(w, weight, bias, channels_last), windows))
+
+    def _add_bias(self, out: NdArray, bias: NdArray) -> NdArray:
+        if bias is not None:
+            out += bias[:, None, None]
+        return out
+
+    def _window_conv(self, windows: NdArray, weight: NdArray, bias: NdArray, channels_last: bool) -> NdArray:
+        '''滑动窗口视图和卷积核的缩并，返回 (N, FN, out_h, out_w)'''
+        xp = get_array_module(windows)
+        N, C, out_h, out_w, FH, FW = windows.shape
+        FN, FC = weight.shape[:2]
+        G = self.groups
+        if self._depthwise(weight):
+            return self._add_bias(depthwise_conv(windows, weight.reshape(C, FN // C, FH, FW), xp, channels_last), bias)
+
+        if channels_last and G == 1:
+            # 窗口按 (N, out_h, out_w, FH, FW, C) 展开时，列矩阵的每一行由输入中连续的几段拼成，
+            # 结果直接是 (N, out_h, out_w, FN)
+            out = xp.tensordot(windows.transpose(0, 2, 3, 4, 5, 1), weight.transpose(2, 3, 1, 0), axes=3)
+        else:
+            # 通道拆成 (G, C // G)，仍然是视图
+            windows = windows.reshape(N, G, FC, out_h, out_w, FH, FW)
+            out = self._einsum('ngchwij,gfcij->nhwgf', windows, weight.reshape(G, FN // G, FC, FH, FW))
+            out = out.reshape(N, out_h, out_w, FN)
+            if channels_last:
+                out = xp.ascontiguousarray(out)
+        if bias is not None:
+            out += bias
+        return out.transpose(0, 3, 1, 2)
+
+    def _select(self, w_shape: Tuple) -> str:
+        FN, FC, FH, FW = w_shape
+        winograd = (FH, FW) == (3, 3) and self.stride == 1 and self.groups == 1
+        if self.algorithm == 'winograd' and not winograd:
+            raise ValueError("winograd convolution requires a 3x3 kernel, stride 1 and groups 1")
+        if self.algorithm == 'fft' and self.groups != 1:
+            raise ValueError("fft convolution requires groups 1")
+        if self.algorithm != 'auto':
+            return self.algorithm
+
+        # 用NumPy实现时，Winograd输入和输出的变换都是访存密集的逐元素运算，通道数多、矩阵乘法占主要开销时才划算
+        if winograd and min(FN, FC) >= 256:
+            return 'winograd'
+        # FFT的开销主要是每个输入、输出和卷积核通道的变换，以及频域中的小矩阵乘法，
+        # 卷积核大而通道数不多时才比gemm快。stride大于1时要拆成stride * stride个相位，不划算
+        if (FH * FW >= FFT_MIN_KERNEL_AREA and self.stride == 1 and self.groups == 1
+                and FC >= 8 and FC * FN <= 4096):
+            return 'fft'
+        return 'gemm'
+
+    def _autotune(self, x: NdArray, weight: NdArray, bias: NdArray, default: str) -> str:
+        '''开启调优时测量每个支持这个配置的算法，见mytorch.autotune'''
+        tuner = get_autotuner()
+        if not tuner.enabled and tuner.override is None:
+            return default
+        candidates = []
+        for algorithm in CONV_ALGORITHMS[1:]:
+            try:
+                Conv2d(self.stride, self.padding, self.groups, algorithm)._select(weight.shape)
+                candidates.append(algorithm)
+            except ValueError:
+                pass
+        # 训练时反向传播的耗时通常更多，也要计入；输入和权重都不需要梯度时(如冻结的特征提取层)只测量前向传播
+        needs_x, needs_w = (self.needs_input_grad or (False, False))[:2]
+        key = (f"x={x.shape} w={weight.shape} stride={self.stride} padding={self.padding} groups={self.groups} "
+               f"dtype={x.dtype} channels_last={int(is_channels_last(x))} threads={get_num_threads()} "
+               f"backward={int(needs_x)}{int(needs_w)}")
+
+        def measure(algorithm: str) -> None:
+            kernel = Conv2d(self.stride, self.padding, self.groups, algorithm)
+            out = kernel.forward(x, weight, bias)
+            if needs_x or needs_w:
+                kernel.needs_input_grad = (needs_x, needs_w)
+                kernel._grads(get_array_module(out).ones_like(out))
+
+        return tuner.choose(key, candidates, default, measure)
+
+    def _pointwise(self, weight: NdArray) -> bool:
+        '''1x1、stride为1、不填充的卷积，输出的每个位置只依赖同一位置的输入通道'''
+        return weight.shape[2:] == (1, 1) and self.stride == 1 and self.padding == 0
+
+    def _depthwise(self, weight: NdArray) -> bool:
+        '''每组只有一个输入通道时逐个卷积核位置做广播乘加，比在组维度上做批量小矩阵乘法快'''
+        return self.groups > 1 and weight.shape[1] == 1
+
+    def _einsum(self, subscripts: str, *operands: NdArray) -> NdArray:
+        '''
+        subscripts中的g是分组的维度。只有一组时去掉这个维度再计算，
+        因为einsum遇到不参与缩并的公共维度时会多复制一次操作数
+        '''
+        xp = get_array_module(operands[0])
+        if self.groups > 1:
+            return xp.einsum(subscripts, *operands, optimize=True)
+        inputs, output = subscripts.split('->')
+        inputs = inputs.split(',')
+        operands = [op.squeeze(axis=spec.index('g')) for spec, op in zip(inputs, operands)]
+        y = xp.einsum(subscripts.replace('g', ''), *operands, optimize=True)
+        return xp.expand_dims(y, output.index('g'))
+
+    def _grads(self, grad: NdArray, per_sample: bool = False) -> Tuple[NdArray, NdArray]:
+        '''输入和权重的梯度，per_sample为True时权重的梯度在最前面多一个batch维度'''
+        x_shape, windows, weight, _, algorithm, channels_last = self.saved_tensors[:6]
+        xp = get_array_module(grad)
+        needs_x, needs_w = self.needs_input_grad[:2]
+        if algorithm == 'winograd':
+            return winograd_grad(grad, windows, weight, x_shape, self.padding, xp, needs_x, needs_w, per_sample)
+        if algorithm == 'fft':
+            return fft_conv_grad(grad, windows, weight, self.stride, self.padding, xp, needs_x, needs_w, per_sample)
+        if self._pointwise(weight):
+            # 这时保存的是输入本身
+            def shard_grads(g, x):
+                return pointwise_grad(g, x, weight, self.groups, xp, needs_x, needs_w, per_sample)
+        else:
+            def shard_grads(g, w):
+                return self._window_grads(g, w, weight, (g.shape[0],) + x_shape[1:], channels_last, per_sample)
+
+        # 和前向传播一样按batch分段，输入的梯度按段拼接，权重的梯度是各段之和(逐样本梯度也按段拼接)
+        parts = map_batches(shard_grads, grad, windows)
+        gx = join_batches([gx for gx, _ in parts])
+        gws = [gw for _, gw in parts]
+        if gws[0] is None or len(gws) == 1 or per_sample:
+            return gx, join_batches(gws)
+        return gx, sum(gws[1:], gws[0])
+
+    def _window_grads(self, grad: NdArray, windows: NdArray, weight: NdArray, x_shape: Tuple, channels_last: bool,
+                      per_sample: bool) -> Tuple[NdArray, NdArray]:
+        '''使用滑动窗口视图计算的输入和权重的梯度'''
+        xp = get_array_module(grad)
+        needs_x, needs_w = self.needs_input_grad[:2]
+        N, FN, out_h, out_w = grad.shape
+        w_shape = ((N,) if per_sample else ()) + weight.shape
+        gx = gw = None
+
+        if self._depthwise(weight):
+            C = x_shape[1]
+            dout = grad.reshape(N, C, FN // C, out_h, out_w)
+            w = weight.reshape(C, FN // C, *weight.shape[2:])
+            if needs_w:
+                gw = depthwise_grad_weight(dout, windows, xp, per_sample).reshape(w_shape)
+            if needs_x:
+                gx = depthwise_grad_input(dout, w, x_shape, self.stride, self.padding, xp, channels_last)
+            return gx, gw
+
+        G = self.groups
+        FH, FW = weight.shape[2:]
+        if channels_last and G == 1 and not per_sample:
+            return self._grads_channels_last(grad, windows, weight, x_shape, xp, needs_x, needs_w)
+
+        dout = grad.transpose(0, 2, 3, 1).reshape(N, out_h, out_w, G, FN // G)
+        w = weight.reshape((G, FN // G) + weight.shape[1:])
+        if needs_w:
+            windows = windows.reshape(N, G, -1, out_h, out_w, FH, FW)
+            subscripts = 'nhwgf,ngchwij->ngfcij' if per_sample else 'nhwgf,ngchwij->gfcij'
+            gw = self._einsum(subscripts, dout, windows).reshape(w_shape)
+        if needs_x:
+            # (N, out_h, out_w, G, C // G, FH, FW)，合并G和C // G后正好是col2im需要的布局
+            dcol = self._einsum('nhwgf,gfcij->nhwgcij', dout, w)
+            gx = col2im(dcol, x_shape, FH, FW, self.stride, self.padding, xp, channels_last)
+        return gx, gw
+
+    def _grads_channels_last(self, grad: NdArray, windows: NdArray, weight: NdArray, x_shape: Tuple, xp,
+                             needs_x: bool, needs_w: bool) -> Tuple[NdArray, NdArray]:
+        '''groups为1、输入按 (N, H, W, C) 存储时的梯度，和前向传播一样让通道在最后一维'''
+        FH, FW = weight.shape[2:]
+        dout = grad.transpose(0, 2, 3, 1)
+        gx = gw = None
+        if needs_w:
+            gw = xp.tensordot(dout, windows.transpose(0, 2, 3, 4, 5, 1), axes=([0, 1, 2], [0, 1, 2]))
+            gw = gw.transpose(0, 3, 1, 2)
+        if needs_x:
+            # (N, out_h, out_w, FH, FW, C)，col2im按 (C, FH, FW) 的顺序读取，转置只是视图
+            dcol = xp.tensordot(dout, weight.transpose(0, 2, 3, 1), axes=1).transpose(0, 1, 2, 5, 3, 4)
+            gx = col2im(dcol, x_shape, FH, FW, self.stride, self.padding, xp, channels_last=True)
+        return gx, gw
+
+    def _relu_grad(self, grad: NdArray) -> NdArray:
+        '''融合了ReLU时，输出被截断为0的位置没有梯度'''
+        if not self.relu:
+            return grad
+        return grad * (self.saved_tensors[6] > 0)
+
+    def backward(self, grad: NdArray) -> Tuple[NdArray, ...]:
+        grad = self._relu_grad(grad)
+        gx, gw = self._grads(grad)
+        if self.saved_tensors[3]:
+            return gx, gw, grad.sum(axis=(0, 2, 3))
+        return gx, gw
+
+    def backward_per_sample(self, batched: Tuple, grad: NdArray) -> Tuple[NdArray, ...]:
+        if not batched[0] or any(batched[1:]):
+            return super().backward_per_sample(batched, grad)
+
+        # x依赖样本，weight和bias不依赖：每个样本的权重梯度只缩并自己的输出位置
+        grad = self._relu_grad(grad)
+        gx, gw = self._grads(grad, per_sample=True)
+        if self.saved_tensors[3]:
+            return gx, gw, grad.sum(axis=(2, 3))
+        return gx, gw
+
+
+def conv2d(x: Tensor, weight: Tensor, bias: Tensor = None, stride: int = 1, padding: int = 0,
+           groups: int = 1, algorithm: str = 'auto', relu: bool = False) -> Tensor:
+    if bias is None:
+        return Conv2d(stride, padding, groups, algorithm, relu)(x, weight)
+    return Conv2d(stride, padding, groups, algorithm, relu)(x, weight, bias)
+
+
+# ----池化----
+def _pair(value: Union[int, Tuple[int, int]]) -> Tuple[int, int]:
+    return tuple(value) if isinstance(value, (tuple, list)) else (value, value)
+
+
+class MaxPool2d(Function):
+    '''
+    二维最大池化，x: (N, C, H, W)，填充的位置不会被选为最大值。
+    前向传播记录每个输出的最大值在窗口中的位置，反向传播只把梯度写回这些位置
+    '''
+    __slots__ = ('kernel_size', 'stride', 'padding')
+
+    def __init__(self, kernel_size: Union[int, Tuple[int, int]], stride: Union[int, Tuple[int, int]] = None,
+                 padding: int = 0) -> None:
+        super().__init__()
+        self.kernel_size = _pair(kernel_size)
+        self.stride = self.kernel_size if stride is None else _pair(stride)
+        self.padding = padding
+
+    def forward(self, x: NdArray) -> NdArray:
+        xp = get_array_module(x)
+        fill = -xp.inf if x.dtype.kind == 'f' else xp.iinfo(x.dtype).min
+        windows = pool_windows(x, self.kernel_size, self.stride, self.padding, xp, fill)
+        out, pos = max_pool(windows, xp)
+        self.save_for_backward(x.shape, pos, is_channels_last(x))
+        return out
+
+    def backward(self, grad: NdArray) -> NdArray:
+        x_shape, pos, channels_last = self.saved_tensors
+        return max_pool_grad(grad, pos, x_shape, self.kernel_size, self.stride, self.padding, get_array_module(grad),
+                             channels_last)
+
+
+def max_pool2d(x: Tensor, kernel_size: Union[int, Tuple[int, int]], stride: Union[int, Tuple[int, int]] = None,
+               padding: int = 0) -> Tensor:
+    return MaxPool2d(kernel_size, stride, padding)(x)
+
+
+class AvgPool2d(Function):
+    '''
+    二维平均池化，x: (N, C, H, W)，填充的0计入窗口大小
+    '''
+    __slots__ = ('kernel_size', 'stride', 'padding')
+
+    def __init__(self, kernel_size: Union[int, Tuple[int, int]], stride: Union[int, Tuple[int, int]] = None,
+                 padding: int = 0) -> None:
+        super().__init__()
+        self.kernel_size = _pair(kernel_size)
+        self.stride = self.kernel_size if stride is None else _pair(stride)
+        self.padding = padding
+
+    def forward(self, x: NdArray) -> NdArray:
+        xp = get_array_module(x)
+        self.save_for_backward(x.shape, is_channels_last(x))
+        windows = pool_windows(x, self.kernel_size, self.stride, self.padding, xp)
+        if self.stride == self.kernel_size:
+            # 不重叠的窗口就是输入reshape成 (N, C, out_h, kh, out_w, kw)，按内存顺序在拆出来的两个维度上求平均
+            return windows.transpose(0, 1, 2, 4, 3, 5).mean(axis=(3, 5))
+        return windows.mean(axis=(4, 5))
+
+    def backward(self, grad: NdArray) -> NdArray:
+        x_shape, channels_last = self.saved_tensors
+        return avg_pool_grad(grad, x_shape, self.kernel_size, self.stride, self.padding, get_array_module(grad),
+                             channels_last)
+
+
+def avg_pool2d(x: Tensor, kernel_size: Union[int, Tuple[int, int]], stride: Union[int, Tuple[int, int]] = None,
+               padding: int = 0) -> Tensor:
+    return AvgPool2d(kernel_size, stride, padding)(x)
+
+
+def adaptive_avg_pool2d(x: Tensor, output_size: Union[int, Tuple[int, int]]) -> Tensor:
+    '''
+    自适应平均池化，步长是 H // out_h，窗口大小使最后一个窗口正好到达边缘。
+    输出为 (1, 1) 时就是在高和宽上求平均
+    '''
+    out_h, out_w = _pair(output_size)
+    if (out_h, out_w) == (1, 1):
+        return x.mean(axis=(2, 3), keepdims=True)
+    H, W = x.shape[2:]
+    stride = (H // out_h, W // out_w)
+    kernel = (H - (out_h - 1) * stride[0], W - (out_w - 1) * stride[1])
+    return avg_pool2d(x, kernel, stride)
+
+
+# ----归一化----
+class BatchNorm2d(Function):
+    '''
+    (N, C, H, W) 的输入在N、H、W上做批量归一化: y = weight * (x - mean) / sqrt(var + eps) + bias
+    整个归一化是一个Function，反向传播使用闭式解，只保存归一化后的输入x_hat和inv_std = 1 / sqrt(var + eps)：
+        训练模式 dx = weight * inv_std * (dy - mean(dy) - x_hat * mean(dy * x_hat))
+        评估模式 dx = weight * inv_std * dy
+    训练模式下running_mean和running_var在forward中原地更新(方差使用无偏估计)，不经过计算图。
+    jit回放时也会执行这个更新，所以训练模式下不是deterministic的，不能被常量折叠或合并
+    '''
+    __slots__ = ('training', 'momentum', 'eps')
+
+    def __init__(self, training: bool = True, momentum: float = 0.1, eps: float = 1e-5) -> None:
+        super().__init__()
+        self.training = training
+        self.momentum = momentum
+        self.eps = eps
+
+    @property
+    def deterministic(self) -> bool:
+        return not self.training
+
+    def forward(self, x: NdArray, weight: NdArray, bias: NdArray, running_mean: NdArray,
+                running_var: NdArray) -> NdArray:
+        xp = get_array_module(x)
+        if self.training:
+            m = x.size // x.shape[1]
+            # 每个通道只有一个值时方差为0，running_var的无偏估计会除以0
+            if m == 1:
+                raise ValueError(f"Expected more than 1 value per channel when training, got input size {x.shape}")
+            mean = x.mean(axis=(0, 2, 3))
+            centered = x - mean[:, None, None]
+            var = xp.einsum('nchw,nchw->c', centered, centered) / m
+            running_mean *= 1 - self.momentum
+            running_mean += self.momentum * mean
+            running_var *= 1 - self.momentum
+            running_var += self.momentum * m / (m - 1) * var
+        else:
+            var = running_var
+            centered = x - running_mean[:, None, None]
+
+        inv_std = 1 / xp.sqrt(var + self.eps)
+        # 逐元素运算的结果和x的内存布局相同，channels last的输入得到channels last的输出
+        x_hat = centered
+        x_hat *= inv_std[:, None, None]
+        out = x_hat * weight[:, None, None]
+        out += bias[:, None, None]
+        self.save_for_backward(x_hat, inv_std, weight)
+        return out
+
+    def backward(self, grad: NdArray) -> Tuple[NdArray, ...]:
+        x_hat, inv_std, weight = self.saved_tensors
+        xp = get_array_module(grad)
+        needs_x, needs_w, needs_b = self.needs_input_grad[:3]
+        gb = grad.sum(axis=(0, 2, 3))
+        gw = xp.einsum('nchw,nchw->c', grad, x_hat)
+        gx = None
+        if needs_x:
+            scale = (weight * inv_std)[:, None, None]
+            if self.training:
+                # 均值和方差也依赖x，减去dy在mean和var方向上的分量
+                m = grad.size // grad.shape[1]
+                gx = grad - (gb / m)[:, None, None]
+                gx -= x_hat * (gw / m)[:, None, None]
+                gx *= scale
+            else:
+                gx = grad * scale
+        return gx, gw if needs_w else None, gb if needs_b else None, None, None
+
+    def backward_per_sample(self, batched: Tuple, grad: NdArray) -> Tuple[NdArray, ...]:
+        # 训练模式下样本之间通过均值和方差相互影响，没有逐样本的梯度；running统计量不需要梯度，忽略
+        if self.training or not batched[0] or any(batched[1:3]):
+            return super().backward_per_sample(batched, grad)
+        x_hat, inv_std, weight = self.saved_tensors
+        xp = get_array_module(grad)
+        gx = grad * (weight * inv_std)[:, None, None]
+        return gx, xp.einsum('nchw,nchw->nc', grad, x_hat), grad.sum(axis=(2, 3)), None, None
+
+
+def batch_norm2d(x: Tensor, weight: Tensor, bias: Tensor, running_mean: Tensor, running_var: Tensor,
+                 training: bool = True, momentum: float = 0.1, eps: float = 1e-5) -> Tensor:
+    return BatchNorm2d(training, momentum, eps)(x, weight, bias, running_mean, running_var)
+
+
+# ----内存布局----
+class ChannelsLast(Function):
+    '''
+    把 (N, C, H, W) 的输入复制成按 (N, H, W, C) 存储(channels last)，形状和数值都不变。
+    卷积、池化和BatchNorm对这样的输入按同样的布局输出，相邻的层之间不需要转换布局
+    '''
+    __slots__ = ()
+
+    def forward(self, x: NdArray) -> NdArray:
+        if is_channels_last(x):
+            return x
+        return as_channels_last(x, get_array_module(x))
+
+    def backward(self, grad: NdArray) -> NdArray:
+        return grad
+
+
+class ChannelsFirst(Function):
+    '''把按任意布局存储的输入复制成连续的 (N, C, H, W)'''
+    __slots__ = ()
+
+    def forward(self, x: NdArray) -> NdArray:
+        return get_array_module(x).ascontiguousarray(x)
+
+    def backward(self, grad: NdArray) -> NdArray:
+        return grad
+
+
+def to_channels_last(x: Tensor) -> Tensor:
+    '''在模型的输入处转换成channels last布局'''
+    return ChannelsLast()(x)
+
+
+def to_channels_first(x: Tensor) -> Tensor:
+    '''在需要连续的 (N, C, H, W) 数组的地方(例如和其他框架交换数据)转换回来'''
+    return ChannelsFirst()(x)
+
 class MaskedSelect(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray, mask: NdArray) -> NdArray:
         self.save_for_backward(x.shape, mask)
         return x[mask]
@@ -434,6 +1206,8 @@ def masked_select(x: Tensor, mask):
 class Split(Function):
     '''Stack的逆操作'''
 
+    __slots__ = ()
+
     def forward(self, inputs: NdArray, axis: int) -> NdArray:
         xp = get_array_module(inputs)
         xs = xp.split(inputs, inputs.shape[axis], axis)
@@ -465,6 +1239,8 @@ class Stack(Function):
 
     '''
 
+    __slots__ = ()
+
     def forward(self, *inputs: Union[Tuple[NdArray, ...], List[NdArray]], axis: int) -> NdArray:
         xp = get_array_module(inputs[0])
         ret = xp.stack(inputs, axis=axis)
@@ -488,6 +1264,8 @@ class Cat(Function):
     在原有某一维度进行拼接，拼接的结果是Tensor的总维数不变，其中用于拼接的那一维度等于各分量维度之和
     '''
 
+    __slots__ = ()
+
     def forward(self, *inputs: Union[Tuple[Tensor, ...], List[Tensor]], axis: int = -1) -> NdArray:
         xp = get_array_module(inputs[0])
         self.save_for_backward(inputs, axis, xp)
@@ -515,6 +1293,8 @@ class Chunk(Function):
     cat的逆操作，将Tensor沿某一维分开，chunks为分割的份数，axis为分割的维度
     '''
 
+    __slots__ = ()
+
     def forward(self, inputs: NdArray, chunks: Union[int, NdArray], axis: int) -> Tuple[NdArray]:
         xp = get_array_module(inputs)
         ret = xp.array_split(inputs, chunks, axis)
@@ -534,6 +1314,8 @@ def chunk(input: Tensor, chunks: int, axis=0):
 
 
 class Flip(Function):
+    __slots__ = ()
+
     def forward(self, inputs: NdArray, axis: Union[int, Tuple] = None) -> NdArray:
         xp = get_array_module(inputs)
         self.save_for_backward(axis, xp)
@@ -549,13 +1331,18 @@ def flip(x: Tensor, axis: Union[int, Tuple] = None):
 
 
 class Bmm(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray, y: NdArray) -> NdArray:
         self.save_for_backward(x, y)
         return x @ y
 
     def backward(self, grad: NdArray) -> Tuple[NdArray, NdArray]:
         x, y = self.saved_tensors
-        return grad @ y.swapaxes(-2, -1), x.swapaxes(-2, -1) @ grad
+        needs_x, needs_y = self.needs_input_grad
+        gx = grad @ y.swapaxes(-2, -1) if needs_x else None
+        gy = x.swapaxes(-2, -1) @ grad if needs_y else None
+        return gx, gy
 
 
 def bmm(x: Tensor, y: Tensor):
@@ -0,0 +1,163 @@
+import copy
+from typing import List, Optional, Sequence, Tuple, Union
+
+from mytorch.cuda import get_array_module
+from mytorch.module import Module, Conv2D, Conv2d, Linear, BatchNorm2d, ReLU, Identity, Sequential
+from mytorch.paramater import Parameter
+from mytorch.tensor import Tensor, no_grad, ensure_tensor
+
+'''
+推理时的层融合。评估模式下BatchNorm2d使用固定的running_mean和running_var，是逐通道的仿射变换
+    y = gamma * (conv(x) + b - mean) / sqrt(var + eps) + beta
+可以合并进前一层卷积的权重和偏置：
+    scale = gamma / sqrt(var + eps)
+    w' = w * scale (按输出通道缩放)
+    b' = (b - mean) * scale + beta
+后面的ReLU由卷积的Function在输出上原地计算(F.conv2d的relu)。
+融合后每组 Conv -> BatchNorm -> ReLU 只剩一次卷积，省去BatchNorm的几次逐元素运算、ReLU以及它们的中间结果。
+被融合掉的BatchNorm和ReLU替换成Identity，模型的forward不需要修改
+
+可以融合的组合(按forward中的执行顺序)：
+    [Conv2D/Conv2d, BatchNorm2d], [Conv2D/Conv2d, BatchNorm2d, ReLU], [Conv2D/Conv2d, ReLU], [Linear, ReLU]
+BatchNorm2d归一化的是第1维，Linear变换的是最后一维，两者不是同一个维度，所以Linear后面的BatchNorm2d不能折叠
+'''
+
+_CONV_LAYERS = (Conv2D, Conv2d)
+
+
+def _check_group(modules: Sequence[Module]) -> Optional[str]:
+    '''不能融合时返回原因'''
+    if len(modules) not in (2, 3):
+        return f"expected 2 or 3 modules, got {len(modules)}"
+    layer, rest = modules[0], list(modules[1:])
+    if not isinstance(layer, _CONV_LAYERS + (Linear,)):
+        return f"the first module must be Conv2D, Conv2d or Linear, got {type(layer).__name__}"
+    if getattr(layer, 'relu', False):
+        return "the layer already has a fused ReLU"
+    if isinstance(rest[0], BatchNorm2d):
+        bn = rest.pop(0)
+        if isinstance(layer, Linear):
+            return "BatchNorm2d normalizes axis 1 while Linear transforms the last axis, they cannot be folded"
+        if bn.training:
+            return "BatchNorm2d must be in eval mode, call model.eval() first"
+        if bn.num_features != layer.out_channels:
+            return f"BatchNorm2d has {bn.num_features} features but the layer has {layer.out_channels} output channels"
+    if len(rest) > 1 or (rest and not isinstance(rest[0], ReLU)):
+        return "expected [layer, BatchNorm2d], [layer, BatchNorm2d, ReLU] or [layer, ReLU], got [" + \
+               ', '.join(type(m).__name__ for m in modules) + "]"
+    return None
+
+
+def fold_batchnorm(layer: Module, bn: BatchNorm2d) -> None:
+    '''把评估模式的bn合并进卷积layer的权重和偏置，原地修改layer'''
+    weight = layer.weight.data
+    xp = get_array_module(weight)
+    scale = bn.weight.data / xp.sqrt(bn.running_var.data + bn.eps)
+    bias = layer.bias.data if layer.bias is not None else 0
+    bias = (bias - bn.running_mean.data) * scale + bn.bias.data
+
+    layer.weight.data = (weight * scale.reshape(-1, 1, 1, 1)).astype(weight.dtype)
+    if layer.bias is not None:
+        layer.bias.data = bias.astype(layer.bias.dtype)
+    else:
+        layer.bias = Parameter(bias.astype(weight.dtype), device=layer.weight.device)
+
+
+def _split(name: str) -> Tuple[str, str]:
+    parent, _, child = name.rpartition('.')
+    return parent, child
+
+
+def _fuse_group(model: Module, names: Sequence[str]) -> None:
+    modules = [model.get_submodule(name) for name in names]
+    reason = _check_group(modules)
+    if reason is not None:
+        raise ValueError(f"cannot fuse {list(names)}: {reason}")
+
+    layer = copy.deepcopy(modules[0])
+    for module in modules[1:]:
+        if isinstance(module, BatchNorm2d):
+            fold_batchnorm(layer, module)
+        else:
+            layer.relu = True
+
+    parent, child = _split(names[0])
+    model.get_submodule(parent).add_module(child, layer)
+    for name in names[1:]:
+        parent, child = _split(name)
+        model.get_submodule(parent).add_module(child, Identity())
+
+
+def find_fusable_modules(model: Module) -> List[List[str]]:
+    '''
+    找出model中可以融合的模块组：
+        Sequential中相邻的子模块按注册顺序执行，直接匹配可以融合的组合；
+        其他模块的forward顺序无法从结构上看出，需要自己定义fuse_groups()，返回相对自己的模块名
+    '''
+    groups = []
+    for prefix, module in model.named_modules():
+        dot = prefix + '.' if prefix else ''
+        if isinstance(module, Sequential):
+            children = list(module._modules.items())
+            i = 0
+            while i < len(children):
+                for size in (3, 2):
+                    run = children[i:i + size]
+                    if len(run) == size and _check_group([m for _, m in run]) is None:
+                        groups.append([dot + name for name, _ in run])
+                        i += size
+                        break
+                else:
+                    i += 1
+        elif hasattr(module, 'fuse_groups'):
+            for group in module.fuse_groups():
+                if _check_group([module.get_submodule(name) for name in group]) is None:
+                    groups.append([dot + name for name in group])
+    return groups
+
+
+def _outputs(result) -> Tuple[Tensor, ...]:
+    if isinstance(result, (tuple, list)):
+        return tuple(result)
+    return (result,)
+
+
+def fuse_modules(model: Module, modules_to_fuse: Optional[List[List[str]]] = None, inplace: bool = False,
+                 example_inputs: Union[Tensor, Tuple[Tensor], None] = None, rtol: float = 1e-4,
+                 atol: float = 1e-5) -> Module:
+    '''
+    融合Conv + BatchNorm + ReLU，用于推理，融合前需要先调用model.eval()
+    Args:
+        model: 要融合的模型
+        modules_to_fuse: 模块名的列表的列表，比如[['conv1', 'bn1', 'relu1'], ['layers.0.conv', 'layers.0.bn']]，
+            每组按执行顺序排列。为None时使用find_fusable_modules找到的所有组
+        inplace: 为False时先复制model，不修改原模型
+        example_inputs: 不为None时分别用融合前后的模型计算一次输出，不一致时抛出AssertionError
+        rtol, atol: 比较输出时的容差
+
+    Returns:
+        融合后的模型，融合掉的BatchNorm和ReLU被替换成Identity
+    '''
+    if example_inputs is not None:
+        if not isinstance(example_inputs, (tuple, list)):
+            example_inputs = (example_inputs,)
+        example_inputs = tuple(ensure_tensor(x) for x in example_inputs)
+        with no_grad():
+            expected = _outputs(model(*example_inputs))
+
+    if not inplace:
+        model = copy.deepcopy(model)
+    if modules_to_fuse is None:
+        modules_to_fuse = find_fusable_modules(model)
+    for names in modules_to_fuse:
+        _fuse_group(model, names)
+
+    if example_inputs is not None:
+        with no_grad():
+            actual = _outputs(model(*example_inputs))
+        for i, (x, y) in enumerate(zip(expected, actual)):
+            xp = get_array_module(x.data)
+            if x.shape != y.shape or not xp.allclose(x.data, y.data, rtol=rtol, atol=atol):
+                diff = float(xp.abs(x.data - y.data).max()) if x.shape == y.shape else None
+                raise AssertionError(f"output {i} of the fused model mismatch, max abs diff {diff}")
+    return model
@@ -0,0 +1,731 @@
+import copy
+import operator
+from collections import Counter
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from mytorch.cuda import get_array_module, ndarray
+from mytorch.module import Module
+from mytorch.ops import Function, MulConstant, AddConstant
+from mytorch.paramater import Parameter
+from mytorch.tensor import Tensor, Config, using_config, ensure_tensor
+
+'''
+jit.py 跟踪Module的一次前向传播，把Function调用序列记录成计算图，之后直接回放NumPy(CuPy)的forward/backward，
+跳过每个算子的Tensor/Function构造、Config查询以及反向传播时的堆调度，适合输入形状固定的训练和推理循环
+
+只有经过Function的计算才会被记录，因此:
+1. 依赖数据的Python控制流(如 if x.sum() > 0)会被固定为跟踪时走的分支
+2. 直接操作NdArray得到的Tensor会被当成常量，如果它需要梯度，跟踪时会报错
+'''
+
+
+class Tracer:
+    '''
+    通过Config.tracer挂到Function.__call__上，按调用顺序记录每个Function和它的输入输出
+    '''
+
+    def __init__(self, parent: "Tracer" = None) -> None:
+        self.records = []
+        # 嵌套跟踪时(比如在跟踪中第一次调用另一个TracedModule)，外层的Tracer也要看到这些调用
+        self.parent = parent
+
+    def record(self, fn: Function, xs: Tuple, kwargs: dict, outputs: List[Tensor]) -> None:
+        self.records.append((fn, xs, kwargs, outputs))
+        if self.parent is not None:
+            self.parent.record(fn, xs, kwargs, outputs)
+
+
+class Node:
+    '''
+    计算图中的一次Function调用
+    '''
+    __slots__ = ('kernel', 'args', 'refs', 'kwargs', 'outputs')
+
+    def __init__(self, kernel: Function, args: list, refs: tuple, kwargs: dict, outputs: tuple) -> None:
+        # 执行forward/backward的Function，是跟踪时Function的副本，不引用跟踪时的Tensor
+        self.kernel = kernel
+        # 位置参数，来自计算图的位置为None，其余是常量(包括不需要梯度的叶子Tensor的数组)
+        self.args = args
+        # (参数位置, 值编号)，指出哪些位置参数来自计算图
+        self.refs = refs
+        self.kwargs = kwargs
+        # 输出的值编号
+        self.outputs = outputs
+
+    def __repr__(self) -> str:
+        args = list(self.args)
+        for pos, idx in self.refs:
+            args[pos] = f"%{idx}"
+        args = [a if isinstance(a, str) else _const_repr(a) for a in args]
+        args.extend(f"{k}={_const_repr(v)}" for k, v in self.kwargs.items())
+        args = ", ".join(args)
+        outputs = ", ".join(f"%{idx}" for idx in self.outputs)
+        return f"{outputs} = {self.kernel.__class__.__name__}({args})"
+
+
+def _const_repr(value) -> str:
+    shape = getattr(value, "shape", None)
+    if shape is not None and shape != ():
+        return f"array{tuple(shape)}"
+    return repr(value)
+
+
+class Graph:
+    '''
+    跟踪得到的计算图，所有的值用整数编号
+    inputs: forward输入的值编号
+    states: (值编号, 所在的字典, 名称)，每次执行时从Module的_parameters和_buffers中实时读取
+    outputs: forward输出的值编号
+    writes: (值编号, 所在的字典, 名称)，前向传播中对buffer的更新，比如BatchNorm的running_mean
+    '''
+
+    def __init__(self) -> None:
+        self.num_values = 0
+        self.inputs = []
+        self.states = []
+        self.nodes = []
+        self.outputs = []
+        self.writes = []
+        # 常量折叠得到的、被outputs或writes直接使用的值
+        self.constants = {}
+        # forward返回的是否是元组
+        self.return_tuple = False
+
+    def new_value(self) -> int:
+        self.num_values += 1
+        return self.num_values - 1
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def copy(self) -> "Graph":
+        '''复制图的结构，kernel是共享的，优化时不会修改原图'''
+        graph = copy.copy(self)
+        graph.inputs = list(self.inputs)
+        graph.states = list(self.states)
+        graph.nodes = [Node(n.kernel, list(n.args), n.refs, dict(n.kwargs), n.outputs) for n in self.nodes]
+        graph.outputs = list(self.outputs)
+        graph.writes = list(self.writes)
+        graph.constants = dict(self.constants)
+        return graph
+
+    def __repr__(self) -> str:
+        lines = [f"graph(inputs={['%' + str(idx) for idx in self.inputs]}, "
+                 f"states={[f'%{idx}:{name}' for idx, _, name in self.states]})"]
+        lines.extend("    " + repr(node) for node in self.nodes)
+        lines.append(f"    return {['%' + str(idx) for idx in self.outputs]}")
+        return "\n".join(lines)
+
+
+def _state_slots(module: Module) -> List[Tuple[dict, str, Tensor]]:
+    '''收集所有参数和buffer所在的字典及名称，共享的Tensor只保留一次'''
+    slots = []
+    seen = set()
+    for m in module.modules():
+        for d in (m._parameters, m.__dict__.get('_buffers', {})):
+            for name, tensor in d.items():
+                if tensor is None or id(tensor) in seen:
+                    continue
+                seen.add(id(tensor))
+                slots.append((d, name, tensor))
+    return slots
+
+
+def _build_graph(inputs: Tuple[Tensor], slots: list, tracer: Tracer, result) -> Graph:
+    graph = Graph()
+    # id(Tensor) -> 值编号，tracer.records持有所有Tensor的引用，跟踪期间id不会被复用
+    values = {}
+    for x in inputs:
+        values[id(x)] = graph.new_value()
+        graph.inputs.append(values[id(x)])
+    for d, name, tensor in slots:
+        values[id(tensor)] = graph.new_value()
+        graph.states.append((values[id(tensor)], d, name))
+
+    for fn, xs, kwargs, outputs in tracer.records:
+        args = []
+        refs = []
+        for pos, x in enumerate(xs):
+            if isinstance(x, Tensor):
+                idx = values.get(id(x))
+                if idx is None:
+                    if x.requires_grad:
+                        raise RuntimeError(f"cannot trace {fn.__class__.__name__}: one of its inputs requires grad "
+                                           "but is neither a forward input, a parameter nor the output of a Function, "
+                                           "the module probably computes it on raw arrays")
+                    # 不需要梯度的叶子Tensor当作常量
+                    args.append(x.data)
+                    continue
+                args.append(None)
+                refs.append((pos, idx))
+            else:
+                args.append(x)
+
+        kernel = copy.copy(fn)
+        kernel.release()
+        kernel.outputs = None
+        kernel.needs_input_grad = None
+
+        outs = []
+        for output in outputs:
+            values[id(output)] = graph.new_value()
+            outs.append(values[id(output)])
+        graph.nodes.append(Node(kernel, args, tuple(refs), kwargs, tuple(outs)))
+
+    graph.return_tuple = isinstance(result, (tuple, list))
+    for y in (result if graph.return_tuple else (result,)):
+        if not isinstance(y, Tensor) or id(y) not in values:
+            raise RuntimeError("cannot trace: every output of forward must be a Tensor computed by Functions")
+        graph.outputs.append(values[id(y)])
+
+    # 前向传播中被替换的buffer，回放时需要写回
+    for d, name, tensor in slots:
+        new = d.get(name)
+        if new is not tensor and id(new) in values:
+            graph.writes.append((values[id(new)], d, name))
+
+    return graph
+
+
+class _Plan:
+    '''
+    由Graph编译得到的执行计划，回放时只做列表操作和kernel调用
+    '''
+
+    def __init__(self, graph: Graph) -> None:
+        self.graph = graph
+        self.num_values = graph.num_values
+        # _Replay的输入依次是forward的输入和所有状态
+        self.slots = tuple(graph.inputs) + tuple(idx for idx, _, _ in graph.states)
+        self.steps = [(node.kernel, node.args, node.refs, node.kwargs, node.outputs) for node in graph.nodes]
+        self.outputs = tuple(graph.outputs)
+        self.writes = tuple(graph.writes)
+        self.constants = tuple(graph.constants.items())
+        # 优化前的图，用于重新优化和verify
+        self.source = graph
+        self._backward_steps = {}
+
+    def backward_steps(self, needs_input_grad: Tuple[bool]) -> list:
+        '''
+        根据_Replay每个输入是否需要梯度，得到需要反向传播的节点(逆序)，
+        每个节点带上它自己的needs_input_grad和需要梯度的参数位置
+        '''
+        steps = self._backward_steps.get(needs_input_grad)
+        if steps is not None:
+            return steps
+
+        requires = {idx for idx, need in zip(self.slots, needs_input_grad) if need}
+        steps = []
+        for i, (kernel, args, refs, _, outs) in enumerate(self.steps):
+            grad_refs = tuple((pos, idx) for pos, idx in refs if idx in requires)
+            if not grad_refs:
+                continue
+            needs = [False] * len(args)
+            for pos, _ in grad_refs:
+                needs[pos] = True
+            requires.update(outs)
+            steps.append((i, kernel, needs, grad_refs, outs))
+        steps.reverse()
+        self._backward_steps[needs_input_grad] = steps
+        return steps
+
+
+class _Replay(Function):
+    '''
+    把整个计划当成一个Function执行，这样回放的结果可以和普通的Tensor运算混合使用，
+    反向传播也只需要调度这一个节点
+    '''
+    __slots__ = ('plan', 'saved')
+
+    def __init__(self, plan: _Plan) -> None:
+        super().__init__()
+        self.plan = plan
+        # 这次回放中每个节点的kernel副本，带着它们forward保存的中间结果
+        self.saved = None
+
+    def forward(self, *xs):
+        plan = self.plan
+        env, self.saved = _run_forward(plan, xs, self.needs_input_grad)
+        for idx, d, name in plan.writes:
+            d[name] = Tensor(env[idx])
+        return tuple(env[idx] for idx in plan.outputs)
+
+    def backward(self, *grads):
+        return _run_backward(self.plan, self.saved, tuple(self.needs_input_grad), grads)
+
+    def release(self) -> None:
+        super().release()
+        self.saved = None
+
+
+def _run_forward(plan: _Plan, xs: Tuple, needs_input_grad: Optional[Sequence[bool]] = None):
+    '''
+    依次执行每个节点的forward，返回所有值和每个节点执行forward的kernel。
+    计划中的kernel在多次回放之间共享，每次回放使用它们的副本，中间结果保存在副本上，
+    这样同一个计划的多次回放(比如两次forward之后再backward，或者并行反向传播)不会互相覆盖。
+    needs_input_grad不为None时会反向传播，和直接调用Function一样，forward时每个kernel就带上它自己的needs_input_grad
+    '''
+    step_needs = {}
+    if needs_input_grad is not None:
+        step_needs = {i: needs for i, _, needs, _, _ in plan.backward_steps(tuple(needs_input_grad))}
+
+    env = [None] * plan.num_values
+    for idx, x in zip(plan.slots, xs):
+        env[idx] = x
+    for idx, value in plan.constants:
+        env[idx] = value
+
+    kernels = []
+    for i, (template, args, refs, kwargs, outs) in enumerate(plan.steps):
+        args = args.copy()
+        for pos, idx in refs:
+            args[pos] = env[idx]
+        kernel = copy.copy(template)
+        kernel.saved_tensors = []
+        kernel.needs_input_grad = step_needs.get(i)
+        ys = kernel.forward(*args, **kwargs)
+        kernels.append(kernel)
+        if isinstance(ys, tuple):
+            for idx, y in zip(outs, ys):
+                env[idx] = y
+        else:
+            env[outs[0]] = ys
+    return env, kernels
+
+
+def _run_backward(plan: _Plan, kernels: list, needs_input_grad: Tuple[bool], grads: Tuple) -> Tuple:
+    '''
+    逆序执行需要梯度的节点的backward，返回每个输入(forward的输入和状态)的梯度
+    kernels是_run_forward返回的、这次回放中每个节点的kernel
+    '''
+    values = {}
+    for idx, gy in zip(plan.outputs, grads):
+        if gy is not None:
+            _accumulate(values, idx, gy)
+
+    for i, _, needs, grad_refs, outs in plan.backward_steps(needs_input_grad):
+        gys = [values.pop(idx, None) for idx in outs]
+        if all(gy is None for gy in gys):
+            continue
+        kernel = kernels[i]
+        kernel.needs_input_grad = needs
+        gxs = kernel.backward(*gys)
+        kernel.saved_tensors = []
+        if not isinstance(gxs, tuple):
+            gxs = (gxs,)
+        for pos, idx in grad_refs:
+            if pos < len(gxs) and gxs[pos] is not None:
+                _accumulate(values, idx, gxs[pos])
+
+    return tuple(values.get(idx) for idx in plan.slots)
+
+
+def _accumulate(values: dict, idx: int, grad) -> None:
+    prev = values.get(idx)
+    values[idx] = grad if prev is None else prev + grad
+
+
+def _trace(module: Module, inputs: Tuple[Tensor]):
+    '''正常执行一次forward并记录，返回forward的结果和执行计划'''
+    slots = _state_slots(module)
+    tracer = Tracer(Config.tracer)
+    with using_config('tracer', tracer):
+        result = module(*inputs)
+    graph = _build_graph(inputs, slots, tracer, result)
+    return result, _Plan(graph)
+
+
+# region 图优化
+
+def _uses(graph: Graph) -> Counter:
+    '''每个值被节点、outputs和writes使用的次数'''
+    uses = Counter()
+    for node in graph.nodes:
+        for _, idx in node.refs:
+            uses[idx] += 1
+    for idx in graph.outputs:
+        uses[idx] += 1
+    for idx, _, _ in graph.writes:
+        uses[idx] += 1
+    return uses
+
+
+def _evaluate(node: Node) -> Tuple:
+    '''在编译期执行节点，使用kernel的副本，不影响回放'''
+    kernel = copy.copy(node.kernel)
+    kernel.saved_tensors = []
+    ys = kernel.forward(*node.args, **node.kwargs)
+    return ys if isinstance(ys, tuple) else (ys,)
+
+
+# 可以合并的常量运算，(x op a) op b => x op (a op b)
+_CHAIN_FUNCTIONS = {MulConstant: operator.mul, AddConstant: operator.add}
+
+
+def _chain_constant(node: Node):
+    '''节点形如 MulConstant(%x, 标量) 时返回标量，否则返回None'''
+    if type(node.kernel) not in _CHAIN_FUNCTIONS or node.kwargs or len(node.args) != 2:
+        return None
+    if len(node.refs) != 1 or node.refs[0][0] != 0 or not np.isscalar(node.args[1]):
+        return None
+    return node.args[1]
+
+
+def fold_constants(graph: Graph, freeze_buffers: bool = False) -> int:
+    '''
+    常量折叠:
+    1. 所有参数都是常量的节点在编译期执行，结果作为常量代入使用它的节点
+    2. 连续的MulConstant/AddConstant合并成一个，如 (x * a) * b => x * (a * b)，合并后不再使用的节点会被删除
+    Args:
+        graph: 计算图，原地修改
+        freeze_buffers: 为True时，前向传播中没有被更新的buffer也当作常量，
+            比如评估模式下BatchNorm的running_mean，之后修改这些buffer(如load_state_dict)不会再生效
+
+    Returns:
+        删除的节点数
+    '''
+    consts = {}
+    if freeze_buffers:
+        written = {(id(d), name) for _, d, name in graph.writes}
+        for idx, d, name in graph.states:
+            tensor = d[name]
+            if not isinstance(tensor, Parameter) and (id(d), name) not in written:
+                consts[idx] = tensor.data
+
+    removed = 0
+    chains = {}  # 值编号 -> 产生它的可合并节点
+    merged = []  # 被合并的节点，之后可能不再被使用
+    nodes = []
+    for node in graph.nodes:
+        refs = []
+        for pos, idx in node.refs:
+            if idx in consts:
+                node.args[pos] = consts[idx]
+            else:
+                refs.append((pos, idx))
+        node.refs = tuple(refs)
+
+        if not node.refs and node.kernel.deterministic:
+            for idx, y in zip(node.outputs, _evaluate(node)):
+                consts[idx] = y
+            removed += 1
+            continue
+
+        c = _chain_constant(node)
+        if c is not None:
+            producer = chains.get(node.refs[0][1])
+            if producer is not None and type(producer.kernel) is type(node.kernel):
+                node.args = [None, _CHAIN_FUNCTIONS[type(node.kernel)](producer.args[1], c)]
+                node.refs = producer.refs
+                merged.append(producer)
+            chains[node.outputs[0]] = node
+        nodes.append(node)
+
+    graph.nodes = nodes
+    for idx in chain(graph.outputs, (idx for idx, _, _ in graph.writes)):
+        if idx in consts:
+            graph.constants[idx] = consts[idx]
+
+    # 删除合并后不再使用的节点，逆序处理，这样连续合并的节点也能被删除
+    uses = _uses(graph)
+    dead = set()
+    for node in reversed(merged):
+        if all(uses[idx] == 0 for idx in node.outputs):
+            dead.add(id(node))
+            for _, idx in node.refs:
+                uses[idx] -= 1
+    graph.nodes = [node for node in graph.nodes if id(node) not in dead]
+    return removed + len(dead)
+
+
+class _Ref:
+    '''_node_key中表示来自计算图的参数'''
+    __slots__ = ('idx',)
+
+    def __init__(self, idx: int) -> None:
+        self.idx = idx
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, _Ref) and other.idx == self.idx
+
+    def __hash__(self) -> int:
+        return hash(('%', self.idx))
+
+
+def _freeze(value):
+    '''把参数转换成可以哈希的键，数组和Tensor按对象区分'''
+    if isinstance(value, _Ref):
+        return value
+    if isinstance(value, (np.ndarray, ndarray, Tensor)):
+        return 'object', id(value)
+    if isinstance(value, (tuple, list)):
+        return type(value), tuple(_freeze(v) for v in value)
+    if isinstance(value, slice):
+        return slice, _freeze(value.start), _freeze(value.stop), _freeze(value.step)
+    return type(value), value
+
+
+def _kernel_attributes(kernel: Function) -> Tuple:
+    '''Function子类在__slots__中声明的属性，比如Softmax的axis'''
+    names = []
+    for cls in type(kernel).__mro__:
+        if cls is Function:
+            break
+        slots = cls.__dict__.get('__slots__', ())
+        names.extend((slots,) if isinstance(slots, str) else slots)
+    return tuple(_freeze(getattr(kernel, name, None)) for name in names)
+
+
+def _node_key(node: Node):
+    args = list(node.args)
+    for pos, idx in node.refs:
+        args[pos] = _Ref(idx)
+    try:
+        key = (type(node.kernel), _kernel_attributes(node.kernel), _freeze(args),
+               tuple(sorted((k, _freeze(v)) for k, v in node.kwargs.items())))
+        hash(key)
+    except TypeError:
+        # 有无法哈希的参数，不参与合并
+        return None
+    return key
+
+
+def _replace_values(graph: Graph, mapping: dict) -> None:
+    for node in graph.nodes:
+        node.refs = tuple((pos, mapping.get(idx, idx)) for pos, idx in node.refs)
+    graph.outputs = [mapping.get(idx, idx) for idx in graph.outputs]
+    graph.writes = [(mapping.get(idx, idx), d, name) for idx, d, name in graph.writes]
+
+
+def eliminate_common_subexpressions(graph: Graph) -> int:
+    '''
+    公共子表达式消除: 类型、属性、参数都相同的节点只计算一次，比如重复的 x.mean(axis=(0, 2, 3))
+    随机算子(deterministic为False)不参与合并
+    Returns:
+        删除的节点数
+    '''
+    seen = {}
+    mapping = {}
+    nodes = []
+    for node in graph.nodes:
+        node.refs = tuple((pos, mapping.get(idx, idx)) for pos, idx in node.refs)
+        if node.kernel.deterministic:
+            key = _node_key(node)
+            if key is not None:
+                prev = seen.get(key)
+                if prev is not None:
+                    mapping.update(zip(node.outputs, prev.outputs))
+                    continue
+                seen[key] = node
+        nodes.append(node)
+
+    removed = len(graph.nodes) - len(nodes)
+    graph.nodes = nodes
+    _replace_values(graph, mapping)
+    return removed
+
+
+def eliminate_dead_nodes(graph: Graph) -> int:
+    '''
+    死节点消除: 删除输出没有被forward返回、没有写回buffer、也没有被其他节点使用的节点
+    Returns:
+        删除的节点数
+    '''
+    live = set(graph.outputs)
+    live.update(idx for idx, _, _ in graph.writes)
+    nodes = []
+    for node in reversed(graph.nodes):
+        if any(idx in live for idx in node.outputs):
+            nodes.append(node)
+            live.update(idx for _, idx in node.refs)
+    nodes.reverse()
+
+    removed = len(graph.nodes) - len(nodes)
+    graph.nodes = nodes
+    return removed
+
+
+_PASSES = {
+    'constant_folding': fold_constants,
+    'cse': eliminate_common_subexpressions,
+    'dce': eliminate_dead_nodes,
+}
+
+
+def optimize(graph: Graph, passes: Optional[Iterable[str]] = None, freeze_buffers: bool = False) -> Dict[str, int]:
+    '''
+    依次对计算图执行优化，原地修改graph
+    Args:
+        graph: 计算图
+        passes: 要执行的优化，默认为 constant_folding, cse, dce
+        freeze_buffers: 传给constant_folding
+
+    Returns:
+        每个优化删除的节点数
+    '''
+    if passes is None:
+        passes = tuple(_PASSES)
+    report = {}
+    for name in passes:
+        if name not in _PASSES:
+            raise ValueError(f"unknown pass '{name}', expected one of {list(_PASSES)}")
+        if name == 'constant_folding':
+            removed = fold_constants(graph, freeze_buffers)
+        else:
+            removed = _PASSES[name](graph)
+        report[name] = report.get(name, 0) + removed
+    return report
+
+
+def _check_run(graph: Graph, xs: list, needs_input_grad: Tuple[bool], seed: int):
+    '''执行一次前向和反向传播，随机算子使用相同的种子'''
+    plan = _Plan(graph)
+    state = np.random.get_state()
+    np.random.seed(seed)
+    try:
+        env, kernels = _run_forward(plan, xs, needs_input_grad)
+    finally:
+        np.random.set_state(state)
+    outputs = [env[idx] for idx in plan.outputs]
+    grads = [get_array_module(y).ones_like(y) if y.dtype.kind == 'f' else None for y in outputs]
+    grads = _run_backward(plan, kernels, needs_input_grad, grads)
+    writes = [env[idx] for idx, _, _ in plan.writes]
+    return outputs, writes, grads
+
+
+def verify(reference: Graph, optimized: Graph, inputs: Iterable, rtol: float = 1e-5, atol: float = 1e-6,
+           seed: int = 0) -> bool:
+    '''
+    使用相同的输入执行两个图的前向和反向传播，比较输出、写回的buffer以及输入和参数的梯度，
+    不一致时抛出AssertionError。执行时不会修改Module中的buffer
+    Args:
+        reference: 优化前的图
+        optimized: 由reference.copy()优化得到的图
+        inputs: forward的输入
+    '''
+    if reference.states != optimized.states or len(reference.inputs) != len(optimized.inputs):
+        raise ValueError("graphs have different inputs, the optimized graph must come from reference.copy()")
+
+    xs = [ensure_tensor(x).data for x in inputs]
+    states = [d[name] for _, d, name in reference.states]
+    needs = tuple(x.dtype.kind == 'f' for x in xs) + tuple(t.requires_grad for t in states)
+    xs.extend(t.data for t in states)
+
+    expected = _check_run(reference, xs, needs, seed)
+    actual = _check_run(optimized, xs, needs, seed)
+    for kind, a, b in zip(('output', 'buffer', 'grad'), expected, actual):
+        for i, (x, y) in enumerate(zip(a, b)):
+            if x is None and y is None:
+                continue
+            if x is None or y is None or x.shape != y.shape:
+                raise AssertionError(f"{kind} {i} mismatch: {getattr(x, 'shape', None)} vs {getattr(y, 'shape', None)}")
+            xp = get_array_module(x)
+            if not xp.allclose(x, y, rtol=rtol, atol=atol):
+                raise AssertionError(f"{kind} {i} mismatch, max abs diff {float(xp.abs(x - y).max())}")
+    return True
+
+
+def _optimized_plan(plan: _Plan, options: dict) -> Tuple[_Plan, Dict[str, int]]:
+    '''总是从未优化的图开始，重复调用optimize不会叠加'''
+    graph = plan.source.copy()
+    report = optimize(graph, **options)
+    optimized = _Plan(graph)
+    optimized.source = plan.source
+    return optimized, report
+
+# endregion 图优化
+
+
+class TracedModule(Module):
+    '''
+    trace返回的模块，参数和原模块共享。按(训练模式, 输入形状和类型)缓存执行计划，
+    遇到新的组合时先正常执行一次forward并重新跟踪
+    '''
+
+    def __init__(self, module: Module) -> None:
+        super().__init__()
+        self.module = module
+        super().__setattr__('_plans', {})
+        super().__setattr__('_example_key', None)
+        super().__setattr__('_optimize_options', None)
+
+    @property
+    def graph(self) -> Graph:
+        '''使用example_inputs跟踪得到的计算图，调用optimize之后是优化后的图'''
+        return self._plans[self._example_key].graph
+
+    def _key(self, inputs: Tuple[Tensor]):
+        return self.module.training, tuple((x.shape, x.dtype) for x in inputs)
+
+    def forward(self, *inputs) -> Union[Tensor, Tuple[Tensor]]:
+        inputs = tuple(ensure_tensor(x) for x in inputs)
+        key = self._key(inputs)
+        plan = self._plans.get(key)
+        if plan is None:
+            result, plan = _trace(self.module, inputs)
+            if self._optimize_options is not None:
+                plan, _ = _optimized_plan(plan, self._optimize_options)
+            self._plans[key] = plan
+            if self._example_key is None:
+                super().__setattr__('_example_key', key)
+            return result
+
+        states = [d[name] for _, d, name in plan.graph.states]
+        outputs = _Replay(plan)(*inputs, *states)
+        if plan.graph.return_tuple:
+            return outputs
+        return outputs[0]
+
+    def optimize(self, passes: Optional[Iterable[str]] = None, freeze_buffers: bool = False) -> Dict[str, int]:
+        '''
+        优化所有已经跟踪的计划，之后新跟踪的计划也会使用相同的选项，参数见jit.optimize
+        Returns:
+            所有计划中每个优化删除的节点数之和
+        '''
+        options = {'passes': None if passes is None else tuple(passes), 'freeze_buffers': freeze_buffers}
+        super().__setattr__('_optimize_options', options)
+        total = {}
+        for key, plan in self._plans.items():
+            self._plans[key], report = _optimized_plan(plan, options)
+            for name, removed in report.items():
+                total[name] = total.get(name, 0) + removed
+        return total
+
+    def verify(self, *inputs, rtol: float = 1e-5, atol: float = 1e-6) -> bool:
+        '''使用inputs比较优化前后的计划，见jit.verify'''
+        inputs = tuple(ensure_tensor(x) for x in inputs)
+        plan = self._plans.get(self._key(inputs))
+        if plan is None:
+            raise KeyError("no plan traced for these inputs, call the module with them first")
+        return verify(plan.source, plan.graph, inputs, rtol=rtol, atol=atol)
+
+    # state_dict和原模块保持一致，保存的权重可以互相加载
+    def state_dict(self, destination=None, prefix=""):
+        return self.module.state_dict(destination, prefix)
+
+    def load_state_dict(self, state_dict):
+        self.module.load_state_dict(state_dict)
+
+    def extra_repr(self) -> str:
+        return f'plans={len(self._plans)}'
+
+
+def trace(module: Module, example_inputs: Union[Tensor, Tuple[Tensor]]) -> TracedModule:
+    '''
+    使用example_inputs执行一次module，记录Function的调用序列，返回可以回放的TracedModule
+    和正常执行一样，跟踪时BatchNorm等模块的buffer会被更新一次
+    Args:
+        module: 要跟踪的模块
+        example_inputs: forward的输入，多个输入使用元组
+
+    Returns:
+        TracedModule，调用方式和原模块一致
+    '''
+    if not isinstance(example_inputs, (tuple, list)):
+        example_inputs = (example_inputs,)
+    traced = TracedModule(module)
+    traced(*example_inputs)
+    return traced
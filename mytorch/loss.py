@@ -81,3 +81,37 @@ class NLLLoss(_Loss):
         :return:
         '''
         return F.nll_loss(input, target, self.reduction, self.ignore_index)
+
+
+class SampledSoftmaxLoss(_Loss):
+    def __init__(self, num_sampled: int, reduction: str = "mean", ignore_index=-100,
+                 remove_accidental_hits: bool = True) -> None:
+        '''
+        sampled softmax，用于类别数很大的输出层(如语言模型的词表)，只计算真实类别和采样类别的logits，
+        见functions.sampled_softmax_loss。类别需要按频率从高到低编号
+        '''
+        super().__init__(reduction)
+        self.num_sampled = num_sampled
+        self.ignore_index = ignore_index
+        self.remove_accidental_hits = remove_accidental_hits
+
+    def forward(self, input: Tensor, weight: Tensor, bias: Tensor, target: Tensor) -> Tensor:
+        '''
+        :param input: 输出层的输入
+        :param weight: 输出层的权重，如Linear.weight
+        :param bias: 输出层的偏置，可以为None
+        :param target: 类别索引 或 one-hot向量
+        :return:
+        '''
+        return F.sampled_softmax_loss(input, weight, bias, target, self.num_sampled, self.reduction,
+                                      self.ignore_index, self.remove_accidental_hits)
+
+
+class NegativeSamplingLoss(SampledSoftmaxLoss):
+    '''
+    负采样，见functions.negative_sampling_loss
+    '''
+
+    def forward(self, input: Tensor, weight: Tensor, bias: Tensor, target: Tensor) -> Tensor:
+        return F.negative_sampling_loss(input, weight, bias, target, self.num_sampled, self.reduction,
+                                        self.ignore_index, self.remove_accidental_hits)
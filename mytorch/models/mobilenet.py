@@ -1,5 +1,4 @@
 import mytorch.module as nn
-import mytorch.functions as F
 from mytorch.module import Module, Conv2D, BatchNorm2d
 from mytorch.tensor import Tensor
 
@@ -21,16 +20,23 @@ class DepthwiseSeparableConv(Module):
         )
         self.bn1 = BatchNorm2d(in_channels)
         self.bn2 = BatchNorm2d(out_channels)
+        # ReLU使用Module，推理时可以和前面的卷积、BatchNorm一起融合
+        self.relu1 = nn.ReLU()
+        self.relu2 = nn.ReLU()
 
     def forward(self, x):
         x = self.depthwise(x)
         x = self.bn1(x)
-        x = F.relu(x)
+        x = self.relu1(x)
         x = self.pointwise(x)
         x = self.bn2(x)
-        x = F.relu(x)
+        x = self.relu2(x)
         return x
 
+    def fuse_groups(self):
+        '''可以融合的模块，见mytorch.fuse.fuse_modules'''
+        return [['depthwise', 'bn1', 'relu1'], ['pointwise', 'bn2', 'relu2']]
+
 class MobileNetBlock(Module):
     def __init__(self, in_channels, out_channels, stride):
         super(MobileNetBlock, self).__init__()
@@ -58,6 +64,7 @@ class MobileNetV1(Module):
 
         self.first_conv = Conv2D(3, int(32 * width_multiplier), (3, 3), stride=2, padding=1)
         self.bn = BatchNorm2d(int(32 * width_multiplier))
+        self.relu = nn.ReLU()
         
         self.layers = nn.Sequential(
             make_layers(32, 64, 1),
@@ -77,9 +84,12 @@ class MobileNetV1(Module):
     def forward(self, x):
         x = self.first_conv(x)
         x = self.bn(x)
-        x = F.relu(x)
+        x = self.relu(x)
         x = self.layers(x)
         x = self.avg_pool(x)
         x = x.view(x.shape[0], -1)
         x = self.fc(x)
-        return x 
\ No newline at end of file
+        return x
+
+    def fuse_groups(self):
+        return [['first_conv', 'bn', 'relu']]
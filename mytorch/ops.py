@@ -38,14 +38,46 @@ def unbroadcast(grad: NdArray, in_shape: Tuple) -> NdArray:
     return grad
 
 
+def unbroadcast_per_sample(grad: NdArray, in_shape: Tuple) -> NdArray:
+    '''
+    逐样本梯度模式下的unbroadcast，grad的第0维是batch维度，需要保留下来，
+    其余维度按广播的逆操作求和
+    Args:
+        grad: 梯度，形状为(batch_size, ...)
+        in_shape: 不依赖样本的输入的形状
+    Returns:
+        形状为(batch_size, *in_shape)的梯度
+    '''
+    batch_size = grad.shape[0]
+    # 和广播一样，in_shape从右边对齐
+    padded = (1,) * (grad.ndim - len(in_shape)) + tuple(in_shape)
+    axes = tuple(i for i in range(1, grad.ndim) if padded[i] == 1 and grad.shape[i] != 1)
+    if axes:
+        grad = grad.sum(axis=axes, keepdims=True)
+    return grad.reshape((batch_size,) + tuple(in_shape))
+
+
 class Function:
+    # 每次前向传播都会创建大量Function对象，使用__slots__减少内存占用并加快属性访问。
+    # 子类如果有额外的属性，需要在自己的__slots__中声明
+    __slots__ = ('saved_tensors', 'needs_input_grad', 'generation', 'inputs', 'outputs')
+    # 输出是否只由输入决定，随机算子(如Dropout)需要设为False，jit的图优化不会折叠或合并它们
+    deterministic = True
+
     def __init__(self) -> None:
         # 保存需要在backward()中使用的Tensor或其他对象(如Shape)
         self.saved_tensors = []
+        # 每个输入是否需要梯度，记录计算图时设置
+        self.needs_input_grad = None
 
     def save_for_backward(self, *x: Any) -> None:
         self.saved_tensors.extend(x)
 
+    def release(self) -> None:
+        '''反向传播完成后释放保存的中间结果和对输入的引用，让计算图可以被回收'''
+        self.saved_tensors = []
+        self.inputs = None
+
     def forward(self, *args: Any, **kwargs: Any) -> NdArray:
         '''前向传播，进行真正运算的地方'''
         raise NotImplementedError("You must implement the forward function for custom Function.")
@@ -55,32 +87,98 @@ class Function:
         raise NotImplementedError("You must implement the backward method for your custom Function "
                                   "to use it with backward mode AD.")
 
+    def backward_per_sample(self, batched: Tuple, *grads: NdArray) -> Any:
+        '''
+        逐样本梯度模式(Tensor.backward(per_sample=True))下的反向传播
+        Args:
+            batched: 每个输入是否依赖样本(第0维是batch维度)，参数等不依赖样本的输入为False，不是Tensor的输入为None
+            grads: 输出依赖样本时和输出的形状相同，否则在最前面多了一个batch维度
+
+        Returns:
+            每个输入的梯度，不依赖样本的输入的梯度在最前面多一个batch维度，表示每个样本对它的梯度
+
+        默认实现：所有输入都依赖样本时就是backward；都不依赖样本时逐个样本调用backward再拼接。
+        两种输入都有的算子(如Matmul、Add)需要自己实现
+        '''
+        kinds = {b for b in batched if b is not None}
+        if kinds == {True}:
+            return self.backward(*grads)
+        if kinds == {False}:
+            return _loop_backward_per_sample(self, grads)
+        raise NotImplementedError(f"per-sample gradients are not implemented for {self.__class__.__name__} "
+                                  f"mixing per-sample inputs and parameters")
+
     def __call__(self, *xs: "Tensor", **kwargs) -> "Tensor":
-        raw_xs = [x.data if isinstance(x, Tensor) else x for x in xs]
-        # [t.data for t in xs]遍历Tensor中的data(NdArray)值，参与实际计算的都是NumPy的数组。
+        # 一次遍历同时得到参与计算的NdArray、每个输入是否需要梯度以及输出所在的设备，
+        # 参与实际计算的都是NumPy(CuPy)的数组
+        raw_xs = []
+        needs_input_grad = []
+        device = None
+        for x in xs:
+            if isinstance(x, Tensor):
+                raw_xs.append(x._data)
+                needs_input_grad.append(x.requires_grad)
+                if device is None:
+                    device = x._device
+            else:
+                raw_xs.append(x)
+                needs_input_grad.append(False)
+
+        # 只有开启反向传播且有输入需要梯度时，输出才需要梯度
+        requires_grad = Config.backprop and True in needs_input_grad
+        if requires_grad:
+            # backward中可以据此跳过不需要梯度的输入，forward中也可以据此判断是否会反向传播
+            self.needs_input_grad = needs_input_grad
+
         ys = self.forward(*raw_xs, **kwargs)
-        requires_grad = any([t.requires_grad for t in xs if isinstance(t, Tensor)])
 
         return_tuple = True
         if not isinstance(ys, tuple):
             return_tuple = False
             ys = (ys,)
 
-        outputs = [Tensor(y, requires_grad=requires_grad) for y in ys]
+        # 输出和输入在同一个设备上，直接复用输入的设备，不需要再从数组推断
+        outputs = [Tensor._from_op(y, requires_grad, device) for y in ys]
 
-        if Config.backprop:
+        # 没有输入需要梯度时(如数据预处理、冻结的参数)不记录计算图，这部分子图在反向传播中被完全剪掉
+        if requires_grad:
             self.generation = max([x.generation for x in xs if isinstance(x, Tensor)])
             for output in outputs:  # 设定每个输出是由此函数得到的
                 output.set_creator(self)
             self.inputs = xs  # 记录输入
             self.outputs = [weakref.ref(output) for output in outputs]  # 通过弱引用保存输出
 
+        # jit.trace记录执行过程，不管是否需要梯度都要记录
+        if Config.tracer is not None:
+            Config.tracer.record(self, xs, kwargs, outputs)
+
         # 返回多个则通过元组
         if return_tuple or len(outputs) > 1:
             return tuple(outputs)
         return outputs[0]
 
 
+def _loop_backward_per_sample(f: Function, grads: Tuple) -> Tuple:
+    '''逐个样本调用backward，把每个输入的梯度在第0维拼接起来'''
+    batch_size = next(g for g in grads if g is not None).shape[0]
+    samples = []
+    for b in range(batch_size):
+        gxs = f.backward(*[None if g is None else g[b] for g in grads])
+        samples.append(gxs if isinstance(gxs, tuple) else (gxs,))
+
+    xp = get_array_module(next(g for g in grads if g is not None))
+    return tuple(None if gxs[0] is None else xp.stack(gxs) for gxs in zip(*samples))
+
+
+def _elementwise_backward_per_sample(self, batched: Tuple, *grads: NdArray) -> Any:
+    '''backward只做逐元素运算，多出来的batch维度可以直接广播，不需要逐个样本计算'''
+    return self.backward(*grads)
+
+
+def _unbroadcast_either(grad: NdArray, shape: Tuple, batched: bool) -> NdArray:
+    return unbroadcast(grad, shape) if batched else unbroadcast_per_sample(grad, shape)
+
+
 def broadcast_grad_shape(original_shape, xp, grad: NdArray, axis=None, keepdims=None) -> NdArray:
     '''
     在Mean、Sum、Squeeze等方法中，可能会丢失dim=1的维度，不能直接进行广播，需要调用此方法进行一些处理，广播到原来的维度
@@ -128,6 +226,7 @@ def restore_grad_shape(original_shape, ndim: int, axis=None):
 
 # ****二元运算****
 class Add(Function):
+    __slots__ = ()
 
     def forward(self, x: NdArray, y: NdArray) -> NdArray:
         '''
@@ -145,18 +244,35 @@ class Add(Function):
         # 输入有两个，都是需要计算梯度的，因此输出也是两个
         return unbroadcast(grad, shape_x), unbroadcast(grad, shape_y)
 
+    def backward_per_sample(self, batched: Tuple, grad: NdArray) -> Tuple[NdArray, NdArray]:
+        bx, by = batched
+        if bx == by:
+            return super().backward_per_sample(batched, grad)
+        # 比如Linear的偏置，不依赖样本的一侧保留batch维度
+        shape_x, shape_y = self.saved_tensors
+        return _unbroadcast_either(grad, shape_x, bx), _unbroadcast_either(grad, shape_y, by)
+
 
 class AddConstant(Function):
     '''
     Tensor + 常量
     '''
 
+    __slots__ = ()
+
     def forward(self, x: NdArray, c) -> NdArray:
         return x + x.dtype.type(c)
 
     def backward(self, grad: NdArray) -> NdArray:
         return grad
 
+    backward_per_sample = _elementwise_backward_per_sample
+
+
+def _is_constant(rhs) -> bool:
+    '''右操作数是否为标量常量，Tensor是最常见的情况，先判断它以避开较慢的np.isscalar'''
+    return not isinstance(rhs, Tensor) and np.isscalar(rhs)
+
 
 def get_numpy_data(tensor):
     if isinstance(tensor, Tensor):
@@ -165,7 +281,7 @@ def get_numpy_data(tensor):
 
 
 def add(self, rhs):
-    if np.isscalar(rhs):
+    if _is_constant(rhs):
         return AddConstant()(self, rhs)
     return Add()(self, rhs)
 
@@ -177,6 +293,8 @@ def add_(self, other, alpha=1):
 
 
 class Sub(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray, y: NdArray) -> NdArray:
         '''
         实现 z = x - y
@@ -188,9 +306,16 @@ class Sub(Function):
         shape_x, shape_y = self.saved_tensors
         return unbroadcast(grad, shape_x), unbroadcast(-grad, shape_y)
 
+    def backward_per_sample(self, batched: Tuple, grad: NdArray) -> Tuple[NdArray, NdArray]:
+        bx, by = batched
+        if bx == by:
+            return super().backward_per_sample(batched, grad)
+        shape_x, shape_y = self.saved_tensors
+        return _unbroadcast_either(grad, shape_x, bx), _unbroadcast_either(-grad, shape_y, by)
+
 
 def sub(self, rhs):
-    if np.isscalar(rhs):
+    if _is_constant(rhs):
         return AddConstant()(self, -rhs)
     return Sub()(self, rhs)
 
@@ -200,20 +325,25 @@ class SubFromConstant(Function):
     常量 - Tensor
     '''
 
+    __slots__ = ()
+
     def forward(self, x: NdArray, constant) -> NdArray:
         return x.dtype.type(constant) - x
 
     def backward(self, grad: NdArray) -> NdArray:
         return -grad
 
+    backward_per_sample = _elementwise_backward_per_sample
+
 
 def rsub(self, rhs):
-    if np.isscalar(rhs):
+    if _is_constant(rhs):
         return SubFromConstant()(self, rhs)
     return Sub()(rhs, self)
 
 
 class Mul(Function):
+    __slots__ = ()
 
     def forward(self, x: NdArray, y: NdArray) -> NdArray:
         '''
@@ -231,9 +361,18 @@ class Mul(Function):
         # 分别返回∂L/∂x 和 ∂L/∂y
         return unbroadcast(xp.multiply(grad, y), x.shape), unbroadcast(xp.multiply(grad, x), y.shape)
 
+    def backward_per_sample(self, batched: Tuple, grad: NdArray) -> Tuple[NdArray, NdArray]:
+        bx, by = batched
+        if bx == by:
+            return super().backward_per_sample(batched, grad)
+        # 比如BatchNorm的weight，逐元素相乘后保留batch维度求和
+        xp, x, y = self.saved_tensors
+        return (_unbroadcast_either(xp.multiply(grad, y), x.shape, bx),
+                _unbroadcast_either(xp.multiply(grad, x), y.shape, by))
+
 
 def mul(self, rhs):
-    if np.isscalar(rhs):
+    if _is_constant(rhs):
         return MulConstant()(self, rhs)
     return Mul()(self, rhs)
 
@@ -269,6 +408,8 @@ class MulConstant(Function):
      Tensor * 常量
     """
 
+    __slots__ = ()
+
     def forward(self, x: NdArray, c) -> NdArray:
         # 乘法需要保存输入x和y，用于反向传播
         self.save_for_backward(c)
@@ -278,8 +419,11 @@ class MulConstant(Function):
         c, = self.saved_tensors
         return grad * c
 
+    backward_per_sample = _elementwise_backward_per_sample
+
 
 class TrueDiv(Function):
+    __slots__ = ()
 
     def forward(self, x: NdArray, y: NdArray) -> NdArray:
         '''
@@ -309,9 +453,18 @@ class TrueDiv(Function):
 
         return unbroadcast(gx, x.shape), unbroadcast(gy, y.shape)
 
+    def backward_per_sample(self, batched: Tuple, grad: NdArray) -> Tuple[NdArray, NdArray]:
+        bx, by = batched
+        if bx == by:
+            return super().backward_per_sample(batched, grad)
+        x, y = self.saved_tensors
+        gx = grad / y
+        gy = -gx * x / y
+        return _unbroadcast_either(gx, x.shape, bx), _unbroadcast_either(gy, y.shape, by)
+
 
 def div(self, rhs):
-    if np.isscalar(rhs):
+    if _is_constant(rhs):
         return MulConstant()(self, 1.0 / rhs)
     return TrueDiv()(self, rhs)
 
@@ -321,6 +474,8 @@ class DivFromConstant(Function):
       常量/Tensor
     """
 
+    __slots__ = ()
+
     def forward(self, x: NdArray, c) -> NdArray:
         self.save_for_backward(x, c)
         return c / x
@@ -346,13 +501,15 @@ class DivFromConstant(Function):
 
 
 def rdiv(self, rhs):
-    if np.isscalar(rhs):
+    if _is_constant(rhs):
         return DivFromConstant()(self, rhs)
     return TrueDiv()(rhs, self)
 
 
 # ****聚合运算****
 class Sum(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray, axis=None, keepdims=False) -> NdArray:
         self.save_for_backward(x.shape, axis, keepdims)
         return x.sum(axis, keepdims=keepdims)
@@ -364,6 +521,8 @@ class Sum(Function):
 
 
 class Mean(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray, axis=None, keepdims=False) -> NdArray:
         out = x.mean(axis, keepdims=keepdims)
         self.save_for_backward(x.shape, out.shape, axis, keepdims)
@@ -377,6 +536,7 @@ class Mean(Function):
 
 
 class Max(Function):
+    __slots__ = ()
 
     def forward(self, x: NdArray, axis=None, keepdims=False) -> NdArray:
         '''
@@ -406,6 +566,8 @@ class Max(Function):
 
 
 class Min(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray, axis=None, keepdims=False) -> NdArray:
         '''
         y = x.min()
@@ -433,6 +595,8 @@ class Min(Function):
 
 
 class Clip(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray, x_min=None, x_max=None) -> NdArray:
         xp = get_array_module(x)
         if x_min is None:
@@ -450,6 +614,8 @@ class Clip(Function):
 
 
 class Gather(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray, axis: int, indices) -> NdArray:
         xp = get_array_module(x)
 
@@ -492,6 +658,8 @@ def dim_one(shape):
 
 
 class Squeeze(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray, axis: Union[int, Tuple, None] = None) -> NdArray:
         xp = get_array_module(x)
 
@@ -514,6 +682,8 @@ class Squeeze(Function):
 
 
 class UnSqueeze(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray, axis: int) -> NdArray:
         xp = get_array_module(x)
         self.save_for_backward(x.shape)
@@ -530,6 +700,8 @@ class UnSqueeze(Function):
 
 # ****矩阵运算****
 class Matmul(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray, y: NdArray) -> NdArray:
         '''
         z = x @ y
@@ -540,7 +712,38 @@ class Matmul(Function):
 
     def backward(self, grad: NdArray) -> Tuple[NdArray, NdArray]:
         x, y = self.saved_tensors
-        return unbroadcast(grad @ y.swapaxes(-2, -1), x.shape), unbroadcast(x.swapaxes(-2, -1) @ grad, y.shape)
+        needs_x, needs_y = self.needs_input_grad
+        # 冻结的一侧不需要计算梯度，省掉一次矩阵乘法
+        gx = unbroadcast(grad @ y.swapaxes(-2, -1), x.shape) if needs_x else None
+        gy = unbroadcast(x.swapaxes(-2, -1) @ grad, y.shape) if needs_y else None
+        return gx, gy
+
+    def backward_per_sample(self, batched: Tuple, grad: NdArray) -> Tuple[NdArray, NdArray]:
+        bx, by = batched
+        x, y = self.saved_tensors
+        if bx == by or (bx and y.ndim != 2) or (by and (x.ndim != 2 or y.ndim < 3)):
+            return super().backward_per_sample(batched, grad)
+
+        needs_x, needs_y = self.needs_input_grad
+        batch_size = grad.shape[0]
+        xp = get_array_module(grad)
+        if bx:
+            # Linear: y是(in, out)的权重，每个样本的梯度是 x_b^T @ grad_b，用批量矩阵乘法一次算出所有样本的外积，
+            # x中batch之外的维度(如序列长度)都被合并求和
+            gx = unbroadcast(grad @ y.swapaxes(-2, -1), x.shape) if needs_x else None
+            if not needs_y:
+                gy = None
+            elif x.ndim == 2:
+                # 每个样本只有一行时就是外积，逐元素相乘比批量矩阵乘法快
+                gy = x[:, :, None] * grad[:, None, :]
+            else:
+                gy = xp.matmul(x.reshape(batch_size, -1, x.shape[-1]).swapaxes(1, 2),
+                               grad.reshape(batch_size, -1, grad.shape[-1]))
+        else:
+            # x是(m, k)的权重，每个样本的梯度是 grad_b @ y_b^T
+            gx = (grad @ y.swapaxes(-2, -1)).reshape(batch_size, -1, *x.shape).sum(axis=1) if needs_x else None
+            gy = unbroadcast(x.swapaxes(-2, -1) @ grad, y.shape) if needs_y else None
+        return gx, gy
 
 
 # ****一元运算****
@@ -549,6 +752,8 @@ class Pow(Function):
     Tensor ** 常量
     """
 
+    __slots__ = ()
+
     def forward(self, x: NdArray, c: float) -> NdArray:
         self.save_for_backward(x, c)
         return x ** c
@@ -567,6 +772,8 @@ class Pow(Function):
 
 
 class Log(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray) -> NdArray:
         self.save_for_backward(x)
         # log = ln
@@ -579,6 +786,8 @@ class Log(Function):
 
 
 class Exp(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray) -> NdArray:
         xp = get_array_module(x)
         ret = xp.exp(x)
@@ -591,14 +800,20 @@ class Exp(Function):
 
 
 class Neg(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray) -> NdArray:
         return -x
 
     def backward(self, grad: NdArray) -> NdArray:
         return -grad
 
+    backward_per_sample = _elementwise_backward_per_sample
+
 
 class Abs(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray) -> NdArray:
         xp = get_array_module(x)
         self.save_for_backward(x, xp)
@@ -618,6 +833,8 @@ class Abs(Function):
 
 
 class Sqrt(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray) -> NdArray:
         xp = get_array_module(x)
         ret = xp.sqrt(x)
@@ -642,6 +859,7 @@ def argone(shape):
 
 # ****变形和切片****
 class Slice(Function):
+    __slots__ = ()
 
     def forward(self, x: NdArray, slices: Any) -> NdArray:
         '''
@@ -688,6 +906,8 @@ class _IndexSelect(Function):
     返回索引基类，这种类是没有梯度的，因为返回的只是索引
     '''
 
+    __slots__ = ()
+
     def fwd(self, x: NdArray, xp, axis):
         raise NotImplementedError("You must implement the fwd function in sub class.")
 
@@ -700,16 +920,22 @@ class _IndexSelect(Function):
 
 
 class ArgMax(_IndexSelect):
+    __slots__ = ()
+
     def fwd(self, x: NdArray, xp, axis=None):
         return xp.argmax(x, axis=axis)
 
 
 class ArgMin(_IndexSelect):
+    __slots__ = ()
+
     def fwd(self, x: NdArray, xp, axis=None):
         return xp.argmin(x, axis=axis)
 
 
 class Sort(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray, axis=-1, descending=False) -> Tuple[NdArray, NdArray]:
         xp = get_array_module(x)
         # 在指定维度上对数组进行排序
@@ -738,6 +964,8 @@ class Sort(Function):
 
 
 class Reshape(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray, shape: Tuple) -> NdArray:
         self.save_for_backward(x.shape)
         return x.reshape(shape)
@@ -746,8 +974,16 @@ class Reshape(Function):
         x_shape, = self.saved_tensors
         return grad.reshape(x_shape)
 
+    def backward_per_sample(self, batched: Tuple, grad: NdArray) -> NdArray:
+        if batched[0]:
+            return self.backward(grad)
+        x_shape, = self.saved_tensors
+        return grad.reshape((grad.shape[0],) + tuple(x_shape))
+
 
 class ExpandDims(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray, axis: int) -> NdArray:
         xp = get_array_module(x)
         self.save_for_backward(x.shape)
@@ -759,6 +995,8 @@ class ExpandDims(Function):
 
 
 class Transpose(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray, axes) -> NdArray:
         self.save_for_backward(axes)
         return x.transpose(axes)
@@ -770,11 +1008,22 @@ class Transpose(Function):
 
         return grad.transpose(tuple(np.argsort(axes)))
 
+    def backward_per_sample(self, batched: Tuple, grad: NdArray) -> NdArray:
+        if batched[0]:
+            return self.backward(grad)
+        # 比如Linear中的weight.T，第0维batch保持不动
+        axes, = self.saved_tensors
+        ndim = grad.ndim - 1
+        inverse = range(ndim - 1, -1, -1) if axes is None else np.argsort(axes)
+        return grad.transpose((0,) + tuple(int(i) + 1 for i in inverse))
+
 
 # Permute = Transpose
 
 
 class Repeat(Function):
+    __slots__ = ()
+
     def forward(self, x: NdArray, repeats) -> NdArray:
         xp = get_array_module(x)
 
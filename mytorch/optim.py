@@ -52,10 +52,14 @@ class Optimizer:
         format_string += ')'
         return format_string
 
-    def zero_grad(self) -> None:
+    def zero_grad(self, set_to_none: bool = False) -> None:
+        '''
+        Args:
+            set_to_none: 为True时将梯度置为None而不是全0数组，节省内存和一次memset
+        '''
         for group in self.param_groups:
             for p in group['params']:
-                p.zero_grad()
+                p.zero_grad(set_to_none)
 
     def step(self) -> None:
         raise NotImplementedError
@@ -92,6 +96,9 @@ class SGD(Optimizer):
                 lr = group['lr']
 
                 for p in group['params']:
+                    # 梯度是延迟分配的，没有参与计算的参数梯度为None
+                    if p.grad is None:
+                        continue
                     d_p = p.grad  # 我们不能直接修改p.grad
                     # 对于设置了weight_decay的参数
                     if weight_decay != 0:
@@ -0,0 +1,136 @@
+import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+from mytorch.cuda import get_array_module
+from mytorch.tensor import NdArray
+
+try:
+    from threadpoolctl import ThreadpoolController
+except ImportError:
+    ThreadpoolController = None
+
+'''
+算子内部的并行(intra-op)：把一个算子沿batch维度切成几段，交给线程池同时计算，比如卷积的滑动窗口复制、矩阵乘法和col2im。
+NumPy的数组复制、逐元素运算和BLAS都会释放GIL，所以这些线程可以真正同时执行。
+set_num_threads同时控制这个线程池和BLAS的线程数(调整BLAS的线程数需要安装threadpoolctl)：
+    分段计算时每一段的BLAS只用一个线程，避免 线程数 x BLAS线程数 的过度订阅；
+    不分段的计算(比如batch为1，或者Winograd、FFT卷积)仍然使用set_num_threads设置的BLAS线程数
+默认只有一个线程，不分段，和之前的行为一致
+'''
+
+_num_threads = 1
+_pool = None
+_controller = None
+_blas_limiter = None
+_local = threading.local()
+# threadpoolctl的限制是整个进程的，多个线程同时分段计算时(比如并行反向传播中的几个卷积)共用一次限制：
+# 第一个进入的线程把BLAS设为单线程，最后一个退出的线程恢复，避免交错恢复后BLAS一直停在单线程
+_blas_lock = threading.Lock()
+_blas_users = 0
+_single_limiter = None
+
+
+def _get_controller():
+    '''没有安装threadpoolctl时返回None，此时只能通过OPENBLAS_NUM_THREADS等环境变量设置BLAS的线程数'''
+    global _controller
+    if _controller is None and ThreadpoolController is not None:
+        _controller = ThreadpoolController()
+    return _controller
+
+
+def set_num_threads(num_threads: int) -> None:
+    '''
+    设置算子内部并行使用的线程数，同时把BLAS的线程数设为num_threads
+    Args:
+        num_threads: 大于1时，batch大于1的卷积按batch分段并行计算
+    '''
+    global _num_threads, _pool, _blas_limiter
+    if num_threads < 1:
+        raise ValueError(f"num_threads must be positive, got {num_threads}")
+    _num_threads = num_threads
+    if _pool is not None:
+        _pool.shutdown(wait=False)
+        _pool = None
+
+    controller = _get_controller()
+    if controller is not None:
+        with _blas_lock:
+            # 先恢复原来的设置，limit会一直生效，直到下一次set_num_threads
+            if _blas_limiter is not None:
+                _blas_limiter.restore_original_limits()
+            _blas_limiter = controller.limit(limits=num_threads, user_api='blas')
+
+
+def get_num_threads() -> int:
+    return _num_threads
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        # 调用者自己计算第一段，线程池只需要num_threads - 1个线程
+        _pool = ThreadPoolExecutor(max_workers=_num_threads - 1, thread_name_prefix="mytorch-intra-op")
+    return _pool
+
+
+@contextlib.contextmanager
+def _single_threaded_blas():
+    global _blas_users, _single_limiter
+    controller = _get_controller()
+    if controller is None:
+        yield
+        return
+    with _blas_lock:
+        if _blas_users == 0:
+            _single_limiter = controller.limit(limits=1, user_api='blas')
+        _blas_users += 1
+    try:
+        yield
+    finally:
+        with _blas_lock:
+            _blas_users -= 1
+            if _blas_users == 0:
+                _single_limiter.restore_original_limits()
+                _single_limiter = None
+
+
+def _run_shard(fn: Callable, *args) -> Any:
+    # 线程池中的任务再调用map_batches时直接串行执行，避免等待同一个线程池而死锁
+    _local.busy = True
+    try:
+        return fn(*args)
+    finally:
+        _local.busy = False
+
+
+def map_batches(fn: Callable[..., Any], *arrays: NdArray) -> List[Any]:
+    '''
+    把arrays沿第0维(batch)分成最多get_num_threads()段，在线程池中计算fn(*每段的arrays)，按顺序返回每段的结果。
+    只有一个线程、batch为1或者已经在分段计算中时，直接返回[fn(*arrays)]
+    '''
+    n = arrays[0].shape[0]
+    shards = min(_num_threads, n)
+    if shards <= 1 or getattr(_local, 'busy', False):
+        return [fn(*arrays)]
+
+    bounds = [n * i // shards for i in range(shards + 1)]
+    parts = [tuple(a[lo:hi] for a in arrays) for lo, hi in zip(bounds[:-1], bounds[1:])]
+    with _single_threaded_blas():
+        futures = [_get_pool().submit(_run_shard, fn, *part) for part in parts[1:]]
+        first = _run_shard(fn, *parts[0])
+        return [first] + [future.result() for future in futures]
+
+
+def join_batches(parts: List[Optional[NdArray]]) -> Optional[NdArray]:
+    '''沿第0维拼接map_batches的结果，保持第一段的内存布局(比如channels last)，只有一段时不复制'''
+    if parts[0] is None or len(parts) == 1:
+        return parts[0]
+    xp = get_array_module(parts[0])
+    out = xp.empty_like(parts[0], shape=(sum(p.shape[0] for p in parts),) + parts[0].shape[1:])
+    start = 0
+    for part in parts:
+        out[start:start + part.shape[0]] = part
+        start += part.shape[0]
+    return out
@@ -4,6 +4,8 @@ from mytorch.tensor import Tensor, Arrayable
 
 
 class Parameter(Tensor):
+    __slots__ = ()
+
     def __init__(self, data: Union[Arrayable, Tensor], dtype=None, device=None) -> None:
         # Parameter都是需要计算梯度的
         super().__init__(data, requires_grad=True, dtype=dtype, device=device)
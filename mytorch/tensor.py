@@ -4,6 +4,8 @@ import importlib
 import inspect
 import os
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from numbers import Number
 from typing import Union, Tuple, List
 
@@ -29,6 +31,7 @@ np.set_printoptions(precision=4)
 np.set_printoptions(suppress=True)
 
 NdArray = Union['np.ndarray', 'cuda.ndarray']
+_array_types = (np.ndarray, cuda.ndarray)
 
 # 可以转换为数组的类型
 Arrayable = Union[Number, NdArray, List]
@@ -71,6 +74,9 @@ def ensure_tensor(tensoralbe: Tensorable, device=None) -> "Tensor":
 class Config:
     debug = False
     backprop = True  # 是否需要计算并反向传播梯度
+    cache_schedule = True  # 是否缓存静态图的反向传播调度
+    tracer = None  # 不为None时，每次Function调用都会交给它记录，见mytorch.jit
+    backward_workers = 0  # 大于1时，反向传播使用线程池并行执行互不依赖的函数
 
 
 # 上下文管理器
@@ -98,6 +104,14 @@ def no_grad():
     return using_config("backprop", False)
 
 
+def parallel_backward(workers: int = 4):
+    '''
+    在with语句中的backward使用workers个线程并行执行互不依赖的函数，比如多分支、残差和拼接结构。
+    NumPy在BLAS和较大的ufunc中会释放GIL，分支越大收益越明显；BLAS本身也是多线程的，需要注意线程数之和
+    '''
+    return using_config("backward_workers", workers)
+
+
 class OpWrapper:
     '''
     支持反向传播的Debug
@@ -127,6 +141,10 @@ class OpWrapper:
 
 
 class Tensor:
+    # 一次前向和反向传播会创建大量的Tensor对象，使用__slots__去掉__dict__，
+    # 减少每个节点的内存占用并加快属性访问；__weakref__用于Function通过弱引用保存输出
+    __slots__ = ('_data', '_grad', '_device', 'creator', 'generation', 'requires_grad', '_released', '__weakref__')
+
     def __init__(self, data: Arrayable, requires_grad: bool = False, dtype=None, device: Device = None) -> None:
         '''
         初始化Tensor对象
@@ -149,16 +167,34 @@ class Tensor:
         self._device = device
         self.creator = None
         self.generation = 0
+        # creator是否已经被反向传播释放，释放后不能再经过它反向传播
+        self._released = False
 
         # data 是 NdArray
         self._data = ensure_array(data, dtype, self._device)
 
         self.requires_grad = requires_grad
-        # 保存该Tensor的梯度
+        # 保存该Tensor的梯度，延迟到反向传播第一次累加梯度时才分配
         self._grad = None  # 改成NdArray类型
 
-        if self.requires_grad:
-            self.zero_grad()
+    @classmethod
+    def _from_op(cls, data, requires_grad: bool, device: Device) -> "Tensor":
+        '''
+        Function内部使用的构造方法，data是运算得到的数组，device是输入所在的设备，
+        跳过ensure_array和设备推断。标量等非数组的结果走普通的构造流程
+        '''
+        if device is None or not isinstance(data, _array_types):
+            return cls(data, requires_grad=requires_grad)
+
+        tensor = cls.__new__(cls)
+        tensor._device = device
+        tensor.creator = None
+        tensor.generation = 0
+        tensor._released = False
+        tensor._data = data
+        tensor.requires_grad = requires_grad
+        tensor._grad = None
+        return tensor
 
     #region 属性相关
     @property
@@ -250,13 +286,19 @@ class Tensor:
     #endregion
 
     #region 其他
-    def zero_grad(self) -> None:
+    def zero_grad(self, set_to_none: bool = False) -> None:
         '''
         将梯度初始化为0
+        Args:
+            set_to_none: 为True时直接将梯度置为None，不再分配全0数组，
+                         下次反向传播时会重新分配梯度
         Returns:
 
         '''
-        self._grad = self.xp.zeros_like(self.data)
+        if set_to_none:
+            self._grad = None
+        else:
+            self._grad = self.xp.zeros_like(self.data)
 
     def __repr__(self) -> str:
         return f"Tensor(\n{self.data}, requires_grad={self.requires_grad}" \
@@ -517,13 +559,20 @@ class Tensor:
 # 整个过程递归遍历计算图，直至所有相关操作完成。
     #region 反向传播,是自动求导的梯度累积过程；
     # 每当调用backward时，会根据链式法则，递归遍历其创建者（creator），将所有需要计算梯度的操作的梯度累加到grad属性中
-    def backward(self, grad: NdArray = None, retain_grad=False, create_graph=False) -> None:
+    def backward(self, grad: NdArray = None, retain_grad=False, create_graph=False, retain_graph=None,
+                 per_sample=False) -> None:
         '''
         实现Tensor的反向传播
         Args:
             grad: 如果不是标量，则需要传递梯度进来
             retain_grad: 是否保留梯度的中间变量
             create_graph: 整个计算梯度的过程是否也需要保留到计算图中，即double_backprop: todo 待实现
+            retain_graph: 是否保留计算图，默认和create_graph一致。为False时每处理完一个函数，
+                          就释放它保存的中间结果、对输入的引用以及输出的creator，计算图不能再次反向传播
+            per_sample: 逐样本梯度模式，一次反向传播得到每个样本的梯度，Parameter的grad在最前面多一个batch维度。
+                        要求当前Tensor是每个样本损失的和(或平均，此时每个样本的梯度都除以了batch_size)，
+                        且样本之间没有交互(如训练模式下的BatchNorm)。Parameter和0维的叶子Tensor被认为不依赖样本，
+                        其他叶子Tensor的第0维是batch维度。梯度会累加，调用前需要zero_grad(set_to_none=True)
 
         Returns:
 
@@ -545,56 +594,392 @@ class Tensor:
         else:
             self._grad = grad
 
-        # 2. 初始化候选函数堆,将需要计算梯度的操作按照其生成顺序压入堆中，确保梯度计算顺序从后向前。
-        funcs = []  # 候选函数堆
-        seen_set = set()
-
-        def add_func(f):
-            if f not in seen_set:
-                # heapq是小顶堆，为了实现大顶堆的效果，需要加一个负号
-                heapq.heappush(funcs, (-f.generation, len(seen_set), f))
-                seen_set.add(f)
-
-        # 3. 将当前Tensor的创建者（self.creator）压入堆中
-        add_func(self.creator)
-
-        # 4. 从堆中弹出最小的元素，即最早生成的函数，进行梯度计算
-        while funcs:
-            _, _, f = heapq.heappop(funcs)
-            # 获取输出对应的梯度，解决多个输出梯度不一致的问题
-            gys = [output().grad for output in f.outputs]  # output 是 weakref
-
-            with using_config('backprop', create_graph):
-                with OpWrapper(f.__class__.__name__, gys, backward=True):
-                    gxs = f.backward(*gys)
-                if not isinstance(gxs, tuple):
-                    gxs = (gxs,)
-                for x, gx in zip(f.inputs, gxs):
-                    if x.requires_grad and gx is not None:
-                        assert x.shape == gx.shape, f"grad shape must match tensor shape in {f!r}, {gx.shape!r} != {x.shape!r}"
-                        if x.grad is None:
-                            x._grad = gx
-                        else:
-                            x._grad = x._grad + gx  # 【根据链式法则的逻辑，累加多个路径传递的梯度】grad本身不需要计算梯度，所以普通NdArray即可
-
-                        if x.creator is not None:
-                            add_func(x.creator) # 【对于当前操作的所有输入，如果它们有creator，将其加入堆中】
-
-            if not retain_grad:
-                for y in f.outputs:
-                    y()._grad = None
+        # 叶子节点，没有需要反向传播的函数
+        if self.creator is None:
+            if self._released:
+                raise RuntimeError(_RELEASED_GRAPH_MESSAGE)
+            return
+
+        if retain_graph is None:
+            retain_graph = create_graph
+
+        BackwardStats.calls += 1
+
+        # 2. 得到函数的拓扑排序，静态图直接复用缓存的调度
+        start = time.perf_counter()
+        funcs = _get_schedule(self)
+        BackwardStats.schedule_time += time.perf_counter() - start
+        BackwardStats.nodes_visited += len(funcs)
+
+        # 3. 按拓扑排序依次调用每个函数的backward，这里是普通的列表遍历
+        # 释放计算图时，函数不再引用它的输入，需要在这里持有输入直到其creator被处理，否则梯度会随Tensor一起被回收
+        pending = {}
+        batched = _batched_inputs(funcs) if per_sample else {}
+        with using_config('backprop', create_graph):
+            if Config.backward_workers > 1 and len(funcs) > 1 and not per_sample:
+                _parallel_backward(funcs, Config.backward_workers, retain_grad, retain_graph, pending)
+                return
+
+            for f in funcs:
+                # 获取输出对应的梯度，解决多个输出梯度不一致的问题
+                gys = [_output_grad(output) for output in f.outputs]  # output 是 weakref
+                if not retain_graph:
+                    pending.pop(f, None)
+                # 没有任何梯度流入该函数，比如只经过了返回索引的函数
+                if all(gy is None for gy in gys):
+                    if not retain_graph:
+                        _release_function(f, pending)
+                    continue
+
+                gxs, elapsed = _call_backward(f, gys, batched.get(f))
+                BackwardStats.backward_time += elapsed
+                _accumulate_grads(f, gxs, batched.get(f), retain_grad)
+                _finish_function(f, retain_grad, retain_graph, pending)
 
     def unchain_backward(self): # 反向传播时，将当前Tensor的创建者（self.creator）从候选函数堆中移除。
         if self.creator is not None:
             funcs = [self.creator]
             while funcs: # 通过递归地遍历计算图
                 f = funcs.pop()
+                # 已经被backward释放的函数
+                if f.inputs is None:
+                    continue
                 for x in f.inputs:
                     if x.creator is not None:
                         funcs.append(x.creator)
                         x.unchain() # 将x的创建者设为None，断开计算图中节点之间的依赖关系
 
 
+class BackwardStats:
+    '''
+    反向传播引擎的统计信息，用来观察调度带来的Python开销
+    '''
+    calls = 0  # backward调用次数
+    cache_hits = 0  # 复用缓存调度的次数
+    cache_misses = 0  # 重新计算拓扑排序的次数
+    nodes_visited = 0  # 访问的函数节点总数
+    schedule_time = 0.0  # 计算或回放调度花费的时间(秒)
+    backward_time = 0.0  # 花在Function.backward中的时间(秒)
+
+    @classmethod
+    def reset(cls) -> None:
+        cls.calls = cls.cache_hits = cls.cache_misses = cls.nodes_visited = 0
+        cls.schedule_time = cls.backward_time = 0.0
+
+    @classmethod
+    def as_dict(cls) -> dict:
+        return {
+            "calls": cls.calls,
+            "cache_hits": cls.cache_hits,
+            "cache_misses": cls.cache_misses,
+            "nodes_visited": cls.nodes_visited,
+            "schedule_time": cls.schedule_time,
+            "backward_time": cls.backward_time,
+        }
+
+
+def _call_backward(f, gys, batched=None):
+    '''
+    调用f.backward，返回输入的梯度和耗时，并行反向传播时在工作线程中执行
+    batched不为None时是逐样本梯度模式，见_batched_inputs
+    '''
+    start = time.perf_counter()
+    with OpWrapper(f.__class__.__name__, gys, backward=True):
+        if batched is None:
+            gxs = f.backward(*gys)
+        else:
+            gxs = f.backward_per_sample(batched, *gys)
+    if not isinstance(gxs, tuple):
+        gxs = (gxs,)
+    return gxs, time.perf_counter() - start
+
+
+def _owned_grad(gx, held: list):
+    '''
+    叶子Tensor(以及retain_grad时的中间结果)的梯度在反向传播之后还会被优化器、grad_clipping等原地修改，
+    第一次累加时必须是独占的可写数组。只读的数组(如sum的反向传播得到的广播视图)、其他数组的视图、输出的梯度或已经交给其他输入的数组需要复制一份
+    '''
+    flags = getattr(gx, 'flags', None)
+    if flags is None:
+        return gx
+    if gx.base is not None or not getattr(flags, 'writeable', True) or any(gx is h for h in held):
+        # 保持原来的内存布局，如channels_last的梯度
+        return gx.copy(order='K')
+    return gx
+
+
+def _accumulate_grads(f, gxs, batched=None, retain_grad: bool = False) -> None:
+    '''把梯度累加到f的输入上'''
+    # 像Add这样直接把输出的梯度传给多个输入的函数，这些输入不能共用同一个数组。
+    # 中间结果的梯度用完就被释放，不会被原地修改，直接引用，不需要复制
+    held = [gy for gy in (_output_grad(output) for output in f.outputs) if gy is not None]
+    for i, (x, gx) in enumerate(zip(f.inputs, gxs)):
+        if gx is not None and isinstance(x, Tensor) and x.requires_grad:
+            # 逐样本梯度模式下，不依赖样本的输入的梯度在最前面多了一个batch维度
+            shape = gx.shape if batched is None or batched[i] else gx.shape[1:]
+            assert x.shape == shape, f"grad shape must match tensor shape in {f!r}, {shape!r} != {x.shape!r}"
+            if batched is not None and x.grad is not None:
+                assert x.grad.shape == gx.shape, f"cannot accumulate per-sample grad {gx.shape!r} into " \
+                                                 f"existing grad {x.grad.shape!r}, call zero_grad(set_to_none=True)"
+            if x.grad is None:
+                x._grad = _owned_grad(gx, held) if retain_grad or x.creator is None else gx
+                held.append(x._grad)
+            else:
+                x._grad = x._grad + gx  # 【根据链式法则的逻辑，累加多个路径传递的梯度】grad本身不需要计算梯度，所以普通NdArray即可
+
+
+def _finish_function(f, retain_grad: bool, retain_graph: bool, pending: dict) -> None:
+    '''f的backward完成后，清除中间变量的梯度并释放计算图'''
+    if not retain_grad:
+        for y in f.outputs:
+            y = y()
+            if y is not None:
+                y._grad = None
+
+    if not retain_graph:
+        _release_function(f, pending)
+
+
+def _batched_inputs(funcs: List) -> dict:
+    '''
+    逐样本梯度模式下，计算每个函数的每个输入是否依赖样本(第0维是batch维度)
+    Parameter和0维的叶子Tensor不依赖样本，其他叶子Tensor依赖样本，函数的输出只要有一个输入依赖样本就依赖样本
+    Returns:
+        函数 -> 每个输入是否依赖样本的元组，不是Tensor的输入为None
+    '''
+    from mytorch.paramater import Parameter
+
+    out_batched = {}
+    batched = {}
+    # funcs按generation从大到小排列，倒过来遍历时输入的creator一定先被处理
+    for f in reversed(funcs):
+        flags = []
+        for x in f.inputs:
+            if not isinstance(x, Tensor):
+                flags.append(None)
+            elif x.creator in out_batched:
+                flags.append(out_batched[x.creator])
+            else:
+                flags.append(not isinstance(x, Parameter) and x.ndim > 0)
+        batched[f] = tuple(flags)
+        out_batched[f] = any(flags)
+    return batched
+
+
+_backward_pool = None
+
+
+def _get_backward_pool(workers: int) -> ThreadPoolExecutor:
+    global _backward_pool
+    if _backward_pool is None or _backward_pool._max_workers != workers:
+        if _backward_pool is not None:
+            _backward_pool.shutdown(wait=False)
+        _backward_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mytorch-backward")
+    return _backward_pool
+
+
+def _parallel_backward(funcs: List, workers: int, retain_grad: bool, retain_graph: bool, pending: dict) -> None:
+    '''
+    并行反向传播。一个函数的所有输出都被使用它们的函数处理完之后，它的梯度才是完整的，此时它就可以执行。
+    工作线程只执行Function.backward，梯度累加、计算图释放和依赖计数都在当前线程完成，
+    所以多个分支累加到同一个输入时不需要加锁。多个分支完成的先后顺序不固定，梯度累加的顺序也不固定
+    '''
+    index = {f: i for i, f in enumerate(funcs)}
+    # deps[i]: 还没有完成的、使用funcs[i]输出的函数数量；children[i]: funcs[i]输入的creator
+    deps = [0] * len(funcs)
+    children = [[] for _ in funcs]
+    for i, f in enumerate(funcs):
+        for x in f.inputs:
+            j = index.get(_grad_creator(x))
+            if j is not None:
+                deps[j] += 1
+                children[i].append(j)
+
+    pool = _get_backward_pool(workers)
+    ready = deque(i for i, n in enumerate(deps) if n == 0)
+    running = {}
+
+    def complete(i, gxs):
+        f = funcs[i]
+        if gxs is not None:
+            _accumulate_grads(f, gxs, retain_grad=retain_grad)
+            _finish_function(f, retain_grad, retain_graph, pending)
+        elif not retain_graph:
+            _release_function(f, pending)
+        for j in children[i]:
+            deps[j] -= 1
+            if deps[j] == 0:
+                ready.append(j)
+
+    while ready or running:
+        while ready:
+            i = ready.popleft()
+            f = funcs[i]
+            gys = [_output_grad(output) for output in f.outputs]
+            if not retain_graph:
+                pending.pop(f, None)
+            if all(gy is None for gy in gys):
+                complete(i, None)
+            else:
+                running[pool.submit(_call_backward, f, gys)] = i
+
+        if running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = running.pop(future)
+                gxs, elapsed = future.result()
+                BackwardStats.backward_time += elapsed
+                complete(i, gxs)
+
+
+def _output_grad(output):
+    y = output()
+    return None if y is None else y.grad
+
+
+def _release_function(f, pending: dict) -> None:
+    '''
+    断开输出和函数之间的链接，并释放函数保存的中间结果和输入
+    pending保存还没有被处理的creator的输出，它们的梯度还需要被读取
+    '''
+    for y in f.outputs:
+        y = y()
+        if y is not None:
+            y.creator = None
+            y._released = True
+    for x in f.inputs:
+        creator = _grad_creator(x)
+        if creator is not None:
+            pending.setdefault(creator, []).append(x)
+    f.release()
+
+
+_RELEASED_GRAPH_MESSAGE = ("Trying to backward through the graph a second time, but the saved intermediate results "
+                           "have already been freed. Specify retain_graph=True if you need to backward through "
+                           "the graph a second time")
+
+
+def _grad_creator(x):
+    '''返回需要继续反向传播的输入的creator，creator已经被之前的反向传播释放时报错，否则会悄悄丢掉这部分梯度'''
+    if isinstance(x, Tensor) and x.requires_grad:
+        if x.creator is None and x._released:
+            raise RuntimeError(_RELEASED_GRAPH_MESSAGE)
+        return x.creator
+    return None
+
+
+class _Schedule:
+    '''
+    缓存的反向传播调度，steps[k]对应拓扑排序中的第k个函数，包含：
+    (函数类型, 输入个数, 有creator的输入(输入下标, creator在调度中的位置), 其余输入的下标)
+    '''
+
+    def __init__(self, order: List):
+        index = {f: k for k, f in enumerate(order)}
+        self.steps = []
+        for f in order:
+            links, free = [], []
+            for i, x in enumerate(f.inputs):
+                creator = _grad_creator(x)
+                if creator is None:
+                    free.append(i)
+                else:
+                    links.append((i, index[creator]))
+            self.steps.append((type(f), len(f.inputs), tuple(links), tuple(free)))
+
+
+# 以 (根函数类型, 根函数generation, 输出形状) 为键缓存调度
+_schedule_cache = {}
+_SCHEDULE_CACHE_SIZE = 64
+
+
+def _build_schedule(root) -> List:
+    '''
+    按照generation从大到小对计算图中的函数进行拓扑排序
+    '''
+    funcs = []  # 候选函数堆
+    order = []
+    seen_set = set()
+
+    def add_func(f):
+        if f not in seen_set:
+            # heapq是小顶堆，为了实现大顶堆的效果，需要加一个负号
+            heapq.heappush(funcs, (-f.generation, len(seen_set), f))
+            seen_set.add(f)
+
+    add_func(root)
+    while funcs:
+        _, _, f = heapq.heappop(funcs)
+        order.append(f)
+        for x in f.inputs:
+            creator = _grad_creator(x)
+            if creator is not None:
+                add_func(creator)  # 【对于当前操作的所有输入，如果它们有creator，将其加入堆中】
+
+    return order
+
+
+def _replay_schedule(root, schedule: _Schedule):
+    '''
+    沿着缓存的边从根函数出发找到本次计算图中对应的函数，不需要堆和集合。
+    任何结构上的不一致都会返回None，此时需要重新计算调度
+    '''
+    steps = schedule.steps
+    n = len(steps)
+    nodes = [None] * n
+    nodes[0] = root
+
+    for k, (cls, arity, links, free) in enumerate(steps):
+        f = nodes[k]
+        if type(f) is not cls:
+            return None
+        inputs = f.inputs
+        if len(inputs) != arity:
+            return None
+        for i, j in links:
+            creator = _grad_creator(inputs[i])
+            if creator is None:
+                return None
+            if nodes[j] is None:
+                nodes[j] = creator
+            elif nodes[j] is not creator:
+                return None
+        # 缓存中没有creator的输入，在本次计算图中也不能有
+        for i in free:
+            if _grad_creator(inputs[i]) is not None:
+                return None
+
+    # 同一个函数不能出现在两个位置
+    if len(set(nodes)) != n:
+        return None
+
+    return nodes
+
+
+def _get_schedule(tensor: Tensor) -> List:
+    root = tensor.creator
+    if not Config.cache_schedule:
+        BackwardStats.cache_misses += 1
+        return _build_schedule(root)
+
+    key = (type(root), root.generation, tensor.shape)
+    schedule = _schedule_cache.get(key)
+    if schedule is not None:
+        nodes = _replay_schedule(root, schedule)
+        if nodes is not None:
+            BackwardStats.cache_hits += 1
+            return nodes
+
+    BackwardStats.cache_misses += 1
+    order = _build_schedule(root)
+
+    if len(_schedule_cache) >= _SCHEDULE_CACHE_SIZE:
+        _schedule_cache.clear()
+    _schedule_cache[key] = _Schedule(order)
+
+    return order
+
+
 def register(name, fxn):
     # 将运算类（如 Add, Mul）动态绑定到 Tensor 的魔法方法（如__add__）上
     def dispatch(*xs, **kwargs):
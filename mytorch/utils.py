@@ -341,7 +341,9 @@ def ngrams_iterator(token_list, ngrams):
 
 def grad_clipping(model: nn.Module, theta: float):
     """梯度裁剪，参考d2l"""
-    params = [p for p in model.parameters() if p.requires_grad]
+    params = [p for p in model.parameters() if p.requires_grad and p.grad is not None]
+    if not params:
+        return
 
     xp = get_array_module(params[0].grad)
 
@@ -0,0 +1,120 @@
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Tuple
+
+from mytorch.tensor import NdArray
+
+'''
+卷积和池化每次调用都会为相同形状的输入分配填充后的图像等临时缓冲区，
+大batch训练时反复申请和释放大块内存会带来分配器的开销和缺页中断。
+Workspace按 (用途, 形状, dtype, 数组模块) 缓存这些缓冲区，在之后的迭代中复用：
+    acquire: 借出一个缓冲区，借出期间不会再借给别人(同一个前向传播中形状相同的两层拿到的是不同的缓冲区)
+    release: 归还缓冲区，放回缓存等待复用
+    release_after: owner被回收时自动归还，用于保存到反向传播的视图，Function释放后缓冲区才能复用
+缓存的空闲缓冲区总大小不超过max_bytes，超出时按最近最少使用的顺序丢弃
+'''
+
+# 默认最多缓存256MB的空闲缓冲区
+DEFAULT_MAX_BYTES = 256 * 2 ** 20
+
+
+class Workspace:
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        '''
+        Args:
+            max_bytes: 缓存的空闲缓冲区的总字节数上限，为0时不缓存
+        '''
+        self.max_bytes = max_bytes
+        # key => 空闲的缓冲区列表，按最近使用的顺序排列，最前面的最久没有使用
+        self._free = OrderedDict()
+        # 借出的缓冲区的id => key
+        self._leased = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def acquire(self, tag: str, shape: Tuple[int, ...], dtype, xp) -> NdArray:
+        '''
+        借出一个未初始化的缓冲区，用完后需要release或release_after
+
+        Args:
+            tag: 用途，例如'conv.pad'，不同用途的缓冲区不会混用
+            shape: 形状
+            dtype: 数据类型
+            xp: numpy或cupy
+        Returns:
+            NdArray: 内容未初始化的数组
+        '''
+        key = (tag, tuple(shape), xp.dtype(dtype).str, xp.__name__)
+        buffer = None
+        with self._lock:
+            buffers = self._free.get(key)
+            if buffers:
+                buffer = buffers.pop()
+                if not buffers:
+                    del self._free[key]
+                self._bytes -= buffer.nbytes
+                self.hits += 1
+            else:
+                self.misses += 1
+        if buffer is None:
+            buffer = xp.empty(shape, dtype=dtype)
+        with self._lock:
+            self._leased[id(buffer)] = key
+        return buffer
+
+    def release(self, buffer: NdArray) -> None:
+        '''归还acquire借出的缓冲区，之后不能再使用它'''
+        with self._lock:
+            key = self._leased.pop(id(buffer), None)
+            if key is None or buffer.nbytes > self.max_bytes:
+                return
+            self._free.setdefault(key, []).append(buffer)
+            self._free.move_to_end(key)
+            self._bytes += buffer.nbytes
+            while self._bytes > self.max_bytes:
+                oldest, buffers = next(iter(self._free.items()))
+                self._bytes -= buffers.pop(0).nbytes
+                self.evictions += 1
+                if not buffers:
+                    del self._free[oldest]
+
+    def release_after(self, owner: NdArray, buffer: NdArray) -> None:
+        '''owner被垃圾回收时归还buffer，owner通常是buffer的视图'''
+        weakref.finalize(owner, self.release, buffer)
+
+    def clear(self) -> None:
+        '''丢弃所有空闲的缓冲区，借出的缓冲区归还时仍然会被缓存'''
+        with self._lock:
+            self._free.clear()
+            self._bytes = 0
+
+    @property
+    def cached_bytes(self) -> int:
+        '''缓存的空闲缓冲区的总字节数'''
+        return self._bytes
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'cached_bytes': self._bytes, 'leased': len(self._leased)}
+
+    def reset_stats(self) -> None:
+        self.hits = self.misses = self.evictions = 0
+
+
+_workspace = Workspace()
+
+
+def get_workspace() -> Workspace:
+    '''卷积和池化使用的全局Workspace'''
+    return _workspace
+
+
+def set_workspace_limit(max_bytes: int) -> None:
+    '''设置全局Workspace缓存的字节数上限，为0时不再缓存，已经缓存的缓冲区会被丢弃'''
+    _workspace.max_bytes = max_bytes
+    if max_bytes <= 0:
+        _workspace.clear()
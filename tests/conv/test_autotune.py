@@ -0,0 +1,92 @@
+import json
+
+import numpy as np
+import pytest
+
+import mytorch.functions as F
+from mytorch import autotune
+from mytorch.autotune import Autotuner, get_autotuner
+from mytorch.tensor import Tensor
+
+
+@pytest.fixture
+def tuner(tmp_path):
+    default_path = get_autotuner().path
+    autotune.set_cache_path(str(tmp_path / 'conv_autotune.json'))
+    autotune.enable()
+    tuner = get_autotuner()
+    tuner.measured = 0
+    yield tuner
+    autotune.enable(False)
+    autotune.set_override(None)
+    autotune.set_cache_path(default_path)
+
+
+def algorithm_used(x, w, **kwargs):
+    y = F.conv2d(Tensor(x, requires_grad=True), Tensor(w, requires_grad=True), **kwargs)
+    return y, y.creator.saved_tensors[4]
+
+
+def test_measures_once_and_persists(tuner):
+    x, w = np.random.randn(2, 8, 9, 9), np.random.randn(8, 8, 3, 3)
+    y, algorithm = algorithm_used(x, w, padding=1)
+    assert algorithm in ('gemm', 'winograd', 'fft')
+    assert tuner.measured == 1 and list(tuner.table().values()) == [algorithm]
+    np.testing.assert_allclose(y.data, F.conv2d(Tensor(x), Tensor(w), padding=1, algorithm='gemm').data,
+                               rtol=1e-8, atol=1e-8)
+
+    # 相同的配置直接查表
+    assert algorithm_used(x, w, padding=1)[1] == algorithm and tuner.measured == 1
+
+    with open(tuner.path) as f:
+        cache = json.load(f)
+    assert cache == {autotune.cpu_key(): tuner.table()}
+    # 新的进程从缓存文件读取，不需要重新测量
+    assert Autotuner(tuner.path, enabled=True).table() == tuner.table()
+
+
+def test_single_candidate_not_measured(tuner):
+    # depthwise卷积只支持gemm
+    algorithm_used(np.random.randn(2, 4, 6, 6), np.random.randn(4, 1, 3, 3), padding=1, groups=4)
+    assert tuner.measured == 0
+
+
+def test_override(tuner):
+    x = np.random.randn(1, 4, 8, 8)
+    autotune.set_override('fft')
+    assert algorithm_used(x, np.random.randn(4, 4, 3, 3))[1] == 'fft'
+    # winograd不支持5x5卷积，使用经验规则
+    autotune.set_override('winograd')
+    assert algorithm_used(x, np.random.randn(4, 4, 5, 5))[1] == 'gemm'
+    autotune.set_override('auto')
+    assert algorithm_used(x, np.random.randn(4, 4, 3, 3))[1] == 'gemm'
+    # 显式指定的算法不受影响
+    assert algorithm_used(x, np.random.randn(4, 4, 3, 3), algorithm='winograd')[1] == 'winograd'
+    assert tuner.measured == 0
+
+    with pytest.raises(ValueError):
+        autotune.set_override('direct')
+
+
+def test_disabled_uses_heuristic(tuner):
+    autotune.enable(False)
+    assert algorithm_used(np.random.randn(1, 4, 8, 8), np.random.randn(4, 4, 3, 3))[1] == 'gemm'
+    assert tuner.measured == 0 and tuner.table() == {}
+
+
+def test_backward_measured_only_when_needed(tuner, monkeypatch):
+    backward = []
+    grads = F.Conv2d._grads
+    monkeypatch.setattr(F.Conv2d, '_grads', lambda self, gy: backward.append(self.needs_input_grad) or grads(self, gy))
+    x, w = np.random.randn(2, 8, 9, 9), np.random.randn(8, 8, 3, 3)
+
+    # 输入和权重都不需要梯度(如冻结的特征提取层)时只测量前向传播
+    F.conv2d(Tensor(x), Tensor(w), padding=1)
+    assert tuner.measured == 1 and backward == []
+    # 需要梯度时按需要梯度的参数测量反向传播，缓存在不同的键下
+    F.conv2d(Tensor(x), Tensor(w, requires_grad=True), padding=1)
+    assert tuner.measured == 2 and backward and set(backward) == {(False, True)}
+    backward.clear()
+    algorithm_used(x, w, padding=1)
+    assert tuner.measured == 3 and set(backward) == {(True, True)}
+    assert len(tuner.table()) == 3
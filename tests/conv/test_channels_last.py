@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+import torch
+
+import mytorch.functions as F
+from mytorch.conv import is_channels_last
+from mytorch.module import AdaptiveAvgPool2D, BatchNorm2d, Conv2D, MaxPooling2D
+from mytorch.paramater import Parameter
+from mytorch.tensor import Tensor
+
+
+def run(fn, x, *params):
+    '''分别用NCHW和channels last的输入计算，返回两次的输出和所有梯度'''
+    results = []
+    for convert in (lambda t: t, F.to_channels_last):
+        tx = Tensor(x, requires_grad=True)
+        for p in params:
+            p.zero_grad(set_to_none=True)
+        y = fn(convert(tx))
+        y.backward(np.cos(np.arange(y.data.size)).reshape(y.shape))
+        results.append((y.data, tx.grad, *(p.grad for p in params)))
+    return results
+
+
+@pytest.mark.parametrize("kernel, stride, padding, groups", [
+    (3, 1, 1, 1), (3, 2, 1, 2), (1, 1, 0, 1), (1, 1, 0, 2), (3, 1, 1, 4), (5, 2, 2, 1),
+])
+def test_conv_channels_last(kernel, stride, padding, groups):
+    x = np.random.randn(2, 4, 9, 8)
+    w = Parameter(Tensor(np.random.randn(8, 4 // groups, kernel, kernel)))
+    b = Parameter(Tensor(np.random.randn(8)))
+    (y, *grads), (y_cl, *grads_cl) = run(lambda t: F.conv2d(t, w, b, stride, padding, groups), x, w, b)
+
+    assert is_channels_last(y_cl)
+    assert is_channels_last(grads_cl[0])
+    np.testing.assert_allclose(y_cl, y, rtol=1e-10, atol=1e-10)
+    for g, g_cl in zip(grads, grads_cl):
+        np.testing.assert_allclose(g_cl, g, rtol=1e-10, atol=1e-10)
+
+    expected = torch.nn.functional.conv2d(torch.tensor(x), torch.tensor(w.data), torch.tensor(b.data), stride,
+                                          padding, groups=groups)
+    np.testing.assert_allclose(y_cl, expected.numpy(), rtol=1e-8, atol=1e-8)
+
+
+@pytest.mark.parametrize("groups", [1, 2])
+def test_pointwise_per_sample_channels_last(groups):
+    x = np.random.randn(3, 4, 5, 5)
+    w = Parameter(Tensor(np.random.randn(6, 4 // groups, 1, 1)))
+    grads = []
+    for convert in (lambda t: t, F.to_channels_last):
+        w.zero_grad(set_to_none=True)
+        F.conv2d(convert(Tensor(x)), w, groups=groups).sum().backward(per_sample=True)
+        grads.append(w.grad)
+    assert grads[1].shape == (3, 6, 4 // groups, 1, 1)
+    np.testing.assert_allclose(grads[1], grads[0], rtol=1e-10, atol=1e-10)
+
+
+@pytest.mark.parametrize("layer", [
+    MaxPooling2D(2, 2, 2), MaxPooling2D(3, 3, 2, padding=1), AdaptiveAvgPool2D(1), AdaptiveAvgPool2D((3, 2)),
+])
+def test_pooling_channels_last(layer):
+    x = np.random.randn(2, 3, 9, 8)
+    (y, gx), (y_cl, gx_cl) = run(layer, x)
+    if y_cl.shape[2:] != (1, 1):
+        assert is_channels_last(y_cl) and is_channels_last(gx_cl)
+    np.testing.assert_allclose(y_cl, y)
+    np.testing.assert_allclose(gx_cl, gx)
+
+
+def test_avg_pool_channels_last():
+    x = np.random.randn(2, 3, 9, 8)
+    for kernel, stride, padding in ((2, 2, 0), (3, 2, 1)):
+        (y, gx), (y_cl, gx_cl) = run(lambda t: F.avg_pool2d(t, kernel, stride, padding), x)
+        assert is_channels_last(y_cl) and is_channels_last(gx_cl)
+        np.testing.assert_allclose(y_cl, y)
+        np.testing.assert_allclose(gx_cl, gx)
+
+
+def test_batch_norm_channels_last():
+    layer = BatchNorm2d(3)
+    x = np.random.randn(4, 3, 5, 5)
+    (y, *grads), (y_cl, *grads_cl) = run(layer, x, layer.weight, layer.bias)
+    assert is_channels_last(y_cl)
+    np.testing.assert_allclose(y_cl, y, rtol=1e-10, atol=1e-10)
+    for g, g_cl in zip(grads, grads_cl):
+        np.testing.assert_allclose(g_cl, g, rtol=1e-10, atol=1e-10)
+
+
+def test_conversion_round_trip():
+    x = Tensor(np.random.randn(2, 3, 4, 5), requires_grad=True)
+    y = F.to_channels_last(x)
+    assert is_channels_last(y.data) and not is_channels_last(F.to_channels_first(y).data)
+    assert F.to_channels_last(y).data is y.data
+    F.to_channels_first(y).sum().backward()
+    np.testing.assert_array_equal(x.grad, np.ones(x.shape))
+
+
+def test_network_keeps_channels_last():
+    conv1, conv2 = Conv2D(3, 8, (3, 3), padding=1), Conv2D(8, 8, (1, 1))
+    pool, bn = MaxPooling2D(2, 2, 2), BatchNorm2d(8)
+    y = F.to_channels_last(Tensor(np.random.randn(2, 3, 8, 8)))
+    for layer in (conv1, bn, F.relu, pool, conv2):
+        y = layer(y)
+        assert is_channels_last(y.data)
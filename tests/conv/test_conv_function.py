@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+import torch
+
+import mytorch.functions as F
+from mytorch import jit
+from mytorch.module import Conv2D, Conv2d
+from mytorch.tensor import Tensor
+
+
+@pytest.mark.parametrize("stride, padding, groups", [(1, 0, 1), (2, 1, 1), (1, 1, 2), (2, 2, 4)])
+def test_conv2d_matches_torch(stride, padding, groups):
+    x = np.random.randn(2, 4, 9, 8)
+    w = np.random.randn(8, 4 // groups, 3, 3)
+    b = np.random.randn(8)
+
+    mx, mw, mb = Tensor(x, requires_grad=True), Tensor(w, requires_grad=True), Tensor(b, requires_grad=True)
+    tx, tw, tb = (torch.tensor(a, requires_grad=True) for a in (x, w, b))
+
+    y = F.conv2d(mx, mw, mb, stride, padding, groups)
+    expected = torch.nn.functional.conv2d(tx, tw, tb, stride, padding, groups=groups)
+    np.testing.assert_allclose(y.data, expected.detach().numpy(), rtol=1e-6, atol=1e-8)
+
+    g = np.random.randn(*y.shape)
+    y.backward(g)
+    expected.backward(torch.tensor(g))
+    np.testing.assert_allclose(mx.grad, tx.grad.numpy(), rtol=1e-6, atol=1e-8)
+    np.testing.assert_allclose(mw.grad, tw.grad.numpy(), rtol=1e-6, atol=1e-8)
+    np.testing.assert_allclose(mb.grad, tb.grad.numpy(), rtol=1e-6, atol=1e-8)
+
+
+def test_depthwise_conv_matches_torch():
+    x = np.random.randn(2, 16, 10, 10)
+    w = np.random.randn(16, 1, 3, 3)
+    mx, mw = Tensor(x, requires_grad=True), Tensor(w, requires_grad=True)
+    tx, tw = torch.tensor(x, requires_grad=True), torch.tensor(w, requires_grad=True)
+
+    y = F.conv2d(mx, mw, stride=2, padding=1, groups=16)
+    expected = torch.nn.functional.conv2d(tx, tw, stride=2, padding=1, groups=16)
+    np.testing.assert_allclose(y.data, expected.detach().numpy(), rtol=1e-6, atol=1e-8)
+
+    y.sum().backward()
+    expected.sum().backward()
+    np.testing.assert_allclose(mx.grad, tx.grad.numpy(), rtol=1e-6, atol=1e-8)
+    np.testing.assert_allclose(mw.grad, tw.grad.numpy(), rtol=1e-6, atol=1e-8)
+
+
+@pytest.mark.parametrize("groups", [1, 2])
+def test_pointwise_conv_matches_torch(groups):
+    x = np.random.randn(3, 4, 5, 6)
+    w = np.random.randn(6, 4 // groups, 1, 1)
+    b = np.random.randn(6)
+    mx, mw, mb = Tensor(x, requires_grad=True), Tensor(w, requires_grad=True), Tensor(b, requires_grad=True)
+    tx, tw, tb = (torch.tensor(a, requires_grad=True) for a in (x, w, b))
+
+    y = F.conv2d(mx, mw, mb, groups=groups)
+    expected = torch.nn.functional.conv2d(tx, tw, tb, groups=groups)
+    np.testing.assert_allclose(y.data, expected.detach().numpy(), rtol=1e-6, atol=1e-8)
+
+    g = np.random.randn(*y.shape)
+    y.backward(g)
+    expected.backward(torch.tensor(g))
+    np.testing.assert_allclose(mx.grad, tx.grad.numpy(), rtol=1e-6, atol=1e-8)
+    np.testing.assert_allclose(mw.grad, tw.grad.numpy(), rtol=1e-6, atol=1e-8)
+    np.testing.assert_allclose(mb.grad, tb.grad.numpy(), rtol=1e-6, atol=1e-8)
+
+
+def test_conv_modules_propagate_gradients():
+    x = Tensor(np.random.randn(2, 3, 6, 6), requires_grad=True)
+    for layer in (Conv2D(3, 4, (3, 3), padding=1), Conv2d(3, 4, 3, stride=2, bias=False)):
+        x.zero_grad(set_to_none=True)
+        layer(x).sum().backward()
+        assert x.grad is not None and x.grad.shape == x.shape
+        for p in layer.parameters():
+            assert p.grad is not None and p.grad.shape == p.shape
+
+
+def test_conv2d_per_sample_grad():
+    x = np.random.randn(3, 2, 5, 5)
+    layer = Conv2D(2, 4, (3, 3), padding=1, groups=2)
+    F.conv2d(Tensor(x), layer.weight, layer.bias, 1, 1, 2).sum().backward(per_sample=True)
+    grads = [layer.weight.grad, layer.bias.grad]
+
+    for b in range(3):
+        layer.zero_grad(set_to_none=True)
+        layer(Tensor(x[b:b + 1])).sum().backward()
+        np.testing.assert_allclose(grads[0][b], layer.weight.grad, rtol=1e-6, atol=1e-8)
+        np.testing.assert_allclose(grads[1][b], layer.bias.grad, rtol=1e-6, atol=1e-8)
+
+
+def test_pointwise_per_sample_grad():
+    x = np.random.randn(3, 4, 5, 5)
+    layer = Conv2D(4, 6, (1, 1), groups=2)
+    F.conv2d(Tensor(x), layer.weight, layer.bias, groups=2).sum().backward(per_sample=True)
+    grad = layer.weight.grad
+
+    for b in range(3):
+        layer.zero_grad(set_to_none=True)
+        layer(Tensor(x[b:b + 1])).sum().backward()
+        np.testing.assert_allclose(grad[b], layer.weight.grad, rtol=1e-6, atol=1e-8)
+
+
+def test_trace_conv():
+    layer = Conv2D(3, 4, (3, 3), stride=2, padding=1)
+    x = Tensor(np.random.randn(2, 3, 7, 7))
+    traced = jit.trace(layer, x)
+    np.testing.assert_allclose(traced(x).data, layer(x).data)
+    assert traced.verify(x)
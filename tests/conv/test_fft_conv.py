@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+import torch
+
+import mytorch.functions as F
+from mytorch.conv import fft_conv
+from mytorch.paramater import Parameter
+from mytorch.tensor import Tensor
+
+
+@pytest.mark.parametrize("shape, k, stride, padding", [
+    ((2, 3, 12, 11), 7, 1, 0),
+    ((1, 2, 15, 13), 5, 1, 3),
+    ((2, 3, 17, 19), 5, 2, 1),
+    ((1, 3, 27, 27), 11, 4, 0),
+    ((1, 2, 9, 9), 3, 3, 2),
+])
+def test_fft_conv_matches_torch(shape, k, stride, padding):
+    x = np.random.randn(*shape)
+    w = np.random.randn(4, shape[1], k, k)
+    b = np.random.randn(4)
+
+    mx, mw, mb = Tensor(x, requires_grad=True), Tensor(w, requires_grad=True), Tensor(b, requires_grad=True)
+    tx, tw, tb = (torch.tensor(a, requires_grad=True) for a in (x, w, b))
+
+    y = F.conv2d(mx, mw, mb, stride, padding, algorithm='fft')
+    expected = torch.nn.functional.conv2d(tx, tw, tb, stride, padding)
+    np.testing.assert_allclose(y.data, expected.detach().numpy(), rtol=1e-8, atol=1e-8)
+
+    g = np.random.randn(*y.shape)
+    y.backward(g)
+    expected.backward(torch.tensor(g))
+    np.testing.assert_allclose(mx.grad, tx.grad.numpy(), rtol=1e-8, atol=1e-8)
+    np.testing.assert_allclose(mw.grad, tw.grad.numpy(), rtol=1e-8, atol=1e-8)
+    np.testing.assert_allclose(mb.grad, tb.grad.numpy(), rtol=1e-8, atol=1e-8)
+
+
+def test_tile_size_does_not_change_result():
+    x = np.random.randn(2, 3, 20, 18).astype(np.float32)
+    w = np.random.randn(5, 3, 7, 7).astype(np.float32)
+    expected = fft_conv(x, w, 1, 2, np)
+    assert expected.dtype == np.float32
+    for tile in (1, 4, 9):
+        np.testing.assert_allclose(fft_conv(x, w, 1, 2, np, tile=tile), expected, rtol=1e-4, atol=1e-4)
+
+
+def test_per_sample_grad():
+    x = np.random.randn(3, 2, 10, 10)
+    w = Parameter(Tensor(np.random.randn(4, 2, 5, 5)))
+    grads = {}
+    for algorithm in ('gemm', 'fft'):
+        w.zero_grad(set_to_none=True)
+        F.conv2d(Tensor(x), w, stride=2, padding=1, algorithm=algorithm).sum().backward(per_sample=True)
+        grads[algorithm] = w.grad
+    assert grads['fft'].shape == (3, 4, 2, 5, 5)
+    np.testing.assert_allclose(grads['fft'], grads['gemm'], rtol=1e-8, atol=1e-8)
+
+
+def test_algorithm_selection():
+    with pytest.raises(ValueError):
+        F.conv2d(Tensor(np.random.randn(1, 4, 9, 9)), Tensor(np.random.randn(4, 2, 7, 7)), groups=2, algorithm='fft')
+
+    assert F.Conv2d()._select((32, 32, 11, 11)) == 'fft'
+    assert F.Conv2d()._select((256, 256, 7, 7)) == 'gemm'
+    assert F.Conv2d()._select((64, 3, 7, 7)) == 'gemm'
+    assert F.Conv2d()._select((64, 64, 7, 7)) == 'gemm'
+    assert F.Conv2d(stride=4)._select((96, 3, 11, 11)) == 'gemm'
+    assert F.Conv2d(stride=4, algorithm='fft')._select((96, 3, 11, 11)) == 'fft'
@@ -0,0 +1,129 @@
+import threading
+
+import numpy as np
+import pytest
+
+import mytorch
+import mytorch.functions as F
+from mytorch import parallel
+from mytorch.conv import is_channels_last
+from mytorch.paramater import Parameter
+from mytorch.parallel import map_batches, join_batches
+from mytorch.tensor import Tensor
+
+
+@pytest.fixture
+def threads():
+    mytorch.set_num_threads(3)
+    yield
+    mytorch.set_num_threads(1)
+
+
+def run(x, w, b, **kwargs):
+    tx, tw, tb = Tensor(x, requires_grad=True), Tensor(w, requires_grad=True), Tensor(b, requires_grad=True)
+    y = F.conv2d(tx, tw, tb, **kwargs)
+    y.backward(np.cos(np.arange(y.data.size)).reshape(y.shape))
+    return y.data, tx.grad, tw.grad, tb.grad
+
+
+@pytest.mark.parametrize("cin, cout, kernel, kwargs", [
+    (4, 6, 3, dict(stride=2, padding=1)),
+    (4, 8, 3, dict(padding=1, groups=2)),
+    (4, 4, 3, dict(padding=1, groups=4)),
+    (4, 6, 1, dict()),
+    (4, 6, 3, dict(padding=1, relu=True)),
+])
+@pytest.mark.parametrize("channels_last", [False, True])
+def test_sharded_conv_matches_serial(threads, cin, cout, kernel, kwargs, channels_last):
+    x = np.random.randn(5, cin, 7, 6)
+    if channels_last:
+        x = np.ascontiguousarray(x.transpose(0, 2, 3, 1)).transpose(0, 3, 1, 2)
+    w = np.random.randn(cout, cin // kwargs.get('groups', 1), kernel, kernel)
+    b = np.random.randn(cout)
+
+    actual = run(x, w, b, **kwargs)
+    mytorch.set_num_threads(1)
+    expected = run(x, w, b, **kwargs)
+    for a, e in zip(actual, expected):
+        np.testing.assert_allclose(a, e, rtol=1e-10, atol=1e-10)
+    assert is_channels_last(actual[0]) == is_channels_last(expected[0])
+    assert is_channels_last(actual[1]) == channels_last
+
+
+def test_sharded_per_sample_grad(threads):
+    x = np.random.randn(4, 2, 5, 5)
+    w = Parameter(Tensor(np.random.randn(4, 2, 3, 3)))
+    F.conv2d(Tensor(x), w, padding=1).sum().backward(per_sample=True)
+    grad = w.grad
+
+    mytorch.set_num_threads(1)
+    w.zero_grad(set_to_none=True)
+    F.conv2d(Tensor(x), w, padding=1).sum().backward(per_sample=True)
+    assert grad.shape == (4, 4, 2, 3, 3)
+    np.testing.assert_allclose(grad, w.grad, rtol=1e-10, atol=1e-10)
+
+
+def test_map_batches(threads):
+    x = np.arange(10)
+    parts = map_batches(lambda a: a * 2, x)
+    assert [len(p) for p in parts] == [3, 3, 4]
+    np.testing.assert_array_equal(join_batches(parts), x * 2)
+    # 嵌套调用时串行执行
+    nested = map_batches(lambda a: len(map_batches(lambda b: b, a)), x)
+    assert nested == [1, 1, 1]
+    assert map_batches(lambda a: a, x[:1])[0].shape == (1,)
+
+    with pytest.raises(ValueError):
+        mytorch.set_num_threads(0)
+
+
+class FakeController:
+    '''记录BLAS线程数的变化，threadpoolctl的limit是整个进程的'''
+
+    def __init__(self):
+        self.blas_threads = 4
+        self.switches = 0
+
+    def limit(self, limits, user_api):
+        controller = self
+        original = self.blas_threads
+        self.blas_threads = limits
+        self.switches += 1
+
+        class Limiter:
+            def restore_original_limits(self):
+                controller.blas_threads = original
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                self.restore_original_limits()
+
+        return Limiter()
+
+
+def test_concurrent_sharding_restores_blas_threads(threads, monkeypatch):
+    controller = FakeController()
+    monkeypatch.setattr(parallel, '_get_controller', lambda: controller)
+    started, finish = threading.Barrier(3, timeout=10), threading.Event()
+
+    inside = []
+
+    def conv_backward():
+        with parallel._single_threaded_blas():
+            started.wait()
+            inside.append(controller.blas_threads)
+            finish.wait(timeout=10)
+
+    workers = [threading.Thread(target=conv_backward) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    started.wait()
+    finish.set()
+    for worker in workers:
+        worker.join()
+    # 两个线程共用一次限制，最后一个退出时恢复
+    assert inside == [1, 1]
+    assert controller.switches == 1
+    assert controller.blas_threads == 4
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+import torch
+
+import mytorch.functions as F
+from mytorch.module import AdaptiveAvgPool2D, MaxPool2d, MaxPooling2D
+from mytorch.tensor import Tensor
+
+
+@pytest.mark.parametrize("kind", ["max", "avg"])
+@pytest.mark.parametrize("shape, kernel, stride, padding", [
+    ((2, 3, 8, 8), 2, 2, 0),
+    ((2, 3, 9, 7), 2, 2, 0),
+    ((2, 3, 13, 13), 3, 2, 1),
+    ((1, 2, 10, 11), (3, 2), (2, 1), 1),
+    ((2, 2, 9, 9), 2, 3, 0),
+])
+def test_pool2d_matches_torch(kind, shape, kernel, stride, padding):
+    x = np.random.randn(*shape)
+    mx, tx = Tensor(x, requires_grad=True), torch.tensor(x, requires_grad=True)
+
+    y = getattr(F, f'{kind}_pool2d')(mx, kernel, stride, padding)
+    expected = getattr(torch.nn.functional, f'{kind}_pool2d')(tx, kernel, stride, padding)
+    np.testing.assert_allclose(y.data, expected.detach().numpy())
+
+    g = np.random.randn(*y.shape)
+    y.backward(g)
+    expected.backward(torch.tensor(g))
+    np.testing.assert_allclose(mx.grad, tx.grad.numpy(), rtol=1e-10, atol=1e-12)
+
+
+def test_max_pool_ties_take_first():
+    x = Tensor(np.ones((1, 1, 4, 4)), requires_grad=True)
+    F.max_pool2d(x, 2).sum().backward()
+    expected = np.zeros((4, 4))
+    expected[::2, ::2] = 1
+    np.testing.assert_array_equal(x.grad[0, 0], expected)
+
+
+@pytest.mark.parametrize("output_size", [1, (3, 4)])
+def test_adaptive_avg_pool(output_size):
+    x = np.random.randn(2, 3, 12, 12)
+    mx, tx = Tensor(x, requires_grad=True), torch.tensor(x, requires_grad=True)
+
+    y = AdaptiveAvgPool2D(output_size)(mx)
+    expected = torch.nn.functional.adaptive_avg_pool2d(tx, output_size)
+    np.testing.assert_allclose(y.data, expected.detach().numpy())
+
+    y.sum().backward()
+    expected.sum().backward()
+    np.testing.assert_allclose(mx.grad, tx.grad.numpy())
+
+
+def test_pool_modules_propagate_gradients():
+    for layer in (MaxPooling2D(2, 2, 2), MaxPooling2D(3, 3, 2, padding=1), MaxPool2d(2)):
+        x = Tensor(np.random.randn(2, 3, 8, 8), requires_grad=True)
+        layer(x).sum().backward()
+        assert x.grad is not None and x.grad.shape == x.shape
+        assert x.grad.sum() == np.prod(layer(x).shape)
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+import mytorch.functions as F
+from mytorch.conv import winograd_filter
+from mytorch.module import Conv2D
+from mytorch.optim import SGD
+from mytorch.paramater import Parameter
+from mytorch.tensor import Tensor
+
+
+def run(algorithm, x, w, b, padding):
+    tx, tw, tb = Tensor(x, requires_grad=True), Tensor(w, requires_grad=True), Tensor(b, requires_grad=True)
+    y = F.conv2d(tx, tw, tb, padding=padding, algorithm=algorithm)
+    y.backward(np.cos(np.arange(y.data.size)).reshape(y.shape).astype(y.dtype))
+    return y.data, tx.grad, tw.grad, tb.grad
+
+
+@pytest.mark.parametrize("shape, padding", [((2, 3, 8, 8), 1), ((1, 4, 7, 9), 0), ((3, 2, 5, 6), 2)])
+@pytest.mark.parametrize("dtype, tol", [(np.float64, 1e-10), (np.float32, 1e-4)])
+def test_winograd_matches_gemm(shape, padding, dtype, tol):
+    x = np.random.randn(*shape).astype(dtype)
+    w = np.random.randn(5, shape[1], 3, 3).astype(dtype)
+    b = np.random.randn(5).astype(dtype)
+
+    for expected, actual in zip(run('gemm', x, w, b, padding), run('winograd', x, w, b, padding)):
+        assert actual.dtype == dtype
+        np.testing.assert_allclose(actual, expected, rtol=tol, atol=tol)
+
+
+def test_filter_cache_follows_weight_updates():
+    layer = Conv2D(2, 3, (3, 3), padding=1, algorithm='winograd')
+    x = Tensor(np.random.randn(2, 2, 6, 6))
+    w = layer.weight.data
+    assert winograd_filter(w, np) is winograd_filter(w, np)
+
+    optimizer = SGD(layer.parameters(), lr=0.1)
+    layer(x).sum().backward()
+    optimizer.step()
+    assert layer.weight.data is not w
+
+    expected = F.conv2d(x, layer.weight, layer.bias, padding=1, algorithm='gemm')
+    np.testing.assert_allclose(layer(x).data, expected.data, rtol=1e-10, atol=1e-10)
+
+
+def test_per_sample_grad():
+    x = np.random.randn(3, 2, 5, 5)
+    w = Parameter(Tensor(np.random.randn(4, 2, 3, 3)))
+    grads = {}
+    for algorithm in ('gemm', 'winograd'):
+        w.zero_grad(set_to_none=True)
+        F.conv2d(Tensor(x), w, padding=1, algorithm=algorithm).sum().backward(per_sample=True)
+        grads[algorithm] = w.grad
+    assert grads['winograd'].shape == (3, 4, 2, 3, 3)
+    np.testing.assert_allclose(grads['winograd'], grads['gemm'], rtol=1e-10, atol=1e-10)
+
+
+def test_algorithm_selection():
+    x = Tensor(np.random.randn(1, 2, 5, 5))
+    with pytest.raises(ValueError):
+        F.conv2d(x, Tensor(np.random.randn(2, 2, 3, 3)), stride=2, algorithm='winograd')
+    with pytest.raises(ValueError):
+        F.conv2d(x, Tensor(np.random.randn(2, 1, 3, 3)), groups=2, algorithm='winograd')
+    with pytest.raises(ValueError):
+        Conv2D(2, 2, (3, 3), algorithm='fast')
+
+    assert F.Conv2d()._select((256, 256, 3, 3)) == 'winograd'
+    assert F.Conv2d()._select((64, 64, 3, 3)) == 'gemm'
+    assert F.Conv2d(stride=2)._select((256, 256, 3, 3)) == 'gemm'
@@ -0,0 +1,80 @@
+import gc
+
+import numpy as np
+
+import mytorch.functions as F
+from mytorch.module import Conv2D
+from mytorch.tensor import Tensor
+from mytorch.workspace import Workspace, get_workspace
+
+
+def test_acquire_release_reuses_buffers():
+    ws = Workspace(max_bytes=2 ** 20)
+    a = ws.acquire('t', (4, 4), np.float32, np)
+    b = ws.acquire('t', (4, 4), np.float32, np)
+    assert a is not b
+    ws.release(a)
+    assert ws.acquire('t', (4, 4), np.float32, np) is a
+    assert ws.acquire('t', (4, 4), np.float64, np) is not a
+    assert (ws.hits, ws.misses) == (1, 3)
+
+
+def test_lru_eviction_respects_byte_cap():
+    ws = Workspace(max_bytes=2 * 64 * 8)
+    buffers = [ws.acquire('t', (64,), np.float64, np) for _ in range(3)]
+    for buffer in buffers:
+        ws.release(buffer)
+    assert ws.cached_bytes == 2 * 64 * 8
+    assert ws.evictions == 1
+    assert ws.acquire('t', (64,), np.float64, np) is buffers[2]
+    assert ws.acquire('t', (64,), np.float64, np) is buffers[1]
+
+    ws.release(ws.acquire('big', (1000,), np.float64, np))
+    assert ws.cached_bytes == 0
+
+
+def test_release_after_owner_is_collected():
+    ws = Workspace()
+    buffer = ws.acquire('t', (8,), np.float32, np)
+    view = buffer[2:]
+    ws.release_after(view, buffer)
+    assert ws.stats()['leased'] == 1
+    del view
+    gc.collect()
+    assert ws.stats()['leased'] == 0 and ws.acquire('t', (8,), np.float32, np) is buffer
+
+
+def test_conv_reuses_padded_input_across_iterations():
+    layer = Conv2D(3, 4, (3, 3), padding=1)
+    x = np.random.randn(2, 3, 8, 8)
+    ws = get_workspace()
+
+    grads = []
+    for _ in range(3):
+        ws.reset_stats()
+        tx = Tensor(x, requires_grad=True)
+        layer.zero_grad(set_to_none=True)
+        layer(tx).sum().backward()
+        grads.append((tx.grad, layer.weight.grad))
+        gc.collect()
+    assert ws.hits >= 1 and ws.misses == 0
+    for gx, gw in grads[1:]:
+        np.testing.assert_allclose(gx, grads[0][0])
+        np.testing.assert_allclose(gw, grads[0][1])
+
+
+def test_live_graphs_do_not_share_buffers():
+    w = Tensor(np.random.randn(2, 1, 3, 3), requires_grad=True)
+    x1 = Tensor(np.random.randn(1, 1, 5, 5), requires_grad=True)
+    x2 = Tensor(np.random.randn(1, 1, 5, 5), requires_grad=True)
+    y1 = F.conv2d(x1, w, padding=1)
+    y2 = F.conv2d(x2, w, padding=1)
+    (y1.sum() + y2.sum()).backward()
+
+    expected = F.conv2d(x1, Tensor(w.data), padding=1, algorithm='gemm')
+    w1 = Tensor(w.data, requires_grad=True)
+    F.conv2d(Tensor(x1.data), w1, padding=1).sum().backward()
+    w2 = Tensor(w.data, requires_grad=True)
+    F.conv2d(Tensor(x2.data), w2, padding=1).sum().backward()
+    np.testing.assert_allclose(y1.data, expected.data)
+    np.testing.assert_allclose(w.grad, w1.grad + w2.grad)
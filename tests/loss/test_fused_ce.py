@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+import torch
+
+import mytorch.functions as F
+from mytorch.loss import CrossEntropyLoss
+from mytorch.tensor import Tensor
+
+
+@pytest.mark.parametrize("reduction", ["mean", "sum", "none"])
+@pytest.mark.parametrize("ignore_index", [-100, 2])
+def test_cross_entropy_matches_torch(reduction, ignore_index):
+    x = np.random.randn(16, 7)
+    t = np.random.randint(0, 7, (16,))
+    t[:3] = 2
+
+    mx, tx = Tensor(x, requires_grad=True), torch.tensor(x, requires_grad=True)
+    y = F.cross_entropy(mx, Tensor(t), reduction, ignore_index)
+    expected = torch.nn.functional.cross_entropy(tx, torch.tensor(t), reduction=reduction, ignore_index=ignore_index)
+    np.testing.assert_allclose(y.data, expected.detach().numpy(), rtol=1e-10, atol=1e-12)
+
+    g = np.random.randn(*y.shape)
+    y.backward(g)
+    expected.backward(torch.tensor(g))
+    np.testing.assert_allclose(mx.grad, tx.grad.numpy(), rtol=1e-6, atol=1e-9)
+    if ignore_index == 2:
+        assert not mx.grad[t == 2].any()
+
+
+def test_single_node_large_vocabulary():
+    x = Tensor(np.random.randn(8, 5000).astype(np.float32), requires_grad=True)
+    t = np.random.randint(0, 5000, (8,))
+    loss = CrossEntropyLoss()(x, Tensor(np.eye(5000, dtype=np.float32)[t]))
+    assert isinstance(loss.creator, F.CrossEntropy)
+    loss.backward()
+    assert x.grad.dtype == np.float32
+
+    expected = F.nll_loss(F.log_softmax(Tensor(x.data.astype(np.float64), requires_grad=True)), Tensor(t))
+    np.testing.assert_allclose(loss.item(), expected.item(), rtol=1e-5)
+    # 每行的梯度是 (softmax - onehot) / batch_size，和为0
+    np.testing.assert_allclose(x.grad.sum(axis=1), 0, atol=1e-6)
+    assert np.all(x.grad[np.arange(8), t] < 0)
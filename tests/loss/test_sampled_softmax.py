@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+import torch
+
+import mytorch.functions as F
+from mytorch.loss import SampledSoftmaxLoss, NegativeSamplingLoss
+from mytorch.tensor import Tensor
+
+
+def reference(fn, h, w, b, t, sampled, reduction, ignore_index=-100):
+    '''用torch在完整的类别索引矩阵上计算同样的损失'''
+    th, tw, tb = [torch.tensor(a, requires_grad=True) for a in (h, w, b)]
+    n, s = len(t), len(sampled)
+    classes = np.concatenate([np.where(t == ignore_index, 0, t)[:, None], np.broadcast_to(sampled, (n, s))], 1)
+    index = torch.tensor(classes)
+    logits = (th[:, None, :] * tw[index]).sum(-1) + tb[index]
+    valid = torch.tensor(t != ignore_index)
+    if fn is F.sampled_softmax_loss:
+        logits = logits - torch.tensor(F._log_uniform_log_q(classes, len(w), s))
+        labels = torch.where(valid, 0, ignore_index)
+        loss = torch.nn.functional.cross_entropy(logits, labels, reduction=reduction, ignore_index=ignore_index)
+    else:
+        labels = torch.zeros_like(logits)
+        labels[:, 0] = 1
+        loss = torch.nn.functional.binary_cross_entropy_with_logits(logits, labels, reduction='none').sum(1) * valid
+        loss = {'mean': loss.sum() / valid.sum(), 'sum': loss.sum(), 'none': loss}[reduction]
+    return loss, th, tw, tb
+
+
+@pytest.mark.parametrize("fn", [F.sampled_softmax_loss, F.negative_sampling_loss])
+@pytest.mark.parametrize("reduction", ["mean", "sum", "none"])
+@pytest.mark.parametrize("ignore_index", [-100, 3])
+def test_matches_torch(fn, reduction, ignore_index):
+    h, w, b = np.random.randn(12, 6), np.random.randn(40, 6), np.random.randn(40)
+    t = np.random.randint(0, 40, (12,))
+    t[:2] = 3
+    # 采样类别和真实类别不重叠，不需要去掉accidental hits
+    sampled = np.setdiff1d(np.arange(40), t)[:10]
+
+    mh, mw, mb = [Tensor(a, requires_grad=True) for a in (h, w, b)]
+    y = fn(mh, mw, mb, Tensor(t), 10, reduction, ignore_index, sampled=sampled)
+    expected, th, tw, tb = reference(fn, h, w, b, t, sampled, reduction, ignore_index)
+    np.testing.assert_allclose(y.data, expected.detach().numpy(), rtol=1e-10, atol=1e-12)
+
+    g = np.asarray(np.random.randn(*y.shape))
+    y.backward(g)
+    expected.backward(torch.tensor(g))
+    for actual, e in [(mh, th), (mw, tw), (mb, tb)]:
+        np.testing.assert_allclose(actual.grad, e.grad.numpy(), rtol=1e-8, atol=1e-10)
+    if ignore_index == 3:
+        assert not mh.grad[:2].any()
+
+
+def test_log_uniform_candidates():
+    classes = F.log_uniform_candidates(200000, 10)
+    assert classes.shape == (200000,) and classes.min() >= 0 and classes.max() <= 9
+
+    k = np.arange(10)
+    p = np.log((k + 2) / (k + 1)) / np.log(11)
+    np.testing.assert_allclose(p.sum(), 1)
+    np.testing.assert_allclose(np.bincount(classes, minlength=10) / 200000, p, atol=5e-3)
+    np.testing.assert_allclose(F._log_uniform_log_q(k, 10, 64), np.log(64 * p))
+
+
+def test_sparse_weight_grad():
+    vocab = 5000
+    h = Tensor(np.random.randn(8, 16).astype(np.float32), requires_grad=True)
+    w = Tensor(np.random.randn(vocab, 16).astype(np.float32), requires_grad=True)
+    t = np.random.randint(0, vocab, (8,))
+
+    loss = SampledSoftmaxLoss(num_sampled=32)(h, w, None, Tensor(t))
+    logits = loss.creator.inputs[0].creator
+    assert isinstance(logits, F.SampledLogits)
+    sampled = logits.saved_tensors[5]
+    loss.backward()
+    assert w.grad.dtype == np.float32
+
+    # 只有真实类别和采样类别的行有梯度
+    touched = np.zeros(vocab, dtype=bool)
+    touched[t] = True
+    touched[sampled] = True
+    assert not w.grad[~touched].any()
+    assert np.count_nonzero(w.grad.any(axis=1)) <= 8 + 32
+
+
+def test_accidental_hits_removed():
+    h, w, b = np.random.randn(4, 5), np.random.randn(20, 5), np.zeros(20)
+    t = np.array([1, 2, 3, 4])
+    sampled = np.array([2, 7, 9])
+
+    mh, mw = Tensor(h, requires_grad=True), Tensor(w, requires_grad=True)
+    F.negative_sampling_loss(mh, mw, Tensor(b), Tensor(t), 3, sampled=sampled).backward()
+    # 第1个样本的真实类别2也被采到，它只作为正样本
+    expected = Tensor(w, requires_grad=True)
+    loss = F.negative_sampling_loss(Tensor(h[[1]]), expected, Tensor(b), Tensor(t[[1]]), 2, sampled=sampled[1:])
+    loss.backward()
+
+    mw2 = Tensor(w, requires_grad=True)
+    F.negative_sampling_loss(Tensor(h[[0, 2, 3]]), mw2, Tensor(b), Tensor(t[[0, 2, 3]]), 3,
+                             sampled=sampled).backward()
+    np.testing.assert_allclose(mw.grad, (expected.grad + 3 * mw2.grad) / 4, rtol=1e-10, atol=1e-12)
+
+
+@pytest.mark.parametrize("criterion", [SampledSoftmaxLoss(num_sampled=20), NegativeSamplingLoss(num_sampled=20)])
+def test_trains_output_layer(criterion):
+    # 只用采样的类别训练输出层，完整softmax的损失应该下降，准确率远高于随机猜测(0.005)
+    np.random.seed(0)
+    rng = np.random.RandomState(0)
+    vocab, dim = 200, 8
+    x = rng.randn(256, dim)
+    target = np.argmax(x @ rng.randn(dim, vocab), axis=1)
+    w = Tensor(np.zeros((vocab, dim)), requires_grad=True)
+    b = Tensor(np.zeros(vocab), requires_grad=True)
+
+    def full_loss():
+        logits = x @ w.data.T + b.data
+        return F.cross_entropy(Tensor(logits), Tensor(target)).item(), np.mean(logits.argmax(axis=1) == target)
+
+    before, _ = full_loss()
+    for _ in range(100):
+        w.zero_grad(set_to_none=True)
+        b.zero_grad(set_to_none=True)
+        criterion(Tensor(x), w, b, Tensor(target)).backward()
+        w.data -= 0.5 * w.grad
+        b.data -= 0.5 * b.grad
+    after, accuracy = full_loss()
+    assert after < before - 1 and accuracy > 0.25
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+import torch
+
+import mytorch.functions as F
+from mytorch.module import BatchNorm2d
+from mytorch.tensor import Tensor
+
+
+def make_pair(training):
+    layer, expected = BatchNorm2d(3), torch.nn.BatchNorm2d(3).double()
+    w, b = np.random.rand(3) + 0.5, np.random.randn(3)
+    mean, var = np.random.randn(3), np.random.rand(3) + 0.5
+    layer.weight.data, layer.bias.data = w.copy(), b.copy()
+    layer.running_mean.data, layer.running_var.data = mean.copy(), var.copy()
+    with torch.no_grad():
+        for t, a in ((expected.weight, w), (expected.bias, b), (expected.running_mean, mean),
+                     (expected.running_var, var)):
+            t.copy_(torch.tensor(a))
+    return layer.train(training), expected.train(training)
+
+
+@pytest.mark.parametrize("training", [True, False])
+def test_batch_norm_matches_torch(training):
+    layer, expected = make_pair(training)
+    x = np.random.randn(4, 3, 5, 6)
+    g = np.random.randn(*x.shape)
+    mx, tx = Tensor(x, requires_grad=True), torch.tensor(x, requires_grad=True)
+
+    y, ty = layer(mx), expected(tx)
+    np.testing.assert_allclose(y.data, ty.detach().numpy(), rtol=1e-10, atol=1e-10)
+    y.backward(g)
+    ty.backward(torch.tensor(g))
+    np.testing.assert_allclose(mx.grad, tx.grad.numpy(), rtol=1e-8, atol=1e-10)
+    np.testing.assert_allclose(layer.weight.grad, expected.weight.grad.numpy(), rtol=1e-8, atol=1e-10)
+    np.testing.assert_allclose(layer.bias.grad, expected.bias.grad.numpy(), rtol=1e-8, atol=1e-10)
+    np.testing.assert_allclose(layer.running_mean.data, expected.running_mean.numpy(), rtol=1e-10, atol=1e-12)
+    np.testing.assert_allclose(layer.running_var.data, expected.running_var.numpy(), rtol=1e-10, atol=1e-12)
+
+
+def test_running_stats_updated_in_place():
+    layer = BatchNorm2d(3)
+    mean, var = layer.running_mean, layer.running_var
+    data = mean.data
+    y = layer(Tensor(np.random.randn(4, 3, 5, 5) + 2, requires_grad=True))
+
+    # 同一个buffer，没有记录计算图
+    assert layer.running_mean is mean and layer.running_var is var and mean.data is data
+    assert mean.creator is None and not mean.requires_grad
+    assert np.all(mean.data > 0.1) and layer.num_batches_tracked == 1
+    # 整个归一化只有一个节点
+    assert isinstance(y.creator, F.BatchNorm2d)
+
+
+def test_eval_per_sample_grad():
+    layer, _ = make_pair(False)
+    x = np.random.randn(3, 3, 4, 4)
+    layer(Tensor(x)).sum().backward(per_sample=True)
+    grads = [layer.weight.grad, layer.bias.grad]
+
+    for b in range(3):
+        layer.zero_grad(set_to_none=True)
+        layer(Tensor(x[b:b + 1])).sum().backward()
+        np.testing.assert_allclose(grads[0][b], layer.weight.grad, rtol=1e-10, atol=1e-12)
+        np.testing.assert_allclose(grads[1][b], layer.bias.grad, rtol=1e-10, atol=1e-12)
+
+
+def test_single_value_per_channel():
+    layer = BatchNorm2d(3)
+    x = Tensor(np.random.randn(1, 3, 1, 1))
+    with pytest.raises(ValueError, match="Expected more than 1 value per channel"):
+        layer(x)
+    # 统计量没有被更新
+    np.testing.assert_array_equal(layer.running_var.data, np.ones(3))
+    layer.eval()
+    assert layer(x).shape == (1, 3, 1, 1)
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+import torch
+
+import mytorch.functions as F
+from mytorch.fuse import fuse_modules, find_fusable_modules
+from mytorch.models.mobilenet import MobileNetV1
+from mytorch.module import Conv2D, Conv2d, Linear, BatchNorm2d, ReLU, Identity, Sequential
+from mytorch.tensor import Tensor
+
+
+def randomize_batchnorm(model):
+    '''新建的BatchNorm是恒等变换，随机设置统计量和仿射参数'''
+    for module in model.modules():
+        if isinstance(module, BatchNorm2d):
+            n = module.num_features
+            module.running_mean.data = np.random.randn(n) * 0.1
+            module.running_var.data = np.random.rand(n) + 0.5
+            module.weight.data = np.random.rand(n) + 0.5
+            module.bias.data = np.random.randn(n) * 0.1
+    return model.eval()
+
+
+def test_fuse_sequential():
+    model = randomize_batchnorm(Sequential(
+        Conv2D(3, 4, (3, 3), padding=1), BatchNorm2d(4), ReLU(),
+        Conv2d(4, 6, 3, stride=2, bias=False), BatchNorm2d(6),
+        Conv2D(6, 6, (1, 1)), ReLU(),
+    ))
+    assert find_fusable_modules(model) == [['0', '1', '2'], ['3', '4'], ['5', '6']]
+
+    x = Tensor(np.random.randn(2, 3, 9, 9))
+    fused = fuse_modules(model, example_inputs=x)
+    assert [type(m) for m in fused] == [Conv2D, Identity, Identity, Conv2d, Identity, Conv2D, Identity]
+    assert fused[0].relu and not fused[3].relu and fused[5].relu
+    np.testing.assert_allclose(fused(x).data, model(x).data, rtol=1e-5, atol=1e-5)
+
+    # 默认不修改原模型
+    assert isinstance(model[1], BatchNorm2d) and not model[0].relu and model[3].bias is None
+
+
+def test_fuse_mobilenet():
+    model = randomize_batchnorm(MobileNetV1(num_classes=10, width_multiplier=0.25))
+    x = Tensor(np.random.randn(2, 3, 32, 32).astype(np.float32))
+    expected = model(x).data
+
+    fused = fuse_modules(model, inplace=True, example_inputs=x)
+    assert fused is model
+    assert not any(isinstance(m, (BatchNorm2d, ReLU)) for m in fused.modules())
+    assert sum(isinstance(m, Conv2D) and m.relu for m in fused.modules()) == 27
+    np.testing.assert_allclose(fused(x).data, expected, rtol=1e-4, atol=1e-5)
+    # 再次融合时没有可以融合的组
+    assert find_fusable_modules(fused) == []
+
+
+def test_fused_relu_grad_matches_torch():
+    x = np.random.randn(2, 3, 7, 7)
+    w = np.random.randn(4, 3, 3, 3)
+    b = np.random.randn(4)
+    mx, mw, mb = Tensor(x, requires_grad=True), Tensor(w, requires_grad=True), Tensor(b, requires_grad=True)
+    tx, tw, tb = (torch.tensor(a, requires_grad=True) for a in (x, w, b))
+
+    y = F.conv2d(mx, mw, mb, padding=1, relu=True)
+    expected = torch.relu(torch.nn.functional.conv2d(tx, tw, tb, padding=1))
+    np.testing.assert_allclose(y.data, expected.detach().numpy(), rtol=1e-6, atol=1e-8)
+
+    g = np.random.randn(*y.shape)
+    y.backward(g)
+    expected.backward(torch.tensor(g))
+    for actual, ref in ((mx, tx), (mw, tw), (mb, tb)):
+        np.testing.assert_allclose(actual.grad, ref.grad.numpy(), rtol=1e-6, atol=1e-8)
+
+
+def test_fuse_linear_relu():
+    model = Sequential(Linear(5, 4), ReLU(), Linear(4, 3)).eval()
+    x = Tensor(np.random.randn(6, 5))
+    fused = fuse_modules(model, [['0', '1']], example_inputs=x)
+    assert fused[0].relu and isinstance(fused[1], Identity)
+
+
+def test_invalid_groups():
+    model = Sequential(Conv2D(3, 4, (3, 3)), BatchNorm2d(4), ReLU())
+    with pytest.raises(ValueError, match='eval mode'):
+        fuse_modules(model, [['0', '1']])
+
+    randomize_batchnorm(model)
+    with pytest.raises(ValueError):
+        fuse_modules(model, [['1', '2']])
+    with pytest.raises(ValueError):
+        fuse_modules(Sequential(Linear(4, 4), BatchNorm2d(4)).eval(), [['0', '1']])
+
+    # 跳过了中间的BatchNorm，融合后的结果和原模型不一致
+    x = Tensor(np.random.randn(1, 3, 5, 5))
+    with pytest.raises(AssertionError):
+        fuse_modules(model, [['0', '2']], example_inputs=x)
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+import mytorch.functions as F
+from mytorch import jit
+from mytorch.module import Module, Linear, BatchNorm2d
+from mytorch.ops import MulConstant
+from mytorch.tensor import Tensor
+
+
+class Redundant(Module):
+    def __init__(self):
+        super(Redundant, self).__init__()
+        self.fc = Linear(4, 3)
+
+    def forward(self, x):
+        # (x * 2) * 3 * 0.5 合并成一个MulConstant
+        y = x * 2 * 3 * 0.5
+        # 两次相同的mean只计算一次
+        m = x.mean(axis=0) + x.mean(axis=0)
+        # 常量子表达式
+        c = Tensor(np.ones(4, dtype=np.float32)) * 2 + 1
+        # 故意丢弃结果的分支，应该被DCE删除
+        F.relu(x) * 4
+        return self.fc(y * c + m)
+
+
+def test_passes_report_removed_nodes():
+    x = Tensor(np.random.randn(5, 4).astype(np.float32))
+    traced = jit.trace(Redundant(), x)
+    before = len(traced.graph)
+
+    report = traced.optimize()
+
+    assert report == {'constant_folding': 4, 'cse': 1, 'dce': 2}
+    assert len(traced.graph) == before - sum(report.values())
+    chain = [node for node in traced.graph.nodes if isinstance(node.kernel, MulConstant)]
+    assert len(chain) == 1 and chain[0].args[1] == 3.0
+    assert not any(isinstance(node.kernel, F.ReLU) for node in traced.graph.nodes)
+    assert traced.verify(x)
+
+
+def test_optimized_replay_matches_eager():
+    model = Redundant()
+    x = np.random.randn(5, 4).astype(np.float32)
+    traced = jit.trace(model, Tensor(x))
+    traced.optimize()
+
+    y = traced(Tensor(x))
+    y.sum().backward()
+    grad = model.fc.weight.grad.copy()
+    model.zero_grad()
+    expected = model(Tensor(x))
+    expected.sum().backward()
+
+    np.testing.assert_allclose(y.data, expected.data, rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(grad, model.fc.weight.grad, rtol=1e-5, atol=1e-5)
+
+
+def test_freeze_buffers_folds_batchnorm_statistics():
+    bn = BatchNorm2d(3)
+    x = Tensor(np.random.randn(2, 3, 4, 4).astype(np.float32))
+    bn.running_mean = Tensor(np.random.randn(3).astype(np.float32))
+    bn.eval()
+    traced = jit.trace(bn, x)
+
+    assert traced.optimize() == {'constant_folding': 0, 'cse': 0, 'dce': 0}
+    report = traced.optimize(freeze_buffers=True)
+    # BatchNorm是一个Function，running_mean和running_var变成它的常量参数，x、weight和bias仍然来自计算图
+    assert report['constant_folding'] == 0
+    node, = traced.graph.nodes
+    assert [pos for pos, _ in node.refs] == [0, 1, 2]
+    assert traced.verify(x)
+    np.testing.assert_allclose(traced(x).data, bn(x).data, rtol=1e-5, atol=1e-6)
+
+
+def test_dropout_not_merged():
+    class TwoDropouts(Module):
+        def forward(self, x):
+            return F.dropout(x, 0.5) + F.dropout(x, 0.5)
+
+    x = Tensor(np.random.randn(3, 4))
+    traced = jit.trace(TwoDropouts(), x)
+    assert traced.optimize()['cse'] == 0
+
+
+def test_verify_detects_mismatch():
+    x = Tensor(np.random.randn(5, 4).astype(np.float32))
+    traced = jit.trace(Redundant(), x)
+    graph = traced.graph.copy()
+    jit.optimize(graph)
+    node = next(node for node in graph.nodes if isinstance(node.kernel, MulConstant))
+    node.args = [None, 2.0]
+
+    with pytest.raises(AssertionError):
+        jit.verify(traced.graph, graph, [x])
+
+
+def test_unknown_pass():
+    traced = jit.trace(Redundant(), Tensor(np.random.randn(5, 4)))
+    with pytest.raises(ValueError):
+        traced.optimize(passes=['inline'])
@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+
+import mytorch.functions as F
+from mytorch import jit
+from mytorch.module import Module, Linear, BatchNorm2d
+from mytorch.tensor import Tensor, no_grad, parallel_backward
+
+
+class Net(Module):
+    def __init__(self):
+        super(Net, self).__init__()
+        self.bn = BatchNorm2d(3)
+        self.fc1 = Linear(3 * 4 * 4, 16)
+        self.fc2 = Linear(16, 5)
+
+    def forward(self, x):
+        x = F.relu(self.bn(x))
+        x = x.view(x.shape[0], -1)
+        return F.log_softmax(self.fc2(F.relu(self.fc1(x))))
+
+
+def make_pair():
+    eager = Net()
+    model = Net()
+    model.load_state_dict(eager.state_dict())
+    return eager, model
+
+
+def assert_same(eager, model):
+    for (name, p), (_, q) in zip(eager.named_parameters(), model.named_parameters()):
+        np.testing.assert_allclose(p.grad, q.grad, rtol=1e-5, atol=1e-6, err_msg=name)
+    for (name, p), (_, q) in zip(eager.named_buffers(), model.named_buffers()):
+        np.testing.assert_allclose(p.data, q.data, rtol=1e-5, atol=1e-6, err_msg=name)
+
+
+def test_trace_matches_eager():
+    eager, model = make_pair()
+    x = np.random.randn(6, 3, 4, 4).astype(np.float32)
+    traced = jit.trace(model, Tensor(x))
+    # 跟踪时执行了一次forward，更新了一次running统计量
+    eager(Tensor(x))
+
+    for _ in range(3):
+        x = np.random.randn(6, 3, 4, 4).astype(np.float32)
+        tx = Tensor(x, requires_grad=True)
+        ex = Tensor(x, requires_grad=True)
+
+        y = traced(tx)
+        expected = eager(ex)
+        np.testing.assert_allclose(y.data, expected.data, rtol=1e-5, atol=1e-6)
+
+        y.sum().backward()
+        expected.sum().backward()
+        np.testing.assert_allclose(tx.grad, ex.grad, rtol=1e-5, atol=1e-6)
+        assert_same(eager, model)
+        eager.zero_grad()
+        model.zero_grad()
+
+
+def test_retrace_on_new_shape_and_mode():
+    eager, model = make_pair()
+    traced = jit.trace(model, Tensor(np.random.randn(4, 3, 4, 4)))
+    eager(Tensor(np.random.randn(4, 3, 4, 4)))
+
+    traced(Tensor(np.random.randn(2, 3, 4, 4)))
+    traced.eval()
+    eager.eval()
+    x = np.random.randn(4, 3, 4, 4)
+    with no_grad():
+        traced(Tensor(x))
+        y = traced(Tensor(x))
+    assert len(traced._plans) == 3
+    # 评估模式使用running统计量，不更新buffer
+    np.testing.assert_allclose(y.data, model(Tensor(x)).data, rtol=1e-5, atol=1e-6)
+
+
+def test_replay_reentrant():
+    model = Net()
+    x1 = Tensor(np.random.randn(4, 3, 4, 4))
+    x2 = Tensor(np.random.randn(4, 3, 4, 4))
+    traced = jit.trace(model, x1)
+
+    # 两次forward之后再反向传播，每次调用保存自己的中间结果
+    loss = traced(x1).sum() + traced(x2).sum() * 2
+    loss.backward()
+    grads = [p.grad.copy() for p in model.parameters()]
+
+    model.zero_grad()
+    traced(x1).sum().backward()
+    (traced(x2).sum() * 2).backward()
+    for g, p in zip(grads, model.parameters()):
+        np.testing.assert_allclose(g, p.grad, rtol=1e-5, atol=1e-6)
+
+
+
+def test_concurrent_replays():
+    model = Net()
+    x1 = Tensor(np.random.randn(4, 3, 4, 4))
+    x2 = Tensor(np.random.randn(4, 3, 4, 4))
+    traced = jit.trace(model, x1)
+
+    y1, y2 = traced(x1), traced(x2)
+    # 每次回放使用自己的kernel副本，不会覆盖另一次回放保存的中间结果
+    for k1, k2 in zip(y1.creator.saved, y2.creator.saved):
+        assert k1 is not k2 and k1.saved_tensors is not k2.saved_tensors
+
+    model.zero_grad(set_to_none=True)
+    (y1.sum() + y2.sum() * 2).backward()
+    expected = [p.grad.copy() for p in model.parameters()]
+    # 两次回放的backward在并行反向传播中同时执行
+    for _ in range(5):
+        model.zero_grad(set_to_none=True)
+        with parallel_backward(2):
+            (traced(x1).sum() + traced(x2).sum() * 2).backward()
+        for g, p in zip(expected, model.parameters()):
+            np.testing.assert_allclose(g, p.grad, rtol=1e-5, atol=1e-6)
+
+
+class RawArray(Module):
+    def __init__(self):
+        super(RawArray, self).__init__()
+        self.fc = Linear(4, 4)
+
+    def forward(self, x):
+        # 直接在数组上计算，没有经过Function
+        return F.relu(Tensor(self.fc(x).data * 2, requires_grad=True))
+
+
+def test_untraceable_module():
+    with pytest.raises(RuntimeError):
+        jit.trace(RawArray(), Tensor(np.random.randn(2, 4)))
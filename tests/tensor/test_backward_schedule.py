@@ -0,0 +1,66 @@
+import numpy as np
+
+import mytorch.functions as F
+from mytorch.module import Linear, Sequential, ReLU
+from mytorch.tensor import Tensor, BackwardStats, using_config
+
+
+def _grads(model, x, y):
+    model.zero_grad(set_to_none=True)
+    loss = F.cross_entropy(model(x), y)
+    loss.backward()
+    return [p.grad.copy() for p in model.parameters()]
+
+
+def test_cached_schedule_hit():
+    model = Sequential(Linear(4, 8), ReLU(), Linear(8, 3))
+    x = Tensor(np.random.randn(5, 4))
+    y = Tensor(np.array([0, 1, 2, 1, 0]))
+
+    BackwardStats.reset()
+    expected = _grads(model, x, y)
+    assert BackwardStats.cache_misses == 1
+
+    # 相同结构的计算图会复用缓存的调度
+    for _ in range(3):
+        grads = _grads(model, x, y)
+        for g, e in zip(grads, expected):
+            assert np.allclose(g, e)
+
+    assert BackwardStats.cache_hits == 3
+    assert BackwardStats.nodes_visited > 0
+    assert BackwardStats.backward_time > 0
+
+
+def test_cached_schedule_matches_uncached():
+    model = Sequential(Linear(4, 8), ReLU(), Linear(8, 3))
+    x = Tensor(np.random.randn(5, 4))
+    y = Tensor(np.array([0, 1, 2, 1, 0]))
+
+    _grads(model, x, y)
+    cached = _grads(model, x, y)
+    with using_config('cache_schedule', False):
+        uncached = _grads(model, x, y)
+
+    for c, u in zip(cached, uncached):
+        assert np.allclose(c, u)
+
+
+def test_schedule_invalidated_on_new_graph():
+    x = Tensor(np.random.randn(3), requires_grad=True)
+
+    (x * x).sum().backward()
+    assert np.allclose(x.grad, 2 * x.data)
+
+    BackwardStats.reset()
+    # 根函数相同但结构不同的计算图，需要重新计算调度
+    x.zero_grad(set_to_none=True)
+    (x * x * x).sum().backward()
+    assert BackwardStats.cache_misses == 1
+    assert np.allclose(x.grad, 3 * x.data ** 2)
+
+
+def test_backward_on_leaf():
+    x = Tensor(2.0, requires_grad=True)
+    x.backward()
+    assert x.grad == 1.0
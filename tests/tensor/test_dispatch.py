@@ -0,0 +1,28 @@
+import numpy as np
+
+from mytorch import cuda
+from mytorch.tensor import Tensor
+
+
+def test_output_device_from_input():
+    x = Tensor(np.random.randn(3, 4), requires_grad=True)
+    y = x * 2 + x
+
+    assert y.device is x.device
+    assert isinstance(y.data, np.ndarray)
+    assert np.allclose(y.data, 3 * x.data)
+
+
+def test_scalar_output_is_array():
+    x = Tensor(np.random.randn(3, 4))
+    # sum返回的是numpy标量，会被转换为0维数组
+    y = x.sum()
+
+    assert isinstance(y.data, np.ndarray)
+    assert y.shape == ()
+    assert np.allclose(y.item(), x.data.sum())
+
+
+def test_cpu_device_cached():
+    assert cuda.get_device('cpu') is cuda.get_device(None)
+    assert cuda.get_device_from_array(np.zeros(2)) is cuda.get_device('cpu')
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+import mytorch.functions as F
+from mytorch.module import Module, Linear
+from mytorch.ops import Function
+from mytorch.tensor import Tensor, parallel_backward
+
+
+class Branches(Module):
+    '''类似SqueezeNet的Fire模块，两个分支共享输入并拼接，再加上一个残差'''
+
+    def __init__(self):
+        super(Branches, self).__init__()
+        self.squeeze = Linear(8, 6)
+        self.expand1 = Linear(6, 5)
+        self.expand2 = Linear(6, 5)
+        self.proj = Linear(10, 8)
+
+    def forward(self, x):
+        s = F.relu(self.squeeze(x))
+        y = F.cat([F.relu(self.expand1(s)), F.tanh(self.expand2(s))], axis=1)
+        return (self.proj(y) + x).sum()
+
+
+def grads(model, x, workers, **kwargs):
+    model.zero_grad(set_to_none=True)
+    tx = Tensor(x, requires_grad=True)
+    with parallel_backward(workers):
+        model(tx).backward(**kwargs)
+    return [tx.grad] + [p.grad for p in model.parameters()]
+
+
+def test_parallel_matches_serial():
+    model = Branches()
+    x = np.random.randn(4, 8)
+    expected = grads(model, x, 0)
+    for workers in (2, 4):
+        for _ in range(3):
+            for g, e in zip(grads(model, x, workers), expected):
+                np.testing.assert_allclose(g, e, rtol=1e-5, atol=1e-6)
+
+
+def test_parallel_retain_graph():
+    model = Branches()
+    x = Tensor(np.random.randn(4, 8), requires_grad=True)
+    loss = model(x)
+    with parallel_backward(2):
+        loss.backward(retain_graph=True)
+        first = x.grad.copy()
+        loss.backward()
+    np.testing.assert_allclose(x.grad, first * 2, rtol=1e-5)
+
+
+class Broken(Function):
+    __slots__ = ()
+
+    def forward(self, x):
+        return x * 1
+
+    def backward(self, grad):
+        raise ValueError("broken backward")
+
+
+def test_parallel_propagates_errors():
+    x = Tensor(np.random.randn(3), requires_grad=True)
+    y = (Broken()(x) + x * 2).sum()
+    with parallel_backward(2), pytest.raises(ValueError):
+        y.backward()
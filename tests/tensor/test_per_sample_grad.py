@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+import mytorch.functions as F
+from mytorch.module import Module, Linear
+from mytorch.paramater import Parameter
+from mytorch.tensor import Tensor
+
+
+class Net(Module):
+    def __init__(self):
+        super(Net, self).__init__()
+        self.embed = Parameter(Tensor(np.random.randn(10, 4)))
+        self.fc1 = Linear(4, 6)
+        self.scale = Parameter(Tensor(np.random.randn(6)))
+        self.fc2 = Linear(6, 3)
+
+    def forward(self, tokens):
+        x = F.embedding(self.embed, tokens).sum(axis=1)  # (B, 4)
+        x = F.relu(self.fc1(x)) * self.scale.exp() - 0.5
+        return self.fc2(x / 2)
+
+
+def per_sample_loss(out):
+    return (out * out).sum()
+
+
+def loop_grads(model, tokens):
+    grads = []
+    for b in range(tokens.shape[0]):
+        model.zero_grad(set_to_none=True)
+        per_sample_loss(model(Tensor(tokens[b:b + 1]))).backward()
+        grads.append([p.grad.copy() for p in model.parameters()])
+    return [np.stack(g) for g in zip(*grads)]
+
+
+def test_per_sample_matches_loop():
+    model = Net()
+    tokens = np.random.randint(0, 10, size=(5, 3))
+    expected = loop_grads(model, tokens)
+
+    model.zero_grad(set_to_none=True)
+    per_sample_loss(model(Tensor(tokens))).backward(per_sample=True)
+
+    for (name, p), e in zip(model.named_parameters(), expected):
+        assert p.grad.shape == (5,) + p.shape, name
+        np.testing.assert_allclose(p.grad, e, rtol=1e-4, atol=1e-5, err_msg=name)
+
+
+def test_per_sample_sums_to_batch_grad():
+    model = Linear(4, 3)
+    x = np.random.randn(8, 2, 4).astype(np.float32)
+
+    model.zero_grad(set_to_none=True)
+    model(Tensor(x)).mean().backward(per_sample=True)
+    per_sample = [p.grad for p in model.parameters()]
+
+    model.zero_grad(set_to_none=True)
+    model(Tensor(x)).mean().backward()
+    for g, p in zip(per_sample, model.parameters()):
+        np.testing.assert_allclose(g.sum(axis=0), p.grad, rtol=1e-4, atol=1e-5)
+
+
+def test_per_sample_needs_cleared_grad():
+    model = Linear(4, 3)
+    x = Tensor(np.random.randn(2, 4))
+    model(x).sum().backward()
+    with pytest.raises(AssertionError):
+        model(x).sum().backward(per_sample=True)
@@ -0,0 +1,42 @@
+import numpy as np
+
+import mytorch.functions as F
+from mytorch.module import Linear, Sequential, ReLU
+from mytorch.tensor import Tensor, BackwardStats, no_grad
+
+
+def test_no_graph_without_requires_grad():
+    x = Tensor(np.random.randn(3, 4))
+    y = F.relu(x * 2 + 1)
+
+    assert not y.requires_grad
+    assert y.creator is None
+
+
+def test_no_graph_in_no_grad():
+    x = Tensor(np.random.randn(3, 4), requires_grad=True)
+    with no_grad():
+        y = x * 2
+
+    assert not y.requires_grad
+    assert y.creator is None
+
+
+def test_frozen_backbone_pruned():
+    backbone = Sequential(Linear(4, 8), ReLU(), Linear(8, 8), ReLU())
+    head = Linear(8, 3)
+    backbone.freeze_parameters()
+
+    x = Tensor(np.random.randn(5, 4))
+    feature = backbone(x)
+    # 冻结的子图不会记录计算图
+    assert feature.creator is None
+
+    BackwardStats.reset()
+    head(feature).sum().backward()
+
+    # 只有 matmul, transpose, add 和 sum 四个节点
+    assert BackwardStats.nodes_visited == 4
+    assert head.weight.grad is not None
+    assert all(p.grad is None for p in backbone.parameters())
+    assert feature.grad is None
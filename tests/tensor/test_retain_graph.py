@@ -0,0 +1,71 @@
+import gc
+import weakref
+
+import numpy as np
+import pytest
+
+import mytorch.functions as F
+from mytorch.tensor import Tensor
+
+
+def test_release_graph():
+    x = Tensor(np.random.randn(3, 4), requires_grad=True)
+    y = x * 2
+    z = F.relu(y).sum()
+    ref = weakref.ref(y)
+    creator = z.creator
+    del y
+
+    z.backward()
+    gc.collect()
+
+    # 计算图被释放，中间结果不再被引用
+    assert ref() is None
+    assert z.creator is None
+    assert creator.inputs is None
+    assert creator.saved_tensors == []
+    assert np.allclose(x.grad, 2 * (x.data > 0))
+
+
+def test_retain_graph():
+    x = Tensor(np.random.randn(3, 4), requires_grad=True)
+    z = (x * x).sum()
+
+    z.backward(retain_graph=True)
+    assert z.creator is not None
+
+    # 保留了计算图，可以再次反向传播，梯度会累加
+    z.backward()
+    assert np.allclose(x.grad, 4 * x.data)
+    assert z.creator is None
+
+
+def test_backward_twice_raises():
+    x = Tensor(np.random.randn(3, 4), requires_grad=True)
+    z = (x * x).sum()
+    z.backward()
+
+    with pytest.raises(RuntimeError, match="retain_graph=True"):
+        z.backward()
+    np.testing.assert_allclose(x.grad, 2 * x.data)
+
+
+def test_shared_subgraph_released():
+    p = Tensor(np.ones(3), requires_grad=True)
+    h = p * 3
+    l1 = h.sum()
+    l2 = (h * 2).sum()
+    l1.backward()
+
+    # h的creator已经被l1的反向传播释放，不能悄悄地只算一部分梯度
+    with pytest.raises(RuntimeError, match="retain_graph=True"):
+        l2.backward()
+    np.testing.assert_allclose(p.grad, 3)
+
+    p.zero_grad(set_to_none=True)
+    h = p * 3
+    l1 = h.sum()
+    l2 = (h * 2).sum()
+    l1.backward(retain_graph=True)
+    l2.backward()
+    np.testing.assert_allclose(p.grad, 9)
@@ -0,0 +1,37 @@
+import pickle
+import weakref
+
+import numpy as np
+
+from mytorch.module import Linear
+from mytorch.ops import Add, Function
+from mytorch.paramater import Parameter
+from mytorch.tensor import Tensor
+
+
+def test_tensor_slots():
+    x = Tensor(np.random.randn(2, 3), requires_grad=True)
+    assert not hasattr(x, '__dict__')
+    # Function通过弱引用保存输出
+    assert weakref.ref(x)() is x
+
+    p = Parameter(np.ones(3))
+    assert not hasattr(p, '__dict__')
+    assert isinstance(p, Tensor)
+
+
+def test_function_slots():
+    assert not hasattr(Add(), '__dict__')
+    assert '__dict__' not in Function.__dict__
+
+
+def test_pickle_parameter():
+    model = Linear(3, 2)
+    model(Tensor(np.random.randn(4, 3))).sum().backward()
+
+    weight = pickle.loads(pickle.dumps(model.weight))
+
+    assert isinstance(weight, Parameter)
+    assert weight.requires_grad
+    assert np.allclose(weight.data, model.weight.data)
+    assert np.allclose(weight.grad, model.weight.grad)
@@ -0,0 +1,113 @@
+import numpy as np
+
+import mytorch.functions as F
+from mytorch.module import Linear
+from mytorch.ops import Function
+from mytorch.optim import SGD
+from mytorch.paramater import Parameter
+from mytorch.tensor import Tensor
+
+
+def test_lazy_grad():
+    x = Tensor(np.random.randn(4, 3), requires_grad=True)
+    # 梯度延迟分配，创建时不会分配全0梯度
+    assert x.grad is None
+
+    y = F.relu(x * 2)
+    # 中间结果也不会分配梯度
+    assert y.grad is None
+
+    y.sum().backward()
+    assert np.allclose(x.grad, 2 * (x.data > 0))
+
+
+def test_zero_grad_set_to_none():
+    model = Linear(3, 2)
+    assert model.weight.grad is None
+
+    model(Tensor(np.random.randn(5, 3))).sum().backward()
+    assert model.weight.grad is not None
+
+    model.zero_grad()
+    assert np.allclose(model.weight.grad, 0)
+
+    model.zero_grad(set_to_none=True)
+    assert model.weight.grad is None
+    assert model.bias.grad is None
+
+
+def test_optimizer_zero_grad_set_to_none():
+    model = Linear(3, 2)
+    optimizer = SGD(model.parameters(), lr=0.1)
+
+    model(Tensor(np.random.randn(5, 3))).sum().backward()
+    optimizer.step()
+    optimizer.zero_grad(set_to_none=True)
+
+    for p in model.parameters():
+        assert p.grad is None
+
+    # 梯度为None的参数不会被更新
+    weight = model.weight.data.copy()
+    optimizer.step()
+    assert np.allclose(weight, model.weight.data)
+
+
+def test_first_grad_is_writable():
+    # sum的反向传播得到只读的广播视图，第一次累加时需要复制，否则优化器不能原地更新
+    p = Tensor(np.ones(3), requires_grad=True)
+    p.sum().backward()
+    assert p.grad.flags.writeable and p.grad.base is None
+
+    SGD([p], lr=0.1, weight_decay=0.1).step()
+    np.testing.assert_allclose(p.data, 0.89)
+
+
+def test_grads_not_shared_between_inputs():
+    # Add把同一个梯度传给两个输入，它们的grad不能是同一个数组
+    a = Tensor(np.ones(3), requires_grad=True)
+    b = Tensor(np.ones(3), requires_grad=True)
+    ((a + b) * 2).sum().backward()
+    assert a.grad is not b.grad
+
+    a.grad[:] *= 10
+    np.testing.assert_allclose(a.grad, 20)
+    np.testing.assert_allclose(b.grad, 2)
+
+
+def test_inplace_scaling_with_shared_grad():
+    # 和utils.grad_clipping一样原地缩放每个参数的梯度，每个参数只被缩放一次
+    a, b = Parameter(Tensor(np.ones(4))), Parameter(Tensor(np.ones(4)))
+    (a + b).sum().backward()
+    for p in (a, b):
+        p.grad[:] *= 0.5
+    np.testing.assert_allclose(a.grad, 0.5)
+    np.testing.assert_allclose(b.grad, 0.5)
+
+
+class Passthrough(Function):
+    __slots__ = ()
+    received = []
+
+    def forward(self, x):
+        return x.copy()
+
+    def backward(self, grad):
+        Passthrough.received.append(grad)
+        return grad
+
+
+def test_intermediate_grad_not_copied():
+    # 中间结果的梯度用完就释放，直接引用上游的梯度；叶子和retain_grad的中间结果才复制
+    Passthrough.received = []
+    x = Tensor(np.ones(3), requires_grad=True)
+    Passthrough()(Passthrough()(x)).sum().backward()
+    outer, inner = Passthrough.received
+    assert inner is outer
+    assert x.grad is not inner
+    np.testing.assert_allclose(x.grad, 1)
+
+    y = Passthrough()(x)
+    z = Passthrough()(y)
+    z.sum().backward(retain_grad=True)
+    assert y.grad is not z.grad and y.grad.flags.writeable